@@ -0,0 +1,134 @@
+import asyncio
+import time
+from collections import deque
+from typing import Callable, List, Sequence
+
+from review_analyzer.metrics import REGISTRY, SIZE_BUCKETS
+
+QUEUE_WAIT_SECONDS = REGISTRY.histogram("queue_wait_seconds", "Espera en cola antes del forward")
+MICROBATCH_SIZE = REGISTRY.histogram("microbatch_size", "Textos por micro-batch", SIZE_BUCKETS)
+
+
+class MicroBatcher:
+    """
+    Agrupa peticiones concurrentes en micro-batches antes de llamar al modelo.
+
+    Cada petición entra a una cola compartida; un único worker junta peticiones
+    hasta `max_batch_size` textos o hasta `max_wait_ms` desde la primera, ejecuta
+    `process_fn` una sola vez (en un hilo aparte) y devuelve a cada llamador
+    su porción del resultado.
+
+    - process_fn: función que recibe una lista de textos y devuelve una secuencia
+      alineada (una fila por texto).
+    - max_batch_size: máximo de textos por llamada al modelo.
+    - max_wait_ms: tiempo máximo de espera para completar un batch.
+    - max_queue_size: peticiones en cola antes de aplicar backpressure.
+    """
+
+    def __init__(self, process_fn: Callable[[List[str]], Sequence],
+                 max_batch_size: int = 32, max_wait_ms: float = 10.0,
+                 max_queue_size: int = 1024):
+        self.process_fn = process_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.max_queue_size = max_queue_size
+        self._queue = None
+        self._worker = None
+        self._pending_texts = 0
+
+        # Métricas
+        self.batches_total = 0
+        self.items_total = 0
+        self.last_batch_size = 0
+        self.max_queue_depth = 0
+        self._recent_sizes = deque(maxlen=100)
+
+    async def start(self) -> None:
+        if self._worker is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def submit(self, texts: List[str]) -> Sequence:
+        """Encola los textos y espera sus resultados (en el mismo orden)."""
+        if self._worker is None:
+            await self.start()
+        future = asyncio.get_running_loop().create_future()
+        self._pending_texts += len(texts)
+        await self._queue.put((texts, future, time.perf_counter()))
+        self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        return await future
+
+    async def _collect(self) -> list:
+        """Junta peticiones hasta llenar el batch o agotar el tiempo de espera."""
+        first = await self._queue.get()
+        items = [first]
+        size = len(first[0])
+        deadline = time.monotonic() + self.max_wait
+
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            items.append(item)
+            size += len(item[0])
+        return items
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            items = await self._collect()
+            texts = [text for item_texts, _, _ in items for text in item_texts]
+            self._pending_texts -= len(texts)
+
+            now = time.perf_counter()
+            for _, _, enqueued_at in items:
+                QUEUE_WAIT_SECONDS.observe(now - enqueued_at)
+            MICROBATCH_SIZE.observe(len(texts))
+
+            self.batches_total += 1
+            self.items_total += len(texts)
+            self.last_batch_size = len(texts)
+            self._recent_sizes.append(len(texts))
+
+            try:
+                outputs = await loop.run_in_executor(None, self.process_fn, texts)
+            except Exception as e:
+                for _, future, _ in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            start = 0
+            for item_texts, future, _ in items:
+                end = start + len(item_texts)
+                if not future.done():
+                    future.set_result(outputs[start:end])
+                start = end
+
+    def stats(self) -> dict:
+        """Métricas del scheduler: tamaño de batch y profundidad de la cola."""
+        recent = list(self._recent_sizes)
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "pending_texts": self._pending_texts,
+            "max_queue_depth": self.max_queue_depth,
+            "batches_total": self.batches_total,
+            "items_total": self.items_total,
+            "last_batch_size": self.last_batch_size,
+            "avg_batch_size": round(sum(recent) / len(recent), 2) if recent else 0.0,
+        }
@@ -0,0 +1,160 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    """Normaliza un comentario para usarlo como clave (Unicode NFC y espacios compactados)."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class ResultCache:
+    """
+    Caché LRU/TTL de probabilidades por texto, direccionada por contenido.
+
+    La clave es un hash del texto normalizado y la revisión del modelo, de modo que
+    un cambio de modelo invalida automáticamente las entradas anteriores.
+
+    - revision: identificador de la revisión del modelo.
+    - max_items: máximo de entradas en memoria (0 desactiva la caché).
+    - ttl_seconds: segundos de vigencia de una entrada (0 = sin expiración).
+    - sqlite_path: ruta opcional de una base SQLite que persiste entre reinicios.
+    """
+
+    def __init__(self, revision: str, max_items: int = 50000, ttl_seconds: float = 0,
+                 sqlite_path: Optional[str] = None):
+        self.revision = revision
+        self.max_items = max_items
+        self.ttl = ttl_seconds
+        self.sqlite_path = sqlite_path if max_items > 0 else None
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+    @property
+    def _db(self):
+        """Conexión SQLite del proceso actual (se reabre tras un fork)."""
+        if not self.sqlite_path:
+            return None
+        if self._conn is None or self._conn_pid != os.getpid():
+            self._conn = sqlite3.connect(self.sqlite_path, check_same_thread=False)
+            self._conn_pid = os.getpid()
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, probs BLOB NOT NULL, created_at REAL NOT NULL)"
+            )
+            if self.ttl:
+                self._conn.execute("DELETE FROM results WHERE created_at < ?", (time.time() - self.ttl,))
+            self._conn.commit()
+        return self._conn
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_items > 0
+
+    def key(self, text: str, variant: Optional[str] = None) -> str:
+        """Clave del texto; `variant` separa resultados del mismo texto con otro modo (p. ej. long_text)."""
+        prefix = f"{self.revision}\x00{variant}" if variant else self.revision
+        payload = f"{prefix}\x00{normalize_text(text)}".encode("utf-8")
+        return hashlib.sha1(payload).hexdigest()
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return bool(self.ttl) and now - created_at > self.ttl
+
+    def _remember(self, key: str, row: np.ndarray, created_at: float) -> None:
+        self._memory[key] = (created_at, row)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def _read_disk(self, keys: List[str]) -> dict:
+        found = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self._db.execute(
+                f"SELECT key, probs, created_at FROM results WHERE key IN ({placeholders})", chunk
+            )
+            for key, blob, created_at in rows:
+                found[key] = (created_at, np.frombuffer(blob, dtype=np.float32))
+        return found
+
+    def get_many(self, keys: List[str]) -> List[Optional[np.ndarray]]:
+        """Devuelve la fila de probabilidades de cada clave, o None si no está en caché."""
+        if not self.enabled:
+            self.misses += len(keys)
+            return [None] * len(keys)
+
+        now = time.time()
+        rows = [None] * len(keys)
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                entry = self._memory.get(key)
+                if entry is not None and not self._expired(entry[0], now):
+                    self._memory.move_to_end(key)
+                    rows[i] = entry[1]
+                else:
+                    missing.append(i)
+
+            if missing and self.sqlite_path:
+                found = self._read_disk(list({keys[i] for i in missing}))
+                still_missing = []
+                for i in missing:
+                    entry = found.get(keys[i])
+                    if entry is not None and not self._expired(entry[0], now):
+                        self._remember(keys[i], entry[1], entry[0])
+                        rows[i] = entry[1]
+                        self.disk_hits += 1
+                    else:
+                        still_missing.append(i)
+                missing = still_missing
+
+        self.misses += len(missing)
+        self.hits += len(keys) - len(missing)
+        return rows
+
+    def put_many(self, keys: List[str], rows) -> None:
+        """Guarda las filas de probabilidades calculadas para cada clave."""
+        if not self.enabled:
+            return
+        now = time.time()
+        # Copia por fila: una vista mantendría viva la matriz completa del batch
+        rows = [np.array(row, dtype=np.float32) for row in rows]
+        with self._lock:
+            for key, row in zip(keys, rows):
+                self._remember(key, row, now)
+            if self.sqlite_path:
+                db = self._db
+                db.executemany(
+                    "INSERT OR REPLACE INTO results (key, probs, created_at) VALUES (?, ?, ?)",
+                    [(key, row.tobytes(), now) for key, row in zip(keys, rows)],
+                )
+                db.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "persistent": bool(self.sqlite_path),
+            "revision": self.revision,
+            "size": len(self._memory),
+            "max_items": self.max_items,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
@@ -1,12 +1,50 @@
+import time
+
+_IMPORT_START = time.perf_counter()
+
 import os
-from fastapi import FastAPI
-from pydantic import BaseModel
-from typing import List
-from transformers import AutoTokenizer, BertForSequenceClassification
+import json
+import asyncio
+import functools
+import hashlib
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Path as PathParam, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, confloat, conint
+from typing import Dict, List, Literal, Optional, Union
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
-import torch
-from torch.nn.functional import sigmoid
+import numpy as np
+
+from api.batching import MicroBatcher
+from api.cache import ResultCache
+from api.posts import PostStore, Rescorer
+from api.reports import load_report
+from api.summary import EmotionSummary, iter_dataset, resolve_dataset, to_datetimes
+from review_analyzer.modeling.inference import (
+    LABEL_TRANSLATIONS as label_translations,
+    WINDOW_POOLING,
+    compact_results,
+    format_results,
+    predict_probs as bucketed_predict_probs,
+    select_labels,
+    uncertain_rows,
+)
+from review_analyzer.modeling.thresholds import load_thresholds
+from review_analyzer.metrics import REGISTRY
+from review_analyzer.config import (
+    ANALYTICS_DIR,
+    API_MODEL,
+    DATA_DIR,
+    FEELTRACK_MODEL,
+    POSTS_DB_PATH,
+    STUDENT_MODEL_DIR,
+    THRESHOLDS_PATH,
+    TIKTOK_STORE_DIR,
+)
+
+# Tiempos de arranque (segundos) para detectar regresiones en cold start
+startup_timings = {"app_imports_s": round(time.perf_counter() - _IMPORT_START, 3)}
 
 # Cargar variables de entorno
 load_dotenv()
@@ -14,7 +52,240 @@ load_dotenv()
 # Leer orígenes permitidos desde .env
 origins = os.getenv("ALLOWED_ORIGINS", "").split(",")
 
-app = FastAPI()
+# Micro-batching: peticiones concurrentes comparten una misma pasada del modelo
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "32"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "10"))
+BATCH_MAX_QUEUE = int(os.getenv("BATCH_MAX_QUEUE", "1024"))
+
+# Longitud máxima en tokens y presupuesto de tokens (con padding) por sub-batch
+MODEL_MAX_LENGTH = int(os.getenv("MODEL_MAX_LENGTH", "512"))
+MAX_BATCH_TOKENS = int(os.getenv("MAX_BATCH_TOKENS", "8192"))
+
+# Caché de resultados por texto normalizado (opcionalmente persistida en SQLite)
+CACHE_MAX_ITEMS = int(os.getenv("CACHE_MAX_ITEMS", "50000"))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "0"))
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH", "")
+
+# Resultados por publicación (SQLite; vacío desactiva las rutas /posts) y re-score en
+# segundo plano tras un cambio de revisión, limitado a RESCORE_TEXTS_PER_SECOND (0 = apagado)
+POSTS_SQLITE_PATH = os.getenv("POSTS_SQLITE_PATH", str(POSTS_DB_PATH))
+RESCORE_TEXTS_PER_SECOND = float(os.getenv("RESCORE_TEXTS_PER_SECOND", "10"))
+RESCORE_BATCH_SIZE = int(os.getenv("RESCORE_BATCH_SIZE", "32"))
+# Carpeta del CommentStore del extractor de TikTok (una subcarpeta por video)
+COMMENT_STORE_DIR = os.getenv("COMMENT_STORE_DIR", str(TIKTOK_STORE_DIR))
+
+# Textos largos (opt-in por petición con long_text="max"|"mean"): ventanas de MODEL_MAX_LENGTH
+# tokens solapadas en LONG_TEXT_STRIDE (vacío = un cuarto de la ventana), hasta
+# LONG_TEXT_MAX_WINDOWS por texto
+LONG_TEXT_STRIDE = int(os.getenv("LONG_TEXT_STRIDE") or 0) or None
+LONG_TEXT_MAX_WINDOWS = int(os.getenv("LONG_TEXT_MAX_WINDOWS", "16"))
+
+# Streaming NDJSON: comentarios clasificados por bloque
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", "64"))
+# Bytes máximos por línea NDJSON: una línea más larga se descarta y responde un error
+STREAM_MAX_LINE_BYTES = int(os.getenv("STREAM_MAX_LINE_BYTES", str(1024 * 1024)))
+
+# Resúmenes agregados (/classify/summary): textos por bloque y límite de periodos distintos
+SUMMARY_CHUNK_SIZE = int(os.getenv("SUMMARY_CHUNK_SIZE", "1024"))
+SUMMARY_MAX_PERIODS = int(os.getenv("SUMMARY_MAX_PERIODS", "1000"))
+
+# Modelo: copia local (python -m api.snapshot) si existe; si no, Hugging Face Hub
+MODEL_PATH = os.getenv("MODEL_PATH") or (
+    str(API_MODEL) if (API_MODEL / "config.json").exists() else FEELTRACK_MODEL
+)
+
+# Backend de inferencia: "torch" (fp32), "torch-int8" (cuantizado) u "onnx"
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")
+
+# Modelo destilado (python -m review_analyzer.modeling.distill train). Modos de servicio:
+# "teacher" (solo MODEL_PATH), "student" (solo el estudiante) o "cascade" (el estudiante
+# responde y los textos con alguna etiqueta a menos de ROUTE_MARGIN del umbral van al maestro)
+SERVING_MODE = os.getenv("SERVING_MODE", "teacher")
+STUDENT_MODEL_PATH = os.getenv("STUDENT_MODEL_PATH", str(STUDENT_MODEL_DIR))
+STUDENT_ONNX_DIR = os.getenv("STUDENT_ONNX_DIR", str(STUDENT_MODEL_DIR / "onnx"))
+ROUTE_MARGIN = float(os.getenv("ROUTE_MARGIN", "0.15"))
+if SERVING_MODE not in ("teacher", "student", "cascade"):
+    raise ValueError(f"SERVING_MODE inválido: {SERVING_MODE!r} (teacher, student o cascade)")
+
+# Umbrales calibrados por etiqueta (artefacto opcional); 0.5 si no existe
+THRESHOLDS_FILE = os.getenv("THRESHOLDS_PATH", str(THRESHOLDS_PATH))
+
+TRAINING_DISTRIBUTION = {
+    "neutral": 31446,
+    "approval": 13235,
+    "annoyance": 10024,
+    "admiration": 9912,
+    "disapproval": 8399,
+    "realization": 7248,
+    "disappointment": 6656,
+    "curiosity": 6203,
+    "optimism": 6199,
+    "joy": 5688,
+    "anger": 5644,
+    "confusion": 5311,
+    "gratitude": 5288,
+    "amusement": 5180,
+    "sadness": 4667,
+    "love": 4347,
+    "excitement": 4335,
+    "caring": 4330,
+    "disgust": 4053,
+    "surprise": 3823,
+    "desire": 2838,
+    "fear": 2136,
+    "embarrassment": 2003,
+    "remorse": 1663,
+    "nervousness": 1556,
+    "pride": 1127,
+    "relief": 1085,
+    "grief": 558
+}
+
+# Métricas por etapa (formato Prometheus en /metrics)
+POSTPROCESS_SECONDS = REGISTRY.histogram("postprocess_seconds", "Umbrales y armado de la respuesta")
+SERIALIZE_SECONDS = REGISTRY.histogram("serialize_seconds", "Serialización JSON de la respuesta")
+TEXTS_CLASSIFIED = REGISTRY.counter("texts_classified_total", "Textos clasificados")
+LABEL_PREDICTIONS = REGISTRY.counter(
+    "label_predictions_total", "Predicciones por etiqueta (comparar con training_examples para drift)"
+)
+TRAINING_EXAMPLES = REGISTRY.gauge("training_examples", "Ejemplos por etiqueta en el entrenamiento")
+for _label, _count in TRAINING_DISTRIBUTION.items():
+    TRAINING_EXAMPLES.set(_count, label=_label)
+CASCADE_TEXTS = REGISTRY.counter("cascade_texts_total", "Textos respondidos por el estudiante en modo cascada")
+CASCADE_ROUTED = REGISTRY.counter("cascade_routed_total", "Textos inciertos reenviados al maestro en modo cascada")
+
+# Estado del modelo: se completa en load_model() (lifespan o api.serve antes del fork)
+backend = None
+tokenizer = None
+student_backend = None
+student_tokenizer = None
+model_config = None
+MODEL_REVISION = None
+emotion_labels = []
+translated_emotion_labels = []
+label_index = {}
+default_thresholds = None
+cache = None
+posts = None
+rescorer = None
+rescore_task = None
+model_ready = False
+startup_error = None
+
+
+def load_model():
+    """Carga backend, tokenizer, etiquetas, umbrales y caché (solo la primera vez)."""
+    global backend, tokenizer, model_config, MODEL_REVISION, emotion_labels
+    global translated_emotion_labels, label_index, default_thresholds, cache
+    global student_backend, student_tokenizer, posts
+    if backend is not None:
+        return
+
+    start = time.perf_counter()
+    from transformers import AutoTokenizer
+    from review_analyzer.modeling.backends import load_backend
+    startup_timings["model_imports_s"] = round(time.perf_counter() - start, 3)
+
+    if SERVING_MODE != "student":
+        start = time.perf_counter()
+        loaded_backend = load_backend(INFERENCE_BACKEND, MODEL_PATH)
+        startup_timings["weights_load_s"] = round(time.perf_counter() - start, 3)
+
+        start = time.perf_counter()
+        tokenizer = AutoTokenizer.from_pretrained(MODEL_PATH)
+        startup_timings["tokenizer_load_s"] = round(time.perf_counter() - start, 3)
+
+    if SERVING_MODE != "teacher":
+        start = time.perf_counter()
+        student = load_backend(INFERENCE_BACKEND, STUDENT_MODEL_PATH, STUDENT_ONNX_DIR)
+        student_tokenizer = AutoTokenizer.from_pretrained(STUDENT_MODEL_PATH)
+        startup_timings["student_load_s"] = round(time.perf_counter() - start, 3)
+        if SERVING_MODE == "student":
+            # El estudiante es el modelo principal; no hay maestro al que enrutar
+            loaded_backend, tokenizer = student, student_tokenizer
+            student_tokenizer = None
+        else:
+            if student.config.id2label != loaded_backend.config.id2label:
+                raise ValueError("El estudiante y el maestro no tienen las mismas etiquetas.")
+            student_backend = student
+
+    model_config = loaded_backend.config
+
+    # Revisión del modelo (backend y modo de servicio): forma parte de la clave de caché
+    model_path = STUDENT_MODEL_PATH if SERVING_MODE == "student" else MODEL_PATH
+    MODEL_REVISION = os.getenv("MODEL_REVISION") or getattr(model_config, "_commit_hash", None) or model_path
+    if student_backend is not None:
+        student_revision = getattr(student_backend.config, "_commit_hash", None) or STUDENT_MODEL_PATH
+        MODEL_REVISION = f"{MODEL_REVISION}+{student_revision}@{ROUTE_MARGIN}"
+
+    emotion_labels = [model_config.id2label[i] for i in range(model_config.num_labels)]
+    translated_emotion_labels = [label_translations.get(label, label) for label in emotion_labels]
+    label_index = {label: j for j, label in enumerate(emotion_labels)}
+
+    if os.path.exists(THRESHOLDS_FILE):
+        default_thresholds = load_thresholds(THRESHOLDS_FILE, emotion_labels)
+    else:
+        default_thresholds = np.full(len(emotion_labels), 0.5, dtype=np.float32)
+
+    # La longitud máxima cambia el truncado y por tanto las probabilidades guardadas
+    cache = ResultCache(
+        f"{MODEL_REVISION}:{INFERENCE_BACKEND}:{SERVING_MODE}:len={MODEL_MAX_LENGTH}",
+        max_items=CACHE_MAX_ITEMS,
+        ttl_seconds=CACHE_TTL_SECONDS,
+        sqlite_path=CACHE_SQLITE_PATH or None,
+    )
+    if POSTS_SQLITE_PATH:
+        # Los umbrales cambian las etiquetas guardadas: forman parte de la revisión del store
+        thresholds_digest = hashlib.sha1(default_thresholds.tobytes()).hexdigest()[:8]
+        posts = PostStore(POSTS_SQLITE_PATH, f"{cache.revision}:{thresholds_digest}",
+                          emotion_labels, translated_emotion_labels)
+    backend = loaded_backend
+
+
+def warm_up():
+    """Primera pasada forward para no cobrarla en la primera petición real."""
+    start = time.perf_counter()
+    predict_probs(["Me encanta este producto 😍"])
+    startup_timings["first_inference_s"] = round(time.perf_counter() - start, 3)
+
+
+async def prepare_model():
+    global model_ready, startup_error, rescorer, rescore_task
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(None, load_model)
+        await loop.run_in_executor(None, warm_up)
+    except Exception as e:
+        startup_error = str(e)
+        print(f"Error cargando el modelo: {startup_error}")
+        return
+    startup_timings["total_s"] = round(time.perf_counter() - _IMPORT_START, 3)
+    model_ready = True
+    if posts is not None:
+        rescorer = Rescorer(posts, classify_with_defaults, RESCORE_TEXTS_PER_SECOND, RESCORE_BATCH_SIZE)
+        rescore_task = asyncio.create_task(rescorer.run())
+    print(f"Modelo listo ({MODEL_PATH}, backend={INFERENCE_BACKEND}, modo={SERVING_MODE}): {startup_timings}")
+
+
+def not_ready_response():
+    return JSONResponse(status_code=503, content={"error": startup_error or "El modelo se está cargando"})
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await batcher.start()
+    # La carga corre en segundo plano: "/" responde de inmediato y "/ready" indica cuándo hay modelo
+    loading = asyncio.create_task(prepare_model())
+    yield
+    loading.cancel()
+    if rescore_task is not None:
+        rescore_task.cancel()
+    await batcher.stop()
+    for long_text_batcher in long_text_batchers.values():
+        await long_text_batcher.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -24,102 +295,542 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Cargar modelo desde Hugging Face Hub
-MODEL_PATH = "ZAMORAPJ/feeltrack-model"
-model = BertForSequenceClassification.from_pretrained(MODEL_PATH)
-tokenizer = AutoTokenizer.from_pretrained(MODEL_PATH)
-model.eval()
-
-emotion_labels = [model.config.id2label[i] for i in range(model.config.num_labels)]
-
-label_translations = {
-    "admiration": "admiración", "amusement": "diversión", "anger": "ira", "annoyance": "molestia",
-    "approval": "aprobación", "caring": "cuidado", "confusion": "confusión", "curiosity": "curiosidad",
-    "desire": "deseo", "disappointment": "decepción", "disapproval": "desaprobación", "disgust": "asco",
-    "embarrassment": "vergüenza", "excitement": "emoción", "fear": "miedo", "gratitude": "gratitud",
-    "grief": "duelo", "joy": "alegría", "love": "amor", "nervousness": "nerviosismo",
-    "neutral": "neutral", "optimism": "optimismo", "pride": "orgullo", "realization": "reconocimiento",
-    "relief": "alivio", "remorse": "arrepentimiento", "sadness": "tristeza", "surprise": "sorpresa"
-}
-
 class BatchInput(BaseModel):
     texts: List[str]
+    thresholds: Optional[Dict[str, float]] = None
+    top_k: Optional[conint(ge=1)] = None
+    min_probability: Optional[confloat(ge=0, le=1)] = None
+    format: Literal["full", "compact"] = "full"
+    long_text: Optional[Literal["max", "mean"]] = None
 
 @app.get("/")
 def health_check():
     return {"status": "ok", "message": "API de clasificación de emociones lista"}
 
+@app.get("/ready")
+def readiness_check():
+    if not model_ready:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "loading" if startup_error is None else "error",
+                     "error": startup_error, "startup_timings": startup_timings},
+        )
+    return {"status": "ready", "model": MODEL_PATH, "backend": INFERENCE_BACKEND,
+            "serving_mode": SERVING_MODE,
+            "student_model": STUDENT_MODEL_PATH if SERVING_MODE != "teacher" else None,
+            "startup_timings": startup_timings}
+
+def run_model(model_backend, model_tokenizer, texts, long_text=None):
+    return bucketed_predict_probs(
+        model_backend, model_tokenizer, texts,
+        max_length=min(MODEL_MAX_LENGTH, model_tokenizer.model_max_length),
+        max_batch_tokens=MAX_BATCH_TOKENS,
+        long_text=long_text,
+        stride=LONG_TEXT_STRIDE,
+        max_windows=LONG_TEXT_MAX_WINDOWS,
+    )
+
+
+def predict_probs(texts, long_text=None):
+    """
+    Probabilidades (n, num_labels) de un batch, procesado en buckets por longitud.
+
+    En modo cascada responde el estudiante y solo las filas inciertas (alguna
+    etiqueta a menos de ROUTE_MARGIN de su umbral) se recalculan con el maestro.
+    Con `long_text` los textos largos se puntúan por ventanas en lugar de truncarse.
+    """
+    if student_backend is None:
+        return run_model(backend, tokenizer, texts, long_text)
+
+    probs = run_model(student_backend, student_tokenizer, texts, long_text)
+    routed = uncertain_rows(probs, default_thresholds, ROUTE_MARGIN)
+    CASCADE_TEXTS.inc(len(texts))
+    if routed.any():
+        CASCADE_ROUTED.inc(int(routed.sum()))
+        probs[routed] = run_model(backend, tokenizer, [text for text, r in zip(texts, routed) if r], long_text)
+    return probs
+
+
+def resolve_thresholds(overrides=None):
+    """Vector de umbrales por etiqueta, con reemplazos opcionales por nombre."""
+    if not overrides:
+        return default_thresholds
+    unknown = [label for label in overrides if label not in label_index]
+    if unknown:
+        raise ValueError(f"Etiquetas desconocidas: {', '.join(unknown)}")
+    thresholds = default_thresholds.copy()
+    for label, value in overrides.items():
+        thresholds[label_index[label]] = value
+    return thresholds
+
+
+def record_predictions(mask):
+    TEXTS_CLASSIFIED.inc(len(mask))
+    for label, count in zip(emotion_labels, mask.sum(axis=0).tolist()):
+        if count:
+            LABEL_PREDICTIONS.inc(count, label=label)
+
+
+def build_results(texts, probs, mask=None):
+    if mask is None:
+        mask = select_labels(probs, default_thresholds)
+    record_predictions(mask)
+    return format_results(texts, probs, mask, emotion_labels, label_translations)
+
+
+batcher = MicroBatcher(
+    predict_probs,
+    max_batch_size=BATCH_MAX_SIZE,
+    max_wait_ms=BATCH_MAX_WAIT_MS,
+    max_queue_size=BATCH_MAX_QUEUE,
+)
+# Un micro-batcher por modo long_text: solo se juntan peticiones del mismo modo
+long_text_batchers = {
+    mode: MicroBatcher(
+        functools.partial(predict_probs, long_text=mode),
+        max_batch_size=BATCH_MAX_SIZE,
+        max_wait_ms=BATCH_MAX_WAIT_MS,
+        max_queue_size=BATCH_MAX_QUEUE,
+    )
+    for mode in WINDOW_POOLING
+}
+
+async def predict_cached(texts, long_text=None):
+    """Probabilidades para `texts`; solo los textos no cacheados (y únicos) van al modelo."""
+    # Stride y número de ventanas cambian las probabilidades: forman parte de la clave
+    variant = long_text and f"long_text={long_text}:{LONG_TEXT_STRIDE}:{LONG_TEXT_MAX_WINDOWS}"
+    keys = [cache.key(text, variant) for text in texts]
+    # Con caché persistente, SQLite (lectura, escritura y commit) corre fuera del event loop
+    if cache.sqlite_path:
+        rows = await asyncio.to_thread(cache.get_many, keys)
+    else:
+        rows = cache.get_many(keys)
+
+    pending = {}
+    for i, row in enumerate(rows):
+        if row is None:
+            pending.setdefault(keys[i], []).append(i)
+
+    if pending:
+        miss_keys = list(pending)
+        model_batcher = batcher if long_text is None else long_text_batchers[long_text]
+        miss_probs = await model_batcher.submit([texts[pending[key][0]] for key in miss_keys])
+        if cache.sqlite_path:
+            await asyncio.to_thread(cache.put_many, miss_keys, miss_probs)
+        else:
+            cache.put_many(miss_keys, miss_probs)
+        for key, row in zip(miss_keys, miss_probs):
+            for i in pending[key]:
+                rows[i] = row
+
+    return np.vstack(rows)
+
 @app.post("/classify")
-def classify_emotion(payload: BatchInput):
+async def classify_emotion(payload: BatchInput):
     texts = payload.texts
     if not texts:
         return {"error": "Lista vacía"}
+    if not model_ready:
+        return not_ready_response()
+
+    try:
+        thresholds = resolve_thresholds(payload.thresholds)
+    except ValueError as e:
+        return {"error": str(e)}
+
+    probs = await predict_cached(texts, payload.long_text)
+
+    with POSTPROCESS_SECONDS.time():
+        mask = select_labels(probs, thresholds, top_k=payload.top_k,
+                             min_probability=payload.min_probability)
+        if payload.format == "compact":
+            record_predictions(mask)
+            response = {
+                "labels": emotion_labels,
+                "translated_labels": translated_emotion_labels,
+                **compact_results(probs, mask),
+            }
+        else:
+            response = {"results": build_results(texts, probs, mask)}
+
+    with SERIALIZE_SECONDS.time():
+        body = json.dumps(response, ensure_ascii=False)
+    return Response(body, media_type="application/json")
+
+async def iter_ndjson(request: Request, max_line_bytes: int = STREAM_MAX_LINE_BYTES):
+    """
+    Lee el cuerpo de la petición de forma incremental y produce (número, línea).
+
+    Solo se recorren los bytes recién recibidos; una línea de más de
+    `max_line_bytes` se descarta hasta su salto de línea y se produce con None.
+    """
+    parts = []
+    size = 0
+    too_long = False
+    line_no = 0
+    async for chunk in request.stream():
+        start = 0
+        while True:
+            newline = chunk.find(b"\n", start)
+            end = len(chunk) if newline < 0 else newline
+            if not too_long:
+                if size + end - start > max_line_bytes:
+                    too_long, parts, size = True, [], 0
+                elif end > start:
+                    parts.append(chunk[start:end])
+                    size += end - start
+            if newline < 0:
+                break
+            line_no += 1
+            line = b"".join(parts)
+            if too_long:
+                yield line_no, None
+            elif line.strip():
+                yield line_no, line
+            parts, size, too_long = [], 0, False
+            start = newline + 1
+    line = b"".join(parts)
+    if too_long:
+        yield line_no + 1, None
+    elif line.strip():
+        yield line_no + 1, line
 
-    encoded = tokenizer(texts, return_tensors="pt", padding=True, truncation=True)
 
-    with torch.no_grad():
-        logits = model(**encoded).logits
-        probs = sigmoid(logits).cpu().numpy()
+def parse_stream_record(line_no, line):
+    """
+    Convierte una línea NDJSON en (id, texto, metadata).
 
+    Acepta un string JSON o un objeto con `text` (o `comment`, como lo guarda el
+    extractor de TikTok), un `id` opcional y cualquier otro campo como metadata.
+    """
+    record = json.loads(line)
+    if isinstance(record, str):
+        return line_no, record, {}
+    if not isinstance(record, dict):
+        raise ValueError("cada línea debe ser un string o un objeto JSON")
+
+    record = dict(record)
+    record_id = record.pop("id", line_no)
+    text = record.pop("text", None)
+    if text is None:
+        text = record.pop("comment", None)
+    if not isinstance(text, str):
+        raise ValueError("falta el campo 'text'")
+    return record_id, text, record
+
+
+async def classify_chunk(chunk, long_text=None):
+    """
+    Clasifica un bloque de registros y devuelve sus líneas NDJSON en el orden de
+    entrada; los errores de parseo viajan en el bloque como dicts ya armados.
+    """
+    records = [record for record in chunk if isinstance(record, tuple)]
     results = []
-    threshold = 0.5
-    for i, prob_row in enumerate(probs):
-        predicted_indices = [j for j, p in enumerate(prob_row) if p > threshold]
-        predicted_labels = [emotion_labels[j] for j in predicted_indices]
-        translated_labels = [label_translations.get(label, label) for label in predicted_labels]
-        prob_dict = {
-            emotion_labels[j]: round(float(prob_row[j]), 4)
-            for j in predicted_indices
-        }
-
-        results.append({
-            "input": texts[i],
-            "predicted_labels": predicted_labels,
-            "translated_labels": translated_labels,
-            "probabilities": prob_dict
-        })
-
-    return {"results": results}
+    if records:
+        texts = [text for _, text, _ in records]
+        probs = await predict_cached(texts, long_text)
+        with POSTPROCESS_SECONDS.time():
+            results = build_results(texts, probs)
+    with SERIALIZE_SECONDS.time():
+        results = iter(results)
+        lines = []
+        for record in chunk:
+            if isinstance(record, dict):
+                lines.append(json.dumps(record, ensure_ascii=False) + "\n")
+                continue
+            record_id, _, metadata = record
+            result = next(results)
+            result["id"] = record_id
+            if metadata:
+                result["metadata"] = metadata
+            lines.append(json.dumps(result, ensure_ascii=False) + "\n")
+    yield "".join(lines)
 
-@app.get("/stats")
-def label_statistics():
-    training_distribution = {
-        "neutral": 31446,
-        "approval": 13235,
-        "annoyance": 10024,
-        "admiration": 9912,
-        "disapproval": 8399,
-        "realization": 7248,
-        "disappointment": 6656,
-        "curiosity": 6203,
-        "optimism": 6199,
-        "joy": 5688,
-        "anger": 5644,
-        "confusion": 5311,
-        "gratitude": 5288,
-        "amusement": 5180,
-        "sadness": 4667,
-        "love": 4347,
-        "excitement": 4335,
-        "caring": 4330,
-        "disgust": 4053,
-        "surprise": 3823,
-        "desire": 2838,
-        "fear": 2136,
-        "embarrassment": 2003,
-        "remorse": 1663,
-        "nervousness": 1556,
-        "pride": 1127,
-        "relief": 1085,
-        "grief": 558
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse sin la tarea paralela que escucha desconexiones: el generador
+    sigue leyendo el cuerpo de la petición mientras responde, y dos lectores de
+    `receive` a la vez se roban los mensajes del cuerpo.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+@app.post("/classify/stream")
+async def classify_stream(request: Request):
+    """
+    Clasificación masiva en streaming: recibe NDJSON (un comentario por línea) y
+    devuelve NDJSON a medida que se procesa cada bloque de STREAM_CHUNK_SIZE.
+    La memoria usada no depende del tamaño total de la entrada: las líneas de más
+    de STREAM_MAX_LINE_BYTES se descartan y responden un error en su posición.
+    Con `?long_text=max|mean` los comentarios largos se puntúan por ventanas.
+    """
+    if not model_ready:
+        return not_ready_response()
+    long_text = request.query_params.get("long_text") or None
+    if long_text is not None and long_text not in WINDOW_POOLING:
+        return JSONResponse(status_code=400, content={"error": f"long_text debe ser uno de {WINDOW_POOLING}"})
+
+    async def generate():
+        chunk = []
+        async for line_no, line in iter_ndjson(request):
+            if line is None:
+                chunk.append({"line": line_no, "error": f"línea de más de {STREAM_MAX_LINE_BYTES} bytes"})
+            else:
+                try:
+                    chunk.append(parse_stream_record(line_no, line))
+                except ValueError as e:
+                    # El error sale en su posición, después de las líneas anteriores del bloque
+                    chunk.append({"line": line_no, "error": str(e)})
+
+            if len(chunk) >= STREAM_CHUNK_SIZE:
+                async for out in classify_chunk(chunk, long_text):
+                    yield out
+                chunk = []
+
+        if chunk:
+            async for out in classify_chunk(chunk, long_text):
+                yield out
+
+    return DuplexStreamingResponse(generate(), media_type="application/x-ndjson")
+
+class SummaryInput(BaseModel):
+    texts: Optional[List[str]] = None
+    timestamps: Optional[List[Union[float, str, None]]] = None
+    dataset: Optional[str] = None
+    text_col: str = "text"
+    time_col: Optional[str] = None
+    freq: Optional[Literal["H", "D", "W", "M", "Y"]] = None
+    thresholds: Optional[Dict[str, float]] = None
+    top_k: Optional[conint(ge=1)] = None
+    min_probability: Optional[confloat(ge=0, le=1)] = None
+    long_text: Optional[Literal["max", "mean"]] = None
+    top: int = 5
+
+def summary_chunks(payload):
+    """Bloques (textos, marcas de tiempo) de la petición: textos en línea o un dataset de data/."""
+    if payload.texts is not None:
+        times = None
+        if payload.freq and payload.timestamps is not None:
+            if len(payload.timestamps) != len(payload.texts):
+                raise ValueError("`timestamps` debe tener un valor por texto")
+            times = to_datetimes(payload.timestamps)
+        for start in range(0, len(payload.texts), SUMMARY_CHUNK_SIZE):
+            end = start + SUMMARY_CHUNK_SIZE
+            yield payload.texts[start:end], times[start:end] if times is not None else None
+        return
+    path = resolve_dataset(payload.dataset, DATA_DIR)
+    time_col = (payload.time_col or "timestamp") if payload.freq else None
+    yield from iter_dataset(path, payload.text_col, time_col, SUMMARY_CHUNK_SIZE)
+
+@app.post("/classify/summary")
+async def classify_summary(payload: SummaryInput):
+    """
+    Resumen agregado de un conjunto de comentarios, sin resultados por comentario:
+    conteos y probabilidades medias por etiqueta, top de emociones en español y,
+    con `freq`, los mismos agregados por periodo. Los textos llegan en la petición
+    (`texts`, con `timestamps` opcionales) o como ruta de un CSV/Parquet dentro de
+    data/ (`dataset`, con `text_col` y `time_col`). Se procesa por bloques de
+    SUMMARY_CHUNK_SIZE, así que la respuesta no crece con el número de comentarios.
+    """
+    if (payload.texts is None) == (payload.dataset is None):
+        return {"error": "Indica `texts` o `dataset` (solo uno)"}
+    if not model_ready:
+        return not_ready_response()
+
+    try:
+        thresholds = resolve_thresholds(payload.thresholds)
+        summary = EmotionSummary(len(emotion_labels), payload.freq, SUMMARY_MAX_PERIODS)
+        chunks = summary_chunks(payload)
+        received = skipped = 0
+        while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+            texts, times = chunk
+            received += len(texts)
+            keep = [i for i, text in enumerate(texts) if text and text.strip()]
+            skipped += len(texts) - len(keep)
+            if not keep:
+                continue
+            if len(keep) < len(texts):
+                texts = [texts[i] for i in keep]
+                times = times[keep] if times is not None else None
+
+            probs = await predict_cached(texts, payload.long_text)
+            with POSTPROCESS_SECONDS.time():
+                mask = select_labels(probs, thresholds, top_k=payload.top_k,
+                                     min_probability=payload.min_probability)
+                record_predictions(mask)
+                summary.update(probs, mask, times)
+    except FileNotFoundError as e:
+        return JSONResponse(status_code=404, content={"error": str(e)})
+    except (KeyError, ValueError) as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except ImportError:
+        # Parquet es opcional: pyarrow no está en requirements.txt
+        return JSONResponse(status_code=501, content={"error": "Leer Parquet requiere pyarrow (pip install pyarrow)"})
+
+    response = {
+        "source": payload.dataset or "texts",
+        "received": received,
+        "skipped": skipped,
+        **summary.to_dict(emotion_labels, translated_emotion_labels, top=max(payload.top, 0)),
+    }
+    with SERIALIZE_SECONDS.time():
+        body = json.dumps(response, ensure_ascii=False)
+    return Response(body, media_type="application/json")
+
+async def classify_with_defaults(texts):
+    """Probabilidades (con caché) y etiquetas con los umbrales por defecto."""
+    probs = await predict_cached(texts)
+    return probs, select_labels(probs, default_thresholds)
+
+PostId = PathParam(..., pattern=r"^[\w.-]{1,128}$")
+
+class PostComment(BaseModel):
+    id: str
+    text: str
+
+class PostCommentsInput(BaseModel):
+    comments: List[PostComment]
+
+def posts_unavailable():
+    if not model_ready:
+        return not_ready_response()
+    if posts is None:
+        return JSONResponse(status_code=404, content={"error": "Store de publicaciones desactivado (POSTS_SQLITE_PATH)"})
+    return None
+
+async def ingest_post_comments(post_id, comments):
+    """
+    Registra los comentarios de una publicación y clasifica solo los que no se
+    habían visto; los agregados de la publicación se actualizan de forma incremental.
+    """
+    received = len(comments)
+    comments = [(comment_id, text) for comment_id, text in comments if text and text.strip()]
+    added = await asyncio.to_thread(posts.add_comments, post_id, comments)
+    if added:
+        probs, mask = await classify_with_defaults([text for _, text in added])
+        record_predictions(mask)
+        await asyncio.to_thread(posts.add_results, [(post_id, comment_id) for comment_id, _ in added], probs, mask)
+    return {
+        "post_id": post_id,
+        "received": received,
+        "new": len(added),
+        "skipped": received - len(comments),
+        "summary": await asyncio.to_thread(posts.summary, post_id),
+    }
+
+@app.post("/posts/{post_id}/comments")
+async def add_post_comments(payload: PostCommentsInput, post_id: str = PostId):
+    unavailable = posts_unavailable()
+    if unavailable is not None:
+        return unavailable
+    return await ingest_post_comments(post_id, [(c.id, c.text) for c in payload.comments])
+
+@app.post("/posts/{post_id}/sync")
+async def sync_post_comments(post_id: str = PostId):
+    """Ingresa las filas nuevas del CommentStore del extractor para este video."""
+    unavailable = posts_unavailable()
+    if unavailable is not None:
+        return unavailable
+    from extraction.storage import CommentStore, comment_id
+
+    if not os.path.exists(os.path.join(COMMENT_STORE_DIR, post_id, "manifest.json")):
+        return JSONResponse(status_code=404, content={"error": f"No hay comentarios extraídos para {post_id}"})
+    # Cargar los ids y leer/escribir segmentos es E/S de disco: fuera del event loop
+    store = await asyncio.to_thread(CommentStore, COMMENT_STORE_DIR, post_id)
+    rows, offset = await asyncio.to_thread(store.read_new, "api-posts")
+    result = await ingest_post_comments(
+        post_id, [(comment_id(row), row.get("comment") or row.get("text") or "") for row in rows]
+    )
+    await asyncio.to_thread(store.commit, "api-posts", offset)
+    return result
+
+@app.get("/posts/{post_id}/summary")
+async def post_summary(post_id: str = PostId, top: Optional[int] = None):
+    unavailable = posts_unavailable()
+    if unavailable is not None:
+        return unavailable
+    summary = await asyncio.to_thread(posts.summary, post_id, top)
+    if summary is None:
+        return JSONResponse(status_code=404, content={"error": f"No hay comentarios para {post_id}"})
+    return summary
+
+@app.get("/posts/{post_id}/comments")
+async def post_comments(post_id: str = PostId, offset: int = 0, limit: int = 100):
+    unavailable = posts_unavailable()
+    if unavailable is not None:
+        return unavailable
+    limit = max(1, min(limit, 1000))
+    results = await asyncio.to_thread(posts.comment_results, post_id, max(0, offset), limit)
+    return {"post_id": post_id, "offset": offset, "results": results}
+
+def update_gauges():
+    for key, value in batcher.stats().items():
+        REGISTRY.gauge(f"batcher_{key}").set(value)
+    if cache is not None:
+        for key, value in cache.stats().items():
+            if isinstance(value, (int, float)):
+                REGISTRY.gauge(f"cache_{key}").set(value)
+    for key, value in startup_timings.items():
+        REGISTRY.gauge("startup_seconds", "Desglose del arranque").set(value, stage=key.removesuffix("_s"))
+
+
+@app.get("/metrics")
+def metrics():
+    """Métricas en formato de exposición Prometheus (del worker que atiende, etiqueta `worker`)."""
+    update_gauges()
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/metrics/summary")
+def metrics_summary():
+    """
+    Resumen en JSON del worker que atiende la petición: con `api/serve.py --workers N`
+    cada proceso tiene sus propias métricas (ver `worker`).
+    """
+    return {
+        "worker": {"pid": os.getpid(), "index": dict(REGISTRY.labels).get("worker")},
+        "batching": batcher.stats(),
+        "long_text_batching": {mode: b.stats() for mode, b in long_text_batchers.items() if b.batches_total},
+        "cache": cache.stats() if cache else None,
+        "startup_timings": startup_timings,
+        "posts": {**posts.stats(), "rescore": rescorer.stats() if rescorer else None} if posts else None,
+        "stages": {
+            name: REGISTRY.histogram(name).snapshot()
+            for name in ("queue_wait_seconds", "tokenize_seconds", "forward_seconds",
+                         "postprocess_seconds", "serialize_seconds")
+        },
     }
 
+@app.get("/analytics")
+def list_analytics():
+    """Reportes de analítica precalculados (python -m review_analyzer.analytics)."""
+    return {"reports": sorted(path.stem for path in ANALYTICS_DIR.glob("*.json"))}
+
+@app.get("/analytics/{name}")
+def get_analytics(name: str, section: Optional[str] = None):
+    """Reporte completo, o solo una tabla (rates_over_time, weighted_shares, term_frequencies)."""
+    path = ANALYTICS_DIR / f"{name}.json"
+    if path.parent != ANALYTICS_DIR or not path.is_file():
+        return JSONResponse(status_code=404, content={"error": f"No existe el reporte {name!r}"})
+    report = load_report(path)
+    if section is None:
+        return report
+    if section not in report:
+        return JSONResponse(status_code=404, content={"error": f"El reporte no tiene la sección {section!r}"})
+    return {"name": name, section: report[section]}
+
+@app.get("/stats")
+def label_statistics():
     translated = {
-        label_translations[k]: v for k, v in training_distribution.items()
+        label_translations[k]: v for k, v in TRAINING_DISTRIBUTION.items()
     }
 
     return {
-        "training_distribution_en": training_distribution,
+        "training_distribution_en": TRAINING_DISTRIBUTION,
         "training_distribution_es": translated,
         "note": "Estas cantidades reflejan el número de ejemplos por emoción durante el entrenamiento. Algunas emociones pueden estar subrepresentadas."
     }
\ No newline at end of file
@@ -0,0 +1,324 @@
+import asyncio
+import fcntl
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from api.summary import emotion_rows
+from review_analyzer.metrics import REGISTRY
+
+POST_COMMENTS_INGESTED = REGISTRY.counter("post_comments_ingested_total", "Comentarios nuevos registrados por publicación")
+POST_COMMENTS_SCORED = REGISTRY.counter("post_comments_scored_total", "Resultados guardados en el store de publicaciones")
+RESCORED_COMMENTS = REGISTRY.counter("rescored_comments_total", "Comentarios re-puntuados en segundo plano")
+RESCORE_ERRORS = REGISTRY.counter("rescore_errors_total", "Lotes del re-score en segundo plano que fallaron")
+
+logger = logging.getLogger(__name__)
+
+
+class PostStore:
+    """
+    Resultados persistentes por publicación, en SQLite.
+
+    - comments: texto de cada comentario por (post_id, comment_id).
+    - results: probabilidades y etiquetas por (post_id, comment_id, revisión del modelo).
+    - aggregates: por (post_id, revisión), número de comentarios puntuados, suma de
+      probabilidades y conteo de etiquetas. Se actualizan al insertar resultados
+      (sumas acumuladas), así que un resumen no relee los comentarios.
+
+    Un cambio de revisión deja los comentarios sin resultado para la revisión
+    nueva; `pending` los devuelve para re-puntuarlos (ver `Rescorer`).
+
+    - sqlite_path: ruta de la base.
+    - revision: revisión actual (modelo, backend, modo y umbrales).
+    - labels / translated_labels: etiquetas del modelo en inglés y español.
+    """
+
+    def __init__(self, sqlite_path: str, revision: str, labels: List[str], translated_labels: List[str]):
+        self.sqlite_path = sqlite_path
+        self.revision = revision
+        self.labels = list(labels)
+        self.translated_labels = list(translated_labels)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+
+    @property
+    def _db(self):
+        """Conexión SQLite del proceso actual (se reabre tras un fork)."""
+        if self._conn is None or self._conn_pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.sqlite_path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.sqlite_path, check_same_thread=False, timeout=30)
+            self._conn_pid = os.getpid()
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(
+                "CREATE TABLE IF NOT EXISTS comments ("
+                " post_id TEXT NOT NULL, comment_id TEXT NOT NULL, text TEXT NOT NULL, created_at REAL NOT NULL,"
+                " PRIMARY KEY (post_id, comment_id));"
+                "CREATE TABLE IF NOT EXISTS results ("
+                " post_id TEXT NOT NULL, comment_id TEXT NOT NULL, revision TEXT NOT NULL,"
+                " probs BLOB NOT NULL, labels INTEGER NOT NULL,"
+                " PRIMARY KEY (post_id, comment_id, revision));"
+                "CREATE TABLE IF NOT EXISTS aggregates ("
+                " post_id TEXT NOT NULL, revision TEXT NOT NULL, n INTEGER NOT NULL,"
+                " prob_sums BLOB NOT NULL, label_counts BLOB NOT NULL, updated_at REAL NOT NULL,"
+                " PRIMARY KEY (post_id, revision));"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def add_comments(self, post_id: str, comments: Sequence[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """Registra (comment_id, texto); los ids ya conocidos se ignoran. Retorna los nuevos."""
+        now = time.time()
+        added = []
+        with self._lock:
+            db = self._db
+            for comment_id, text in comments:
+                cursor = db.execute(
+                    "INSERT OR IGNORE INTO comments (post_id, comment_id, text, created_at) VALUES (?, ?, ?, ?)",
+                    (post_id, str(comment_id), text, now),
+                )
+                if cursor.rowcount:
+                    added.append((str(comment_id), text))
+            db.commit()
+        POST_COMMENTS_INGESTED.inc(len(added))
+        return added
+
+    def pending(self, post_id: Optional[str] = None, limit: Optional[int] = None) -> List[Tuple[str, str, str]]:
+        """(post_id, comment_id, texto) de los comentarios sin resultado para la revisión actual."""
+        query = (
+            "SELECT c.post_id, c.comment_id, c.text FROM comments c "
+            "LEFT JOIN results r ON r.post_id = c.post_id AND r.comment_id = c.comment_id AND r.revision = ? "
+            "WHERE r.comment_id IS NULL"
+        )
+        params = [self.revision]
+        if post_id is not None:
+            query += " AND c.post_id = ?"
+            params.append(post_id)
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            return self._db.execute(query, params).fetchall()
+
+    def add_results(self, rows: Sequence[Tuple[str, str]], probs: np.ndarray, mask: np.ndarray) -> int:
+        """
+        Guarda los resultados de (post_id, comment_id) y suma cada fila nueva a los
+        agregados de su publicación en la misma transacción. Una fila que ya tenía
+        resultado (p. ej. puntuada a la vez por el re-score) no se cuenta dos veces.
+        """
+        probs = np.asarray(probs, dtype=np.float32)
+        mask = np.asarray(mask, dtype=bool)
+        weights = np.left_shift(np.int64(1), np.arange(mask.shape[1], dtype=np.int64))
+        bitmasks = (mask.astype(np.int64) @ weights).tolist()
+        num_labels = len(self.labels)
+
+        inserted = {}
+        with self._lock:
+            db = self._db
+            for i, (post_id, comment_id) in enumerate(rows):
+                cursor = db.execute(
+                    "INSERT OR IGNORE INTO results (post_id, comment_id, revision, probs, labels) VALUES (?, ?, ?, ?, ?)",
+                    (post_id, comment_id, self.revision, probs[i].tobytes(), bitmasks[i]),
+                )
+                if cursor.rowcount:
+                    inserted.setdefault(post_id, []).append(i)
+
+            now = time.time()
+            for post_id, idx in inserted.items():
+                row = db.execute(
+                    "SELECT n, prob_sums, label_counts FROM aggregates WHERE post_id = ? AND revision = ?",
+                    (post_id, self.revision),
+                ).fetchone()
+                if row is None:
+                    n, prob_sums, label_counts = 0, np.zeros(num_labels), np.zeros(num_labels, dtype=np.int64)
+                else:
+                    n = row[0]
+                    prob_sums = np.frombuffer(row[1], dtype=np.float64).copy()
+                    label_counts = np.frombuffer(row[2], dtype=np.int64).copy()
+                n += len(idx)
+                prob_sums += probs[idx].sum(axis=0, dtype=np.float64)
+                label_counts += mask[idx].sum(axis=0)
+                db.execute(
+                    "INSERT OR REPLACE INTO aggregates (post_id, revision, n, prob_sums, label_counts, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (post_id, self.revision, n, prob_sums.tobytes(), label_counts.tobytes(), now),
+                )
+            db.commit()
+
+        added = sum(len(idx) for idx in inserted.values())
+        POST_COMMENTS_SCORED.inc(added)
+        return added
+
+    def summary(self, post_id: str, top: Optional[int] = None) -> Optional[dict]:
+        """
+        Resumen de emociones de la publicación a partir de los agregados.
+
+        Si la revisión actual todavía no cubre todos los comentarios (re-score en
+        curso), se usa la revisión anterior más completa y se marca `stale`.
+        """
+        with self._lock:
+            db = self._db
+            total = db.execute("SELECT COUNT(*) FROM comments WHERE post_id = ?", (post_id,)).fetchone()[0]
+            aggregates = db.execute(
+                "SELECT revision, n, prob_sums, label_counts, updated_at FROM aggregates WHERE post_id = ?",
+                (post_id,),
+            ).fetchall()
+        if not total:
+            return None
+
+        current = next((a for a in aggregates if a[0] == self.revision), None)
+        best = max(aggregates, key=lambda a: a[1], default=None)
+        chosen = current if current is not None and current[1] >= best[1] else best
+        if chosen is None:
+            return {"post_id": post_id, "comments": total, "classified": 0, "revision": self.revision,
+                    "stale": False, "emotions": []}
+
+        revision, n, prob_sums, label_counts, updated_at = chosen
+        prob_sums = np.frombuffer(prob_sums, dtype=np.float64)
+        label_counts = np.frombuffer(label_counts, dtype=np.int64)
+        return {
+            "post_id": post_id,
+            "comments": total,
+            "classified": n,
+            "coverage": round(n / total, 4),
+            "revision": revision,
+            "stale": revision != self.revision,
+            "updated_at": updated_at,
+            "emotions": emotion_rows(self.labels, self.translated_labels, label_counts, prob_sums, n, top),
+        }
+
+    def comment_results(self, post_id: str, offset: int = 0, limit: int = 100) -> List[dict]:
+        """Resultados de la revisión actual por comentario (paginados)."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT c.comment_id, c.text, r.probs, r.labels FROM comments c "
+                "JOIN results r ON r.post_id = c.post_id AND r.comment_id = c.comment_id AND r.revision = ? "
+                "WHERE c.post_id = ? ORDER BY c.rowid LIMIT ? OFFSET ?",
+                (self.revision, post_id, limit, offset),
+            ).fetchall()
+        out = []
+        for comment_id, text, blob, bitmask in rows:
+            probs = np.frombuffer(blob, dtype=np.float32)
+            chosen = [j for j in range(len(self.labels)) if bitmask >> j & 1]
+            out.append({
+                "id": comment_id,
+                "text": text,
+                "predicted_labels": [self.labels[j] for j in chosen],
+                "translated_labels": [self.translated_labels[j] for j in chosen],
+                "probabilities": {self.labels[j]: round(float(probs[j]), 4) for j in chosen},
+            })
+        return out
+
+    def prune(self) -> int:
+        """Borra resultados y agregados de otras revisiones en publicaciones ya re-puntuadas por completo."""
+        with self._lock:
+            db = self._db
+            done = [post_id for (post_id,) in db.execute(
+                "SELECT a.post_id FROM aggregates a "
+                "JOIN (SELECT post_id, COUNT(*) AS total FROM comments GROUP BY post_id) c ON c.post_id = a.post_id "
+                "WHERE a.revision = ? AND a.n >= c.total",
+                (self.revision,),
+            )]
+            before = db.total_changes
+            for post_id in done:
+                db.execute("DELETE FROM results WHERE post_id = ? AND revision != ?", (post_id, self.revision))
+                db.execute("DELETE FROM aggregates WHERE post_id = ? AND revision != ?", (post_id, self.revision))
+            db.commit()
+            return db.total_changes - before
+
+    def stats(self) -> dict:
+        with self._lock:
+            db = self._db
+            posts, comments = db.execute("SELECT COUNT(DISTINCT post_id), COUNT(*) FROM comments").fetchone()
+            scored = db.execute("SELECT COUNT(*) FROM results WHERE revision = ?", (self.revision,)).fetchone()[0]
+        return {"revision": self.revision, "posts": posts, "comments": comments,
+                "scored": scored, "pending": comments - scored}
+
+
+class Rescorer:
+    """
+    Re-puntúa en segundo plano los comentarios sin resultado para la revisión
+    actual (p. ej. tras cambiar de modelo) sin pasar de `texts_per_second`.
+
+    Con varios workers solo uno lo ejecuta (lock de archivo junto a la base), de
+    modo que el presupuesto es global y no por proceso.
+
+    - store: PostStore.
+    - classify: corrutina textos -> (probabilidades, máscara de etiquetas).
+    - texts_per_second: presupuesto de throughput del re-score.
+    - batch_size: comentarios por lote.
+    - idle_seconds: espera entre revisiones cuando no hay pendientes.
+    - retry_seconds: espera tras un lote fallido; se duplica con cada fallo
+      seguido, hasta `idle_seconds`.
+    """
+
+    def __init__(self, store: PostStore, classify: Callable, texts_per_second: float = 10.0,
+                 batch_size: int = 32, idle_seconds: float = 30.0, retry_seconds: float = 1.0):
+        self.store = store
+        self.classify = classify
+        self.texts_per_second = texts_per_second
+        self.batch_size = max(1, batch_size)
+        self.idle_seconds = idle_seconds
+        self.retry_seconds = retry_seconds
+        self.rescored = 0
+        self.errors = 0
+        self.running = False
+        self._lock_file = None
+
+    def _acquire(self) -> bool:
+        self._lock_file = open(f"{self.store.sqlite_path}.rescore.lock", "w")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            self._lock_file.close()
+            self._lock_file = None
+            return False
+
+    async def run(self) -> None:
+        if self.texts_per_second <= 0 or not await asyncio.to_thread(self._acquire):
+            return
+        self.running = True
+        failures = 0
+        try:
+            while True:
+                try:
+                    delay = await self._step()
+                    failures = 0
+                except Exception:
+                    # Un lote fallido (modelo, base de datos) no detiene el re-score
+                    self.errors += 1
+                    RESCORE_ERRORS.inc()
+                    delay = min(self.retry_seconds * 2 ** failures, max(self.idle_seconds, self.retry_seconds))
+                    failures += 1
+                    logger.exception("Fallo en el re-score en segundo plano; reintento en %.1fs", delay)
+                await asyncio.sleep(delay)
+        finally:
+            self.running = False
+            if self._lock_file is not None:
+                self._lock_file.close()
+
+    async def _step(self) -> float:
+        """Re-puntúa un lote de pendientes; retorna la espera hasta el siguiente."""
+        rows = await asyncio.to_thread(self.store.pending, None, self.batch_size)
+        if not rows:
+            await asyncio.to_thread(self.store.prune)
+            return self.idle_seconds
+        start = time.monotonic()
+        probs, mask = await self.classify([text for _, _, text in rows])
+        added = await asyncio.to_thread(
+            self.store.add_results, [(post_id, comment_id) for post_id, comment_id, _ in rows], probs, mask
+        )
+        self.rescored += added
+        RESCORED_COMMENTS.inc(added)
+        # Presupuesto: un lote de n textos ocupa al menos n / texts_per_second segundos
+        return max(0.0, len(rows) / self.texts_per_second - (time.monotonic() - start))
+
+    def stats(self) -> dict:
+        return {"running": self.running, "texts_per_second": self.texts_per_second, "rescored": self.rescored,
+                "errors": self.errors}
@@ -0,0 +1,17 @@
+import functools
+import json
+from pathlib import Path
+
+# Solo lee los JSON que escribe `python -m review_analyzer.analytics`; no importa
+# review_analyzer.analytics para que la API no dependa de pandas.
+
+
+@functools.lru_cache(maxsize=32)
+def _read_report(path: str, mtime_ns: int) -> dict:
+    return json.loads(Path(path).read_text(encoding="utf-8"))
+
+
+def load_report(path) -> dict:
+    """Lee un reporte JSON (en caché mientras el archivo no cambie)."""
+    path = Path(path)
+    return _read_report(str(path), path.stat().st_mtime_ns)
@@ -0,0 +1,133 @@
+"""
+Servidor multi-proceso con pesos compartidos.
+
+El proceso padre importa `api.main` (que carga el modelo una sola vez), abre el
+socket y luego hace fork de N workers. Los pesos quedan en páginas compartidas
+copy-on-write, así que N workers no ocupan N veces la RAM del modelo. Cada worker
+usa cpu_count // N hilos intra-op para no sobresuscribir los núcleos.
+
+Las métricas son por proceso: cada worker exporta sus series en /metrics con la
+etiqueta worker="<índice>" (un reemplazo hereda el índice del worker caído), y
+Prometheus las suma con `sum without (worker)`. /metrics/summary también
+describe solo al worker que atiende la petición.
+
+Uso:
+    python -m api.serve --host 0.0.0.0 --port $PORT --workers 4
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+
+
+def parse_args(argv=None):
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Servidor FeelTrack multi-worker")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")))
+    parser.add_argument("--threads", type=int, default=int(os.getenv("THREADS_PER_WORKER", "0")),
+                        help="Hilos intra-op por worker (por defecto cpu_count // workers)")
+    args = parser.parse_args(argv)
+    args.workers = max(1, args.workers)
+    if args.threads <= 0:
+        args.threads = max(1, cpus // args.workers)
+    return args
+
+
+def bind_socket(host, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock, threads, index=0):
+    import uvicorn
+    from api import main
+    from review_analyzer.metrics import REGISTRY
+
+    REGISTRY.set_labels(worker=index)
+
+    for backend in (main.backend, main.student_backend):
+        if backend is not None:
+            backend.configure_threads(threads)
+    config = uvicorn.Config(main.app, log_level="info")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # Limitar hilos OpenMP/MKL antes de importar torch en el padre
+    os.environ.setdefault("OMP_NUM_THREADS", str(args.threads))
+    os.environ.setdefault("MKL_NUM_THREADS", str(args.threads))
+
+    sock = bind_socket(args.host, args.port)
+    print(f"FeelTrack: {args.workers} worker(s) x {args.threads} hilo(s) en {args.host}:{args.port}")
+
+    if args.workers == 1:
+        # Un solo proceso: la carga ocurre en el lifespan y "/" responde mientras tanto
+        run_worker(sock, args.threads)
+        return 0
+
+    # Carga única del modelo en el padre (sin pasadas forward antes del fork;
+    # el warm-up corre en el lifespan de cada worker)
+    from api import main as api_main
+    api_main.load_model()
+
+    # Evita que el GC toque (y copie) los objetos heredados del padre
+    gc.freeze()
+
+    children = {}
+    stopping = False
+
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            try:
+                run_worker(sock, args.threads, index)
+            finally:
+                os._exit(0)
+        children[pid] = index
+
+    def shutdown(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    for index in range(args.workers):
+        spawn(index)
+
+    # Supervisión: reemplaza workers caídos hasta recibir la señal de parada
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        index = children.pop(pid, None)
+        if not stopping and index is not None:
+            print(f"Worker {pid} terminó (estado {status}); iniciando reemplazo")
+            spawn(index)
+
+    sock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
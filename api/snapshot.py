@@ -0,0 +1,49 @@
+"""
+Descarga una copia local del modelo en `API_MODEL` para arrancar sin ir al Hub.
+
+Los pesos quedan en formato safetensors, que transformers carga con mmap.
+
+Uso:
+    python -m api.snapshot [--model ZAMORAPJ/feeltrack-model] [--output api/model]
+"""
+import argparse
+import sys
+from pathlib import Path
+
+from review_analyzer.config import API_MODEL, FEELTRACK_MODEL
+
+
+def snapshot(model_id=FEELTRACK_MODEL, output_dir=API_MODEL):
+    from huggingface_hub import snapshot_download
+
+    output_dir = Path(output_dir)
+    snapshot_download(
+        model_id,
+        local_dir=output_dir,
+        allow_patterns=["*.json", "*.txt", "*.safetensors", "*.bin"],
+    )
+
+    # Si el repo solo publica pytorch_model.bin, se re-guarda como safetensors
+    if not any(output_dir.glob("*.safetensors")):
+        from transformers import BertForSequenceClassification
+
+        model = BertForSequenceClassification.from_pretrained(output_dir)
+        model.save_pretrained(output_dir, safe_serialization=True)
+    for weights in output_dir.glob("*.bin"):
+        weights.unlink()
+    return output_dir
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Copia local del modelo FeelTrack")
+    parser.add_argument("--model", default=FEELTRACK_MODEL)
+    parser.add_argument("--output", default=str(API_MODEL))
+    args = parser.parse_args(argv)
+
+    path = snapshot(args.model, args.output)
+    print(f"Modelo guardado en {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
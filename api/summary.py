@@ -0,0 +1,215 @@
+import csv
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Periodos de agregación -> unidad datetime64 del identificador de cada periodo
+PERIOD_UNITS = {"H": "h", "D": "D", "W": "D", "M": "M", "Y": "Y"}
+DATASET_SUFFIXES = (".csv", ".parquet")
+
+
+def emotion_rows(labels: Sequence[str], translated_labels: Sequence[str], label_counts: np.ndarray,
+                 prob_sums: np.ndarray, n: int, top: Optional[int] = None) -> List[dict]:
+    """Emociones ordenadas por conteo (y probabilidad media), con nombre en español."""
+    order = np.lexsort((-prob_sums, -label_counts))
+    if top is not None:
+        order = order[:top]
+    return [
+        {
+            "label": labels[j],
+            "label_es": translated_labels[j],
+            "count": int(label_counts[j]),
+            "rate": round(float(label_counts[j] / n), 4) if n else 0.0,
+            "mean_probability": round(float(prob_sums[j] / n), 4) if n else 0.0,
+        }
+        for j in order
+    ]
+
+
+def to_datetimes(values) -> np.ndarray:
+    """
+    Convierte marcas de tiempo (epoch en segundos o fechas ISO en texto) a
+    datetime64[s]; los valores vacíos o inválidos quedan como NaT.
+    """
+    if not isinstance(values, np.ndarray):
+        # Sin tipo fijo: numpy convertiría una lista con números y textos a textos
+        values = np.array(values, dtype=object)
+        if all(isinstance(value, (int, float)) for value in values.tolist()):
+            values = values.astype(np.float64)
+    if values.dtype.kind in "iuf":
+        seconds = values.astype(np.float64)
+        valid = np.isfinite(seconds)
+        times = np.full(len(values), np.datetime64("NaT"), dtype="datetime64[s]")
+        times[valid] = seconds[valid].astype(np.int64).astype("datetime64[s]")
+        return times
+    try:
+        return values.astype("datetime64[s]")
+    except (TypeError, ValueError):
+        pass
+
+    # Columna mixta (números, textos, None): elemento por elemento
+    times = np.full(len(values), np.datetime64("NaT"), dtype="datetime64[s]")
+    for i, value in enumerate(values.tolist()):
+        if value is None or value == "":
+            continue
+        try:
+            if isinstance(value, (int, float)):
+                times[i] = np.datetime64(int(value), "s")
+            else:
+                times[i] = np.datetime64(str(value).removesuffix("Z"), "s")
+        except (TypeError, ValueError, OverflowError):
+            pass
+    return times
+
+
+def period_ids(times: np.ndarray, freq: str) -> np.ndarray:
+    """Identificador entero del periodo de cada marca de tiempo (las semanas empiezan el lunes)."""
+    ids = times.astype(f"datetime64[{PERIOD_UNITS[freq]}]").astype(np.int64)
+    if freq == "W":
+        # El día 0 (1970-01-01) fue jueves
+        ids = ids - (ids + 3) % 7
+    return ids
+
+
+def period_label(period_id: int, freq: str) -> str:
+    """Inicio del periodo como texto: fecha, o fecha y hora para periodos de una hora."""
+    start = np.datetime64(int(period_id), PERIOD_UNITS[freq])
+    return np.datetime_as_string(start.astype("datetime64[m]" if freq == "H" else "datetime64[D]"))
+
+
+class EmotionSummary:
+    """
+    Agregados de emociones de un conjunto de comentarios, acumulados por bloques.
+
+    Solo guarda sumas por etiqueta (conteos y probabilidades) en total y por
+    periodo, así que la memoria y el tamaño de la respuesta no dependen del
+    número de comentarios sino del número de etiquetas y de periodos.
+
+    - num_labels: etiquetas del modelo.
+    - freq: periodo de agregación temporal (H, D, W, M, Y) o None.
+    - max_periods: límite de periodos distintos (ValueError al superarlo).
+    """
+
+    def __init__(self, num_labels: int, freq: Optional[str] = None, max_periods: int = 1000):
+        if freq is not None and freq not in PERIOD_UNITS:
+            raise ValueError(f"Periodo inválido: {freq!r} ({', '.join(PERIOD_UNITS)})")
+        self.freq = freq
+        self.max_periods = max_periods
+        self.n = 0
+        self.untimed = 0
+        self.prob_sums = np.zeros(num_labels, dtype=np.float64)
+        self.label_counts = np.zeros(num_labels, dtype=np.int64)
+        self.periods = {}
+
+    def update(self, probs: np.ndarray, mask: np.ndarray, times: Optional[np.ndarray] = None):
+        """Suma un bloque de probabilidades (n, num_labels) y su máscara de etiquetas."""
+        self.n += len(probs)
+        self.prob_sums += probs.sum(axis=0, dtype=np.float64)
+        self.label_counts += mask.sum(axis=0)
+        if self.freq is None:
+            return
+        if times is None:
+            self.untimed += len(probs)
+            return
+
+        valid = ~np.isnat(times)
+        self.untimed += int((~valid).sum())
+        if not valid.any():
+            return
+        ids, inverse = np.unique(period_ids(times[valid], self.freq), return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(ids))
+        prob_sums = np.zeros((len(ids), probs.shape[1]), dtype=np.float64)
+        label_counts = np.zeros((len(ids), probs.shape[1]), dtype=np.int64)
+        np.add.at(prob_sums, inverse, probs[valid])
+        np.add.at(label_counts, inverse, mask[valid])
+
+        for k, period_id in enumerate(ids.tolist()):
+            current = self.periods.get(period_id)
+            if current is None:
+                if len(self.periods) >= self.max_periods:
+                    raise ValueError(f"Más de {self.max_periods} periodos distintos: usa un periodo más largo")
+                self.periods[period_id] = [int(counts[k]), prob_sums[k], label_counts[k]]
+            else:
+                current[0] += int(counts[k])
+                current[1] += prob_sums[k]
+                current[2] += label_counts[k]
+
+    def to_dict(self, labels: Sequence[str], translated_labels: Sequence[str], top: int = 5) -> dict:
+        """Respuesta: conteos y probabilidades medias por etiqueta, top de emociones y periodos."""
+        n = self.n
+        summary = {
+            "classified": n,
+            "labels": list(labels),
+            "translated_labels": list(translated_labels),
+            "counts": self.label_counts.tolist(),
+            "mean_probabilities": np.round(self.prob_sums / max(n, 1), 4).tolist(),
+            "top_emotions": emotion_rows(labels, translated_labels, self.label_counts, self.prob_sums, n, top),
+        }
+        if self.freq is not None:
+            summary["freq"] = self.freq
+            summary["untimed"] = self.untimed
+            summary["periods"] = [
+                {
+                    "period": period_label(period_id, self.freq),
+                    "classified": count,
+                    "counts": label_counts.tolist(),
+                    "mean_probabilities": np.round(prob_sums / count, 4).tolist(),
+                    "top_emotions": emotion_rows(labels, translated_labels, label_counts, prob_sums, count, top),
+                }
+                for period_id, (count, prob_sums, label_counts) in sorted(self.periods.items())
+            ]
+        return summary
+
+
+def resolve_dataset(name: str, data_dir: Path) -> Path:
+    """Ruta de un dataset (CSV o Parquet) relativa a `data_dir`; no permite salir de ella."""
+    root = Path(data_dir).resolve()
+    path = (root / name).resolve()
+    if not path.is_relative_to(root) or path.suffix not in DATASET_SUFFIXES or not path.is_file():
+        raise FileNotFoundError(f"No existe el dataset {name!r} en {root.name}/ (CSV o Parquet)")
+    return path
+
+
+def _csv_time(value: str):
+    """Marca de tiempo de una celda CSV: epoch (número), texto ISO o None si está vacía."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def iter_dataset(path: Path, text_col: str = "text", time_col: Optional[str] = None,
+                 chunk_size: int = 2048) -> Iterator[Tuple[List[str], Optional[np.ndarray]]]:
+    """
+    Itera (textos, marcas de tiempo o None) de un CSV o Parquet en bloques.
+
+    El CSV se lee con el módulo csv de la biblioteca estándar; Parquet necesita
+    pyarrow (ImportError si no está instalado).
+    """
+    if path.suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        columns = [text_col] + ([time_col] if time_col else [])
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=columns):
+            texts = [text or "" for text in batch.column(0).to_pylist()]
+            yield texts, to_datetimes(batch.column(1).to_numpy(zero_copy_only=False)) if time_col else None
+        return
+
+    with open(path, encoding="utf-8", newline="") as f:
+        reader = csv.DictReader(f)
+        missing = [col for col in (text_col, time_col) if col and col not in (reader.fieldnames or ())]
+        if missing:
+            raise ValueError(f"El dataset no tiene la columna {missing[0]!r}")
+        texts, times = [], []
+        for row in reader:
+            texts.append(row[text_col] or "")
+            if time_col:
+                times.append(_csv_time(row[time_col]))
+            if len(texts) >= chunk_size:
+                yield texts, to_datetimes(times) if time_col else None
+                texts, times = [], []
+        if texts:
+            yield texts, to_datetimes(times) if time_col else None
@@ -0,0 +1,98 @@
+"""
+Benchmark del índice de casi-duplicados (`review_analyzer.similarity`).
+
+Mide, contra la búsqueda exacta por fuerza bruta sobre los mismos vectores:
+- recall@k y consultas/segundo para distintos `nprobe`,
+- recall de pares casi-duplicados plantados al agrupar con `cluster`,
+- tiempo de construcción y tamaño del índice frente a float32.
+
+Por defecto usa vectores sintéticos (temas + ruido + copias con pequeñas
+perturbaciones); con `--embeddings` usa un .npy real (p. ej. BERT_EMBEDDINGS).
+
+Uso:
+    python -m benchmarks.bench_neighbors [--n 50000] [--dim 768] [--nprobe 1 4 16]
+    python -m benchmarks.bench_neighbors --embeddings data/processed/bert_embeddings.npy
+"""
+import argparse
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from review_analyzer.similarity import NeighborIndex, exact_search, normalize, recall_at_k
+
+
+def synthetic_vectors(n, dim, n_topics=200, dup_fraction=0.1, seed=0):
+    """Vectores agrupados por tema más copias ruidosas; retorna (vectores, pares duplicados)."""
+    rng = np.random.default_rng(seed)
+    topics = rng.standard_normal((n_topics, dim)).astype(np.float32)
+    n_dup = int(n * dup_fraction)
+    base = topics[rng.integers(0, n_topics, n - n_dup)] + 0.8 * rng.standard_normal((n - n_dup, dim))
+    sources = rng.integers(0, n - n_dup, n_dup)
+    copies = base[sources] + 0.05 * rng.standard_normal((n_dup, dim))
+    pairs = np.stack([sources, np.arange(n - n_dup, n)], axis=1)
+    return normalize(np.vstack([base, copies])), pairs
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark del índice de vecinos aproximados")
+    parser.add_argument("--embeddings", default=None, help=".npy con embeddings reales")
+    parser.add_argument("--n", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--n-lists", type=int, default=None)
+    parser.add_argument("--nprobe", nargs="+", type=int, default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--threshold", type=float, default=0.95)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(1)
+    if args.embeddings:
+        vectors, pairs = normalize(np.load(args.embeddings, mmap_mode="r")), None
+    else:
+        vectors, pairs = synthetic_vectors(args.n, args.dim)
+    # Consultas fuera del índice
+    query_rows = rng.choice(len(vectors), min(args.queries, len(vectors) // 10), replace=False)
+    in_index = np.setdiff1d(np.arange(len(vectors)), query_rows)
+    base, queries = vectors[in_index], vectors[query_rows]
+    print(f"Vectores: {len(base):,} x {base.shape[1]}  consultas: {len(queries):,}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index, build_seconds = timed(NeighborIndex.create, tmp, base, args.n_lists)
+        _, add_seconds = timed(index.add, base, np.arange(len(base)))
+        index_mb = (index.codes.nbytes + index.scales.nbytes + index.lists.nbytes + index.ids.nbytes) / 2**20
+        print(f"Construcción: centroides {build_seconds:.1f}s + add {add_seconds:.1f}s, "
+              f"{index.meta['n_lists']} listas, {index_mb:.1f} MB (float32: {base.nbytes / 2**20:.1f} MB)")
+
+        (_, exact_rows), exact_seconds = timed(exact_search, base, queries, args.k)
+        exact_qps = len(queries) / exact_seconds
+        print(f"{'exacto':<12} recall@{args.k}=1.000  {exact_qps:>10,.0f} consultas/s")
+
+        for nprobe in args.nprobe:
+            (_, rows), seconds = timed(index.search, queries, args.k, nprobe)
+            qps = len(queries) / seconds
+            print(f"{f'nprobe={nprobe}':<12} recall@{args.k}={recall_at_k(rows, exact_rows):.3f}  "
+                  f"{qps:>10,.0f} consultas/s  ({qps / exact_qps:.1f}x)")
+
+        if pairs is not None:
+            # Posiciones en el índice de los pares plantados (omite los que quedaron como consulta)
+            position = np.full(len(vectors), -1)
+            position[in_index] = np.arange(len(in_index))
+            planted = position[pairs]
+            planted = planted[(planted >= 0).all(axis=1)]
+            labels, seconds = timed(index.cluster, args.threshold)
+            found = (labels[planted[:, 0]] == labels[planted[:, 1]]).mean()
+            print(f"cluster(threshold={args.threshold}): {seconds:.1f}s, "
+                  f"pares duplicados encontrados {found:.3f}, grupos {len(np.unique(labels)):,}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,475 @@
+"""
+Suite de benchmarks reproducible (sin red) del pipeline de clasificación y de datos.
+
+Etapas (cada una en un proceso nuevo, así el pico de RSS es el de la etapa):
+- api: latencia de POST /classify (p50/p95/p99) y textos/s por nivel de
+  concurrencia, con la app en proceso (ASGI), micro-batching y caché desactivada.
+- throughput: textos/s del modelo por tamaño de batch.
+- cleaning: filas/s de `review_analyzer.cleaning` con cada motor.
+- embeddings: filas/s de `EmbeddingEngine.embed` (review_analyzer.dataset).
+- extraction: comentarios/s del extractor contra el stub local de TikTok.
+
+Modelo: por defecto un BERT pequeño con pesos aleatorios (semilla fija), la misma
+arquitectura (BertForSequenceClassification) y las mismas 28 etiquetas que
+ZAMORAPJ/feeltrack-model, con un tokenizer WordPiece entrenado sobre el propio
+dataset. Sirve para comparar commits en una misma máquina, no como latencia de
+producción; con --model se mide un modelo real (p. ej. api/model).
+
+Los textos se muestrean (semilla fija) de FINAL_PROCESSED_DATA_PATH. El resultado
+se guarda en benchmarks/results/<fecha>.json. Si existe un baseline (creado en la
+máquina de referencia con --save-baseline) se imprime la variación de cada métrica
+y se marcan las regresiones mayores que --tolerance.
+
+Uso:
+    python -m benchmarks.suite [--stages api throughput] [--samples 512] [--threads 1]
+    python -m benchmarks.suite --save-baseline
+    python -m benchmarks.suite --fail-on-regression --tolerance 0.15
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+from review_analyzer.config import FINAL_PROCESSED_DATA_PATH, PROJ_ROOT
+
+BENCHMARKS_DIR = PROJ_ROOT / "benchmarks"
+RESULTS_DIR = BENCHMARKS_DIR / "results"
+BASELINE_PATH = BENCHMARKS_DIR / "baseline.json"
+STAGES = ("api", "throughput", "cleaning", "embeddings", "extraction")
+
+
+# ===== Datos y modelo =====
+def load_texts(path, text_col="text"):
+    """Textos no vacíos del dataset, en orden."""
+    import pandas as pd
+
+    texts = pd.read_csv(path, usecols=[text_col])[text_col].dropna().astype(str)
+    return texts[texts.str.strip() != ""].tolist()
+
+
+def sample_texts(texts, n, seed=0):
+    """Muestra de `n` textos (con reemplazo si el dataset es más chico)."""
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(texts), n, replace=n > len(texts))
+    return [texts[i] for i in rows]
+
+
+def build_stand_in_model(output_dir, texts, hidden_size=128, layers=2, vocab_size=8000, max_length=512, seed=0):
+    """
+    Guarda en `output_dir` un BertForSequenceClassification pequeño con pesos
+    aleatorios (semilla fija) y las etiquetas de feeltrack-model, más un tokenizer
+    WordPiece cased entrenado sobre `texts`.
+    """
+    import torch
+    from tokenizers import BertWordPieceTokenizer
+    from transformers import BertConfig, BertForSequenceClassification, BertTokenizerFast
+
+    from review_analyzer.modeling.inference import LABEL_TRANSLATIONS
+
+    output_dir = str(output_dir)
+    wordpiece = BertWordPieceTokenizer(lowercase=False, strip_accents=False)
+    wordpiece.train_from_iterator(texts, vocab_size=vocab_size, min_frequency=2, show_progress=False)
+    wordpiece.save_model(output_dir)
+    tokenizer = BertTokenizerFast(os.path.join(output_dir, "vocab.txt"), do_lower_case=False,
+                                  strip_accents=False, model_max_length=max_length)
+    tokenizer.save_pretrained(output_dir)
+
+    labels = list(LABEL_TRANSLATIONS)
+    config = BertConfig(
+        vocab_size=tokenizer.vocab_size,
+        hidden_size=hidden_size,
+        num_hidden_layers=layers,
+        num_attention_heads=max(1, hidden_size // 64),
+        intermediate_size=4 * hidden_size,
+        max_position_embeddings=max_length,
+        num_labels=len(labels),
+        id2label=dict(enumerate(labels)),
+        label2id={label: i for i, label in enumerate(labels)},
+        problem_type="multi_label_classification",
+    )
+    torch.manual_seed(seed)
+    BertForSequenceClassification(config).save_pretrained(output_dir)
+    return output_dir
+
+
+# ===== Medición =====
+def peak_rss_mb():
+    """
+    Pico de memoria residente del proceso actual. En Linux se lee VmHWM: ru_maxrss
+    conserva el pico del proceso padre anterior al exec del hijo (spawn).
+    """
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 2**10, 1)
+    except OSError:
+        pass
+    # ru_maxrss: KB en Linux, bytes en macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+
+def latency_stats(seconds):
+    """Percentiles y media de latencias en milisegundos."""
+    ms = np.asarray(seconds) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {"p50_ms": round(p50, 2), "p95_ms": round(p95, 2), "p99_ms": round(p99, 2),
+            "mean_ms": round(float(ms.mean()), 2)}
+
+
+def set_threads(threads):
+    import torch
+
+    torch.set_num_threads(threads)
+
+
+def stage_api(config):
+    os.environ.update({
+        "MODEL_PATH": config["model"],
+        "INFERENCE_BACKEND": config["backend"],
+        "SERVING_MODE": "teacher",
+        "MODEL_MAX_LENGTH": str(config["max_length"]),
+        "CACHE_MAX_ITEMS": "0",
+        "CACHE_SQLITE_PATH": "",
+        "POSTS_SQLITE_PATH": "",
+    })
+    set_threads(config["threads"])
+    import api.main as server
+
+    return asyncio.run(_measure_api(server, config))
+
+
+async def _measure_api(server, config):
+    import httpx
+
+    texts, per_request = config["texts"], config["texts_per_request"]
+
+    async def load(client, concurrency):
+        next_request = itertools.count()
+        latencies = []
+
+        async def worker():
+            while (i := next(next_request)) < config["requests"]:
+                start = (i * per_request) % len(texts)
+                batch = (texts[start:] + texts)[:per_request]
+                t0 = time.perf_counter()
+                response = await client.post("/classify", json={"texts": batch})
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - t0
+        return {
+            "concurrency": concurrency,
+            "requests": len(latencies),
+            **latency_stats(latencies),
+            "requests_per_s": round(len(latencies) / elapsed, 2),
+            "texts_per_s": round(len(latencies) * per_request / elapsed, 1),
+        }
+
+    async with server.app.router.lifespan_context(server.app):
+        while not server.model_ready:
+            if server.startup_error:
+                raise RuntimeError(server.startup_error)
+            await asyncio.sleep(0.05)
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            await client.post("/classify", json={"texts": texts[:per_request]})
+            levels = {f"c{c}": await load(client, c) for c in config["concurrency"]}
+    return {"texts_per_request": per_request, "levels": levels}
+
+
+def stage_throughput(config):
+    set_threads(config["threads"])
+    from transformers import AutoTokenizer
+
+    from review_analyzer.modeling.backends import load_backend
+    from review_analyzer.modeling.inference import predict_probs
+
+    backend = load_backend(config["backend"], config["model"])
+    tokenizer = AutoTokenizer.from_pretrained(config["model"])
+    texts, max_length = config["texts"], config["max_length"]
+    predict_probs(backend, tokenizer, texts[:8], max_length=max_length)
+
+    batches = {}
+    for batch_size in config["batch_sizes"]:
+        t0 = time.perf_counter()
+        for start in range(0, len(texts), batch_size):
+            # Presupuesto de tokens holgado: cada bloque es una sola pasada forward
+            predict_probs(backend, tokenizer, texts[start:start + batch_size],
+                          max_length=max_length, max_batch_tokens=batch_size * max_length)
+        elapsed = time.perf_counter() - t0
+        batches[f"b{batch_size}"] = {"batch_size": batch_size, "texts_per_s": round(len(texts) / elapsed, 1)}
+    return {"texts": len(texts), "batches": batches}
+
+
+def stage_cleaning(config):
+    from review_analyzer.cleaning import ENGINES, clean_texts
+
+    texts = (config["texts"] * (config["cleaning_rows"] // len(config["texts"]) + 1))[:config["cleaning_rows"]]
+    engines = {}
+    for engine in ENGINES:
+        clean_texts(texts[:1000], engine=engine)
+        t0 = time.perf_counter()
+        clean_texts(texts, engine=engine)
+        engines[engine] = {"rows_per_s": round(len(texts) / (time.perf_counter() - t0), 1)}
+    return {"rows": len(texts), "engines": engines}
+
+
+def stage_embeddings(config):
+    set_threads(config["threads"])
+    from review_analyzer.dataset import EmbeddingEngine
+
+    engine = EmbeddingEngine(config["model"], pooling="cls", max_length=config["max_length"], device="cpu")
+    texts = config["texts"]
+    engine.embed(texts[:8])
+    t0 = time.perf_counter()
+    engine.embed(texts)
+    return {"rows": len(texts), "dim": engine.dim, "rows_per_s": round(len(texts) / (time.perf_counter() - t0), 1)}
+
+
+def stage_extraction(config):
+    return asyncio.run(_measure_extraction(config))
+
+
+async def _measure_extraction(config):
+    from aiohttp import web
+
+    from extraction.apis.tiktok_stub import create_app
+    from extraction.extract_comments import TikTokCommentCrawler, store_sink
+
+    runner = web.AppRunner(create_app(total_comments=config["comments_per_video"]))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    urls = [f"https://www.tiktok.com/@benchmark/video/{7400000000000000000 + i}" for i in range(config["videos"])]
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            crawler = TikTokCommentCrawler(
+                store_sink(os.path.join(tmp, "store")),
+                base_url=f"http://127.0.0.1:{port}",
+                global_rate=1e6,
+                per_host_rate=1e6,
+                max_concurrent_videos=config["videos"],
+                max_comments=config["comments_per_video"],
+                checkpoint_dir=os.path.join(tmp, "checkpoints"),
+            )
+            # El extractor imprime el progreso de cada página
+            with contextlib.redirect_stdout(io.StringIO()):
+                async with crawler:
+                    t0 = time.perf_counter()
+                    counts = await crawler.crawl(urls)
+                    elapsed = time.perf_counter() - t0
+    finally:
+        await runner.cleanup()
+
+    comments = sum(count for count in counts.values() if isinstance(count, int))
+    return {"videos": len(urls), "comments": comments, "comments_per_s": round(comments / elapsed, 1)}
+
+
+STAGE_FUNCTIONS = {
+    "api": stage_api,
+    "throughput": stage_throughput,
+    "cleaning": stage_cleaning,
+    "embeddings": stage_embeddings,
+    "extraction": stage_extraction,
+}
+
+
+def _run_in_child(name, config):
+    t0 = time.perf_counter()
+    result = STAGE_FUNCTIONS[name](config)
+    result["wall_s"] = round(time.perf_counter() - t0, 2)
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def run_stage(name, config):
+    """Ejecuta una etapa en un proceso nuevo (spawn) y retorna sus métricas."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(_run_in_child, name, config).result()
+
+
+# ===== Comparación con el baseline =====
+def flatten_metrics(stages, prefix=""):
+    """{"api.levels.c4.p95_ms": valor, ...} solo con las métricas comparables."""
+    flat = {}
+    for key, value in stages.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten_metrics(value, f"{name}."))
+        elif isinstance(value, (int, float)) and metric_direction(key) != 0:
+            flat[name] = value
+    return flat
+
+
+def metric_direction(key):
+    """+1 si más es mejor, -1 si menos es mejor, 0 si no se compara."""
+    if key.endswith("_per_s"):
+        return 1
+    if key.endswith("_ms") or key == "peak_rss_mb":
+        return -1
+    return 0
+
+
+def compare(results, baseline, tolerance=0.1):
+    """
+    Variación relativa de cada métrica respecto al baseline.
+
+    Retorna una lista de (métrica, baseline, actual, cambio, regresión) donde
+    `cambio` es positivo cuando la métrica empeora.
+    """
+    current = flatten_metrics(results["stages"])
+    previous = flatten_metrics(baseline["stages"])
+    rows = []
+    for name in sorted(current.keys() & previous.keys()):
+        old, new = previous[name], current[name]
+        if not old:
+            continue
+        worse = -metric_direction(name.rsplit(".", 1)[-1]) * (new - old) / old
+        rows.append((name, old, new, worse, worse > tolerance))
+    return rows
+
+
+def environment():
+    import torch
+    import transformers
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJ_ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "torch": torch.__version__,
+        "transformers": transformers.__version__,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Suite de benchmarks del pipeline (sin red)")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--data", default=str(FINAL_PROCESSED_DATA_PATH))
+    parser.add_argument("--text-col", default="text")
+    parser.add_argument("--samples", type=int, default=512, help="Textos muestreados del dataset")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--model", default=None, help="Modelo real en lugar del modelo sustituto")
+    parser.add_argument("--backend", choices=("torch", "torch-int8"), default="torch")
+    parser.add_argument("--hidden-size", type=int, default=128)
+    parser.add_argument("--layers", type=int, default=2)
+    parser.add_argument("--max-length", type=int, default=128)
+    parser.add_argument("--threads", type=int, default=1, help="Hilos de torch (1 = más estable)")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=64, help="Peticiones por nivel de concurrencia")
+    parser.add_argument("--texts-per-request", type=int, default=8)
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8, 32, 64])
+    parser.add_argument("--cleaning-rows", type=int, default=200_000)
+    parser.add_argument("--videos", type=int, default=4)
+    parser.add_argument("--comments-per-video", type=int, default=500)
+    parser.add_argument("--output", default=None, help="JSON de resultados (por defecto benchmarks/results/)")
+    parser.add_argument("--baseline", default=str(BASELINE_PATH))
+    parser.add_argument("--save-baseline", action="store_true", help="Guarda estos resultados como baseline")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Empeoramiento relativo tolerado")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args(argv)
+
+    all_texts = load_texts(args.data, args.text_col)
+    texts = sample_texts(all_texts, args.samples, args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model = args.model or build_stand_in_model(
+            tmp, all_texts, hidden_size=args.hidden_size, layers=args.layers,
+            max_length=max(args.max_length, 128), seed=args.seed,
+        )
+        config = {
+            "model": model,
+            "backend": args.backend,
+            "max_length": args.max_length,
+            "threads": args.threads,
+            "texts": texts,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "texts_per_request": args.texts_per_request,
+            "batch_sizes": args.batch_sizes,
+            "cleaning_rows": args.cleaning_rows,
+            "videos": args.videos,
+            "comments_per_video": args.comments_per_video,
+        }
+        stages = {}
+        for name in args.stages:
+            print(f"[{name}] ...", flush=True)
+            stages[name] = run_stage(name, config)
+            print(f"[{name}] {json.dumps(stages[name], ensure_ascii=False)}")
+
+    results = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": environment(),
+        "settings": {
+            **{k: v for k, v in config.items() if k not in ("texts", "model")},
+            "model": args.model or "stand-in",
+            "stand_in": None if args.model else {"hidden_size": args.hidden_size, "layers": args.layers},
+            "data": os.path.relpath(args.data, PROJ_ROOT),
+            "samples": args.samples,
+            "seed": args.seed,
+        },
+        "stages": stages,
+    }
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"Resultados en {output}")
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"Baseline guardado en {baseline_path}")
+        return 0
+    if not baseline_path.exists():
+        print(f"Sin baseline ({baseline_path}); crear uno con --save-baseline")
+        return 0
+
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    if baseline.get("settings") != results["settings"]:
+        print("Aviso: el baseline se midió con otros parámetros; la comparación es orientativa")
+    if baseline["environment"].get("machine") != results["environment"]["machine"] or \
+            baseline["environment"].get("cpu_count") != results["environment"]["cpu_count"]:
+        print("Aviso: el baseline se midió en otra máquina")
+
+    rows = compare(results, baseline, args.tolerance)
+    print(f"\nComparación con {baseline_path.name} (commit {baseline['environment'].get('commit')}):")
+    for name, old, new, worse, regression in rows:
+        verdict = "peor" if worse > 0 else "mejor" if worse < 0 else "igual"
+        print(f"{'REGRESIÓN' if regression else '':<10} {name:<40} {old:>12,.2f} -> {new:>12,.2f} "
+              f"({(new - old) / old:+.1%}, {verdict})")
+    regressions = sum(row[4] for row in rows)
+    print(f"{regressions} regresiones (tolerancia {args.tolerance:.0%})")
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,16 @@
 import requests
-import pandas as pd
 import time
 import random
 from datetime import datetime
 from urllib.parse import urlparse
 import os
+import sys
+
+try:
+    from extraction.storage import CommentStore
+except ModuleNotFoundError:  # ejecutado como script: python extraction/apis/tiktok-comments.py
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+    from extraction.storage import CommentStore
 
 # ===== CONFIGURACIÓN =====
 CONFIG = {
@@ -16,6 +22,7 @@ CONFIG = {
     "DELAY_BETWEEN_REQUESTS": 1.5,
     "MAX_COMMENTS": 10000,
     "OUTPUT_DIR": "data/raw",
+    "STORE_DIR": "data/raw/tiktok",
     "OUTPUT_FORMATS": ["csv", "json"],
     "USER_AGENTS": [
         'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36',
@@ -91,6 +98,7 @@ def parse_comments(api_data: dict, current_cursor: int) -> dict:
     for comment in api_data['comments']:
         try:
             parsed_comments.append({
+                'cid': comment.get('cid'),
                 'user': comment['user']['nickname'],
                 'comment': comment.get('text', '') or comment.get('share_info', {}).get('desc', ''),
                 'time': format_timestamp(comment.get('create_time', '')),
@@ -106,29 +114,24 @@ def parse_comments(api_data: dict, current_cursor: int) -> dict:
         'cursor': api_data.get('cursor', current_cursor + 20)
     }
 
-def save_data(data: list, video_id: str, suffix: str = None) -> None:
-    """Guarda datos con timestamp en el nombre."""
+def save_data(store: CommentStore, comments: list) -> int:
+    """Agrega al store del video solo los comentarios nuevos (costo O(página))."""
+    return store.append(comments)
+
+def export_data(store: CommentStore, video_id: str) -> None:
+    """Exporta el store consolidado a un único archivo por formato."""
     os.makedirs(CONFIG["OUTPUT_DIR"], exist_ok=True)
-    
-    # Formato: YYYYMMDD_HHMMSS
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename_base = f"tiktok_comments_{video_id}_{timestamp}"
-    filename_base += f"_{suffix}" if suffix else ""
-    
-    df = pd.DataFrame(data)
     for fmt in CONFIG["OUTPUT_FORMATS"]:
-        filename = os.path.join(CONFIG["OUTPUT_DIR"], f"{filename_base}.{fmt}")
+        filename = os.path.join(CONFIG["OUTPUT_DIR"], f"tiktok_comments_{video_id}.{fmt}")
         try:
-            if fmt == 'csv':
-                df.to_csv(filename, index=False, encoding='utf-8')
-            else:
-                df.to_json(filename, orient='records', indent=4, force_ascii=False)
+            store.export(filename, fmt)
             print(f"Archivo guardado: {filename}")
         except Exception as e:
             print(f"Error al guardar {fmt}: {str(e)}")
 
 # ===== EJECUCIÓN PRINCIPAL =====
 def main():
+    store = None
     try:
         video_id = extract_video_id(CONFIG["POST_URL"])
         username = CONFIG["POST_URL"].split('@')[1].split('/')[0]
@@ -136,11 +139,12 @@ def main():
         print(f"\n=== Iniciando extracción ===")
         print(f"Video ID: {video_id}\nUsuario: @{username}\n")
         
-        all_comments = []
+        store = CommentStore(CONFIG["STORE_DIR"], video_id)
+        new_comments = 0
         cursor = 0
         has_more = True
         
-        while has_more and len(all_comments) < CONFIG["MAX_COMMENTS"]:
+        while has_more and new_comments < CONFIG["MAX_COMMENTS"]:
             api_data = make_api_request(video_id, cursor, username)
             if not api_data:
                 break
@@ -149,15 +153,12 @@ def main():
             if not parsed_data:
                 break
                 
-            all_comments.extend(parsed_data['comments'])
+            # Guardado incremental: solo las filas nuevas de esta página
+            new_comments += save_data(store, parsed_data['comments'])
             cursor = parsed_data['cursor']
             has_more = parsed_data['has_more'] == 1
             
-            print(f"Comentarios: {len(all_comments)} | Cursor: {cursor}")
-            
-            # Guardado parcial opcional (comentar si no se necesita)
-            if len(all_comments) % 100 == 0:
-                save_data(all_comments, video_id, f"partial_{len(all_comments)}")
+            print(f"Comentarios nuevos: {new_comments} | Total en store: {len(store)} | Cursor: {cursor}")
             
             time.sleep(CONFIG["DELAY_BETWEEN_REQUESTS"] + random.uniform(0, 1))
             
@@ -166,10 +167,10 @@ def main():
     except Exception as e:
         print(f"\nError: {str(e)}")
     finally:
-        if all_comments:
-            save_data(all_comments, video_id)  # Guardado final con timestamp
+        if store is not None and len(store):
+            export_data(store, video_id)
             print(f"\n=== Resumen ===")
-            print(f"Total comentarios: {len(all_comments)}")
+            print(f"Total comentarios: {len(store)}")
         else:
             print("\nNo se extrajeron comentarios.")
 
@@ -0,0 +1,76 @@
+"""
+Servidor stub de la API de comentarios de TikTok para pruebas sin red.
+
+Genera comentarios y respuestas deterministas por video, con paginación por
+cursor igual que la API real. Opcionalmente falla una fracción de peticiones
+para ejercitar los reintentos del extractor.
+
+Uso:
+    python -m extraction.apis.tiktok_stub --port 8765 --comments 250 --fail-rate 0.1
+"""
+import argparse
+import random
+
+from aiohttp import web
+
+
+def make_comment(video_id, index, parent=None, replies=0):
+    cid = f"{video_id}{'-' + parent if parent else ''}-{index}"
+    return {
+        "cid": cid,
+        "text": f"comentario {index} del video {video_id}" + (f" (respuesta a {parent})" if parent else ""),
+        "create_time": 1728426278 + index * 60,
+        "digg_count": (index * 7) % 50,
+        "reply_comment_total": replies,
+        "user": {"nickname": f"usuario_{index % 97}"},
+    }
+
+
+def page(items, cursor, count):
+    chunk = items[cursor:cursor + count]
+    return {"comments": chunk, "cursor": cursor + len(chunk), "has_more": int(cursor + len(chunk) < len(items))}
+
+
+def create_app(total_comments=250, replies_every=10, replies_per_comment=3, fail_rate=0.0, seed=0):
+    rng = random.Random(seed)
+
+    def maybe_fail():
+        if fail_rate and rng.random() < fail_rate:
+            raise web.HTTPServiceUnavailable()
+
+    async def comment_list(request):
+        maybe_fail()
+        video_id = request.query["aweme_id"]
+        cursor = int(request.query.get("cursor", 0))
+        count = int(request.query.get("count", 20))
+        items = [make_comment(video_id, i, replies=replies_per_comment if i % replies_every == 0 else 0)
+                 for i in range(total_comments)]
+        return web.json_response(page(items, cursor, count))
+
+    async def reply_list(request):
+        maybe_fail()
+        video_id = request.query["item_id"]
+        parent = request.query["comment_id"]
+        cursor = int(request.query.get("cursor", 0))
+        count = int(request.query.get("count", 20))
+        items = [make_comment(video_id, i, parent=parent) for i in range(replies_per_comment)]
+        return web.json_response(page(items, cursor, count))
+
+    app = web.Application()
+    app.router.add_get("/api/comment/list/", comment_list)
+    app.router.add_get("/api/comment/list/reply/", reply_list)
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stub local de la API de comentarios de TikTok")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--comments", type=int, default=250)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+    web.run_app(create_app(args.comments, fail_rate=args.fail_rate), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
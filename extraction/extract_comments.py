@@ -0,0 +1,324 @@
+"""
+Extractor asíncrono de comentarios de TikTok para varios videos a la vez.
+
+- Un único cliente HTTP con pool de conexiones (aiohttp) para todos los videos.
+- Límite de peticiones global y por host (token bucket).
+- Pagina comentarios principales y respuestas.
+- Guarda un checkpoint por video (cursor y respuestas pendientes) tras cada
+  página, así una extracción interrumpida se reanuda en lugar de reiniciarse.
+
+Uso:
+    python -m extraction.extract_comments URL [URL ...] [--urls-file videos.txt]
+
+Para probar sin red, levantar el stub local y apuntar el extractor a él:
+    python -m extraction.apis.tiktok_stub --port 8765
+    python -m extraction.extract_comments URL --base-url http://127.0.0.1:8765
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from datetime import datetime
+from urllib.parse import urlparse
+
+import aiohttp
+
+from extraction.storage import CommentStore
+
+# ===== CONFIGURACIÓN =====
+CONFIG = {
+    "BASE_URL": "https://www.tiktok.com",
+    "MS_TOKEN": os.getenv("TIKTOK_MS_TOKEN", "TU_MS_TOKEN_ACTUAL"),
+    "X_BOGUS": os.getenv("TIKTOK_X_BOGUS", "TU_X_BOGUS_ACTUAL"),
+    "WEB_ID": os.getenv("TIKTOK_WEB_ID", "7478343844027729413"),
+    "PAGE_SIZE": 20,
+    "MAX_RETRIES": 3,
+    "BACKOFF_SECONDS": 1.5,
+    "GLOBAL_RATE": 4.0,       # peticiones/segundo entre todos los videos
+    "PER_HOST_RATE": 2.0,     # peticiones/segundo por host
+    "MAX_CONCURRENT_VIDEOS": 4,
+    "MAX_COMMENTS": 10000,
+    "FETCH_REPLIES": True,
+    "OUTPUT_DIR": "data/raw/tiktok",
+    "CHECKPOINT_DIR": "data/interim/checkpoints/tiktok",
+    "USER_AGENTS": [
+        'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36',
+        'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36',
+        'Mozilla/5.0 (iPhone; CPU iPhone OS 17_4 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.3.1 Mobile/15E148 Safari/604.1'
+    ]
+}
+
+
+# ===== FUNCIONES AUXILIARES =====
+def extract_video_id(url: str) -> str:
+    """Extrae el ID del video de la URL."""
+    path_parts = urlparse(url).path.split('/')
+    if 'video' not in path_parts:
+        raise ValueError("URL no válida: debe contener '/video/'.")
+    return path_parts[path_parts.index('video') + 1].split('?')[0]
+
+
+def format_timestamp(timestamp) -> str:
+    """Convierte timestamp Unix a fecha legible."""
+    try:
+        return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+    except (TypeError, ValueError, OSError):
+        return "Fecha no disponible"
+
+
+def parse_comment(comment: dict, video_id: str, parent_id=None) -> dict:
+    """
+    Convierte un comentario de la API al formato de fila del extractor.
+
+    Un `cid` nulo o ausente queda vacío (no 'None'): esa fila no pide respuestas
+    y el CommentStore la deduplica por hash de usuario, texto y fecha.
+    """
+    return {
+        'cid': str(comment.get('cid') or ''),
+        'video_id': video_id,
+        'parent_id': parent_id,
+        'user': (comment.get('user') or {}).get('nickname', ''),
+        'comment': comment.get('text', '') or comment.get('share_info', {}).get('desc', ''),
+        'timestamp': comment.get('create_time'),
+        'time': format_timestamp(comment.get('create_time')),
+        'likes': comment.get('digg_count', 0),
+        'reply_count': comment.get('reply_comment_total', 0),
+    }
+
+
+class RateLimiter:
+    """Token bucket asíncrono: `rate` peticiones por segundo con ráfagas de hasta `burst`."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class Checkpoint:
+    """Estado de extracción de un video, persistido como JSON tras cada página."""
+
+    def __init__(self, path: str, video_id: str):
+        self.path = path
+        self.state = {"video_id": video_id, "cursor": 0, "comments_done": False,
+                      "pending_replies": {}, "count": 0}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.state.update(json.load(f))
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.path)
+
+
+# ===== EXTRACTOR =====
+class TikTokCommentCrawler:
+    """
+    Extrae comentarios (y respuestas) de varios videos en paralelo.
+
+    - base_url: raíz de la API (se puede apuntar a un stub local).
+    - sink: función (video_id, filas) que persiste cada página.
+    """
+
+    def __init__(self, sink, base_url=CONFIG["BASE_URL"], global_rate=CONFIG["GLOBAL_RATE"],
+                 per_host_rate=CONFIG["PER_HOST_RATE"], max_concurrent_videos=CONFIG["MAX_CONCURRENT_VIDEOS"],
+                 max_comments=CONFIG["MAX_COMMENTS"], fetch_replies=CONFIG["FETCH_REPLIES"],
+                 checkpoint_dir=CONFIG["CHECKPOINT_DIR"]):
+        self.sink = sink
+        self.base_url = base_url.rstrip("/")
+        self.global_limiter = RateLimiter(global_rate, burst=max(1, int(global_rate)))
+        self.per_host_rate = per_host_rate
+        self.host_limiters = {}
+        self.videos = asyncio.Semaphore(max_concurrent_videos)
+        self.max_comments = max_comments
+        self.fetch_replies = fetch_replies
+        self.checkpoint_dir = checkpoint_dir
+        self.session = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=32, ttl_dns_cache=300)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=30),
+            headers={'accept': '*/*',
+                     'cookie': f'tt_webid_v2={CONFIG["WEB_ID"]}; msToken={CONFIG["MS_TOKEN"]}'},
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    def _host_limiter(self, url: str) -> RateLimiter:
+        host = urlparse(url).netloc
+        if host not in self.host_limiters:
+            self.host_limiters[host] = RateLimiter(self.per_host_rate, burst=max(1, int(self.per_host_rate)))
+        return self.host_limiters[host]
+
+    async def fetch_json(self, path: str, params: dict):
+        """GET con límite de tasa y reintentos con backoff exponencial."""
+        url = f"{self.base_url}{path}"
+        params = {**params, 'aid': 1988, 'web_id': CONFIG["WEB_ID"],
+                  'msToken': CONFIG["MS_TOKEN"], 'X-Bogus': CONFIG["X_BOGUS"]}
+
+        for attempt in range(CONFIG["MAX_RETRIES"] + 1):
+            await self.global_limiter.acquire()
+            await self._host_limiter(url).acquire()
+            try:
+                async with self.session.get(
+                    url, params=params, headers={'user-agent': random.choice(CONFIG["USER_AGENTS"])}
+                ) as response:
+                    response.raise_for_status()
+                    return await response.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                if attempt == CONFIG["MAX_RETRIES"]:
+                    print(f"Error definitivo en {path} ({params.get('aweme_id') or params.get('item_id')}): {e}")
+                    return None
+                await asyncio.sleep(CONFIG["BACKOFF_SECONDS"] * 2 ** attempt + random.uniform(0, 1))
+
+    async def crawl_replies(self, video_id: str, comment_id: str, cursor: int, checkpoint: Checkpoint) -> None:
+        has_more = True
+        while has_more:
+            data = await self.fetch_json('/api/comment/list/reply/', {
+                'item_id': video_id, 'comment_id': comment_id,
+                'cursor': cursor, 'count': CONFIG["PAGE_SIZE"],
+            })
+            if not data or not data.get('comments'):
+                break
+            rows = [parse_comment(c, video_id, parent_id=comment_id) for c in data['comments']]
+            self.sink(video_id, rows)
+
+            cursor = data.get('cursor', cursor + CONFIG["PAGE_SIZE"])
+            has_more = data.get('has_more', 0) == 1
+            checkpoint.state["count"] += len(rows)
+            checkpoint.state["pending_replies"][comment_id] = cursor
+            checkpoint.save()
+
+        checkpoint.state["pending_replies"].pop(comment_id, None)
+        checkpoint.save()
+
+    async def crawl_video(self, url: str) -> int:
+        video_id = extract_video_id(url)
+        checkpoint = Checkpoint(os.path.join(self.checkpoint_dir, f"{video_id}.json"), video_id)
+        state = checkpoint.state
+
+        async with self.videos:
+            if state["count"]:
+                print(f"[{video_id}] Reanudando: {state['count']} comentarios, cursor {state['cursor']}")
+
+            # Respuestas que quedaron a medias en una ejecución anterior
+            for comment_id, cursor in list(state["pending_replies"].items()):
+                await self.crawl_replies(video_id, comment_id, cursor, checkpoint)
+
+            while not state["comments_done"] and state["count"] < self.max_comments:
+                data = await self.fetch_json('/api/comment/list/', {
+                    'aweme_id': video_id, 'cursor': state["cursor"], 'count': CONFIG["PAGE_SIZE"],
+                })
+                if not data or not data.get('comments'):
+                    break
+
+                rows = [parse_comment(c, video_id) for c in data['comments']]
+                self.sink(video_id, rows)
+                state["count"] += len(rows)
+                state["cursor"] = data.get('cursor', state["cursor"] + CONFIG["PAGE_SIZE"])
+                state["comments_done"] = data.get('has_more', 0) != 1
+
+                if self.fetch_replies:
+                    for row in rows:
+                        # Sin cid no hay a qué comentario pedirle las respuestas
+                        if row['reply_count'] and row['cid']:
+                            state["pending_replies"][row['cid']] = 0
+                checkpoint.save()
+                print(f"[{video_id}] Comentarios: {state['count']} | Cursor: {state['cursor']}")
+
+                replies = list(state["pending_replies"].items())
+                await asyncio.gather(*(self.crawl_replies(video_id, cid, cursor, checkpoint)
+                                       for cid, cursor in replies))
+
+        return state["count"]
+
+    async def crawl(self, urls) -> dict:
+        counts = await asyncio.gather(*(self.crawl_video(url) for url in urls), return_exceptions=True)
+        return dict(zip(urls, counts))
+
+
+def store_sink(output_dir: str):
+    """Sink que agrega cada página al store append-only (deduplicado) del video."""
+    stores = {}
+
+    def write(video_id, rows):
+        if video_id not in stores:
+            stores[video_id] = CommentStore(output_dir, video_id)
+        stores[video_id].append(rows)
+
+    return write
+
+
+# ===== EJECUCIÓN PRINCIPAL =====
+async def run(urls, args) -> dict:
+    async with TikTokCommentCrawler(
+        store_sink(args.output_dir),
+        base_url=args.base_url,
+        global_rate=args.rate,
+        per_host_rate=args.per_host_rate,
+        max_concurrent_videos=args.concurrency,
+        max_comments=args.max_comments,
+        fetch_replies=not args.no_replies,
+        checkpoint_dir=args.checkpoint_dir,
+    ) as crawler:
+        return await crawler.crawl(urls)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extracción asíncrona de comentarios de TikTok")
+    parser.add_argument("urls", nargs="*", help="URLs de videos de TikTok")
+    parser.add_argument("--urls-file", help="Archivo con una URL por línea")
+    parser.add_argument("--base-url", default=CONFIG["BASE_URL"])
+    parser.add_argument("--rate", type=float, default=CONFIG["GLOBAL_RATE"])
+    parser.add_argument("--per-host-rate", type=float, default=CONFIG["PER_HOST_RATE"])
+    parser.add_argument("--concurrency", type=int, default=CONFIG["MAX_CONCURRENT_VIDEOS"])
+    parser.add_argument("--max-comments", type=int, default=CONFIG["MAX_COMMENTS"])
+    parser.add_argument("--no-replies", action="store_true")
+    parser.add_argument("--output-dir", default=CONFIG["OUTPUT_DIR"])
+    parser.add_argument("--checkpoint-dir", default=CONFIG["CHECKPOINT_DIR"])
+    args = parser.parse_args(argv)
+
+    urls = list(args.urls)
+    if args.urls_file:
+        with open(args.urls_file, encoding="utf-8") as f:
+            urls.extend(line.strip() for line in f if line.strip())
+    if not urls:
+        parser.error("indica al menos una URL o --urls-file")
+
+    print(f"\n=== Iniciando extracción de {len(urls)} video(s) ===")
+    try:
+        counts = asyncio.run(run(urls, args))
+    except KeyboardInterrupt:
+        print("\n¡Extracción detenida manualmente! Se reanudará desde el último checkpoint.")
+        return 1
+
+    print("\n=== Resumen ===")
+    for url, count in counts.items():
+        print(f"{url}: {count if not isinstance(count, Exception) else f'error ({count})'}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
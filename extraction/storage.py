@@ -0,0 +1,159 @@
+"""
+Almacenamiento incremental (append-only) de comentarios extraídos.
+
+Cada video tiene una carpeta con:
+- segment-00001.jsonl, segment-00002.jsonl, ...: filas nuevas, solo se agregan.
+- ids.txt: ids ya guardados (uno por línea), para deduplicar sin releer segmentos.
+- manifest.json: segmentos, total de filas y offset de cada consumidor.
+
+Guardar una página cuesta O(filas de la página) y los pasos posteriores pueden
+leer solo las filas nuevas desde su última ejecución con `read_new`.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+
+
+def comment_id(row: dict, id_key: str = "cid") -> str:
+    """Id del comentario; si la API no lo trae, hash de usuario + texto + fecha."""
+    value = row.get(id_key)
+    if value:
+        return str(value)
+    payload = f"{row.get('user', '')}\x00{row.get('comment', '')}\x00{row.get('time', '')}"
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class CommentStore:
+    """
+    Store append-only y deduplicado por id para los comentarios de un video.
+
+    - root: carpeta base (por ejemplo data/raw/tiktok).
+    - video_id: id del video; sus archivos viven en root/video_id.
+    - segment_max_rows: filas por segmento antes de abrir uno nuevo.
+    """
+
+    def __init__(self, root, video_id: str, id_key: str = "cid", segment_max_rows: int = 50000):
+        self.dir = Path(root) / str(video_id)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.video_id = str(video_id)
+        self.id_key = id_key
+        self.segment_max_rows = segment_max_rows
+
+        self.manifest_path = self.dir / "manifest.json"
+        self.ids_path = self.dir / "ids.txt"
+        self.manifest = {"video_id": self.video_id, "segments": [], "total_rows": 0, "consumers": {}}
+        if self.manifest_path.exists():
+            self.manifest.update(json.loads(self.manifest_path.read_text(encoding="utf-8")))
+
+        self.seen = set()
+        if self.ids_path.exists():
+            with open(self.ids_path, encoding="utf-8") as f:
+                self.seen.update(line.rstrip("\n") for line in f if line.strip())
+        self._recover()
+
+    def _recover(self) -> None:
+        """Alinea manifiesto e ids con el último segmento si una escritura quedó a medias."""
+        if not self.manifest["segments"]:
+            return
+        last = self.manifest["segments"][-1]
+        path = self.dir / last["name"]
+        if not path.exists():
+            return
+        with open(path, encoding="utf-8") as f:
+            lines = [line for line in f if line.strip()]
+        if len(lines) == last["rows"]:
+            return
+
+        missing_ids = [cid for cid in (comment_id(json.loads(line), self.id_key) for line in lines)
+                       if cid not in self.seen]
+        if missing_ids:
+            self.seen.update(missing_ids)
+            with open(self.ids_path, "a", encoding="utf-8") as f:
+                f.writelines(cid + "\n" for cid in missing_ids)
+        self.manifest["total_rows"] += len(lines) - last["rows"]
+        last["rows"] = len(lines)
+        self._save_manifest()
+
+    def _save_manifest(self) -> None:
+        tmp = self.manifest_path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(self.manifest, indent=2), encoding="utf-8")
+        os.replace(tmp, self.manifest_path)
+
+    def _current_segment(self) -> dict:
+        segments = self.manifest["segments"]
+        if not segments or segments[-1]["rows"] >= self.segment_max_rows:
+            segments.append({"name": f"segment-{len(segments) + 1:05d}.jsonl", "rows": 0})
+        return segments[-1]
+
+    def __len__(self) -> int:
+        return self.manifest["total_rows"]
+
+    def append(self, rows) -> int:
+        """Agrega las filas cuyo id no se haya visto; devuelve cuántas se escribieron."""
+        new_rows, new_ids = [], []
+        for row in rows:
+            cid = comment_id(row, self.id_key)
+            if cid in self.seen:
+                continue
+            self.seen.add(cid)
+            new_rows.append({**row, self.id_key: cid})
+            new_ids.append(cid)
+
+        written = 0
+        while written < len(new_rows):
+            segment = self._current_segment()
+            take = min(self.segment_max_rows - segment["rows"], len(new_rows) - written)
+            with open(self.dir / segment["name"], "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(row, ensure_ascii=False) + "\n"
+                             for row in new_rows[written:written + take])
+            segment["rows"] += take
+            self.manifest["total_rows"] += take
+            written += take
+
+        if new_ids:
+            with open(self.ids_path, "a", encoding="utf-8") as f:
+                f.writelines(cid + "\n" for cid in new_ids)
+            self._save_manifest()
+        return len(new_rows)
+
+    def read(self, start: int = 0):
+        """Itera las filas desde la posición global `start` (0 = todas)."""
+        offset = 0
+        for segment in self.manifest["segments"]:
+            if offset + segment["rows"] <= start:
+                offset += segment["rows"]
+                continue
+            with open(self.dir / segment["name"], encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    if offset >= start:
+                        yield json.loads(line)
+                    offset += 1
+
+    def read_new(self, consumer: str):
+        """
+        Filas agregadas desde la última vez que `consumer` confirmó su lectura.
+
+        Retorna (filas, offset); llamar a `commit(consumer, offset)` al terminar.
+        """
+        start = self.manifest["consumers"].get(consumer, 0)
+        return list(self.read(start)), self.manifest["total_rows"]
+
+    def commit(self, consumer: str, offset: int) -> None:
+        self.manifest["consumers"][consumer] = offset
+        self._save_manifest()
+
+    def to_dataframe(self, start: int = 0):
+        import pandas as pd
+
+        return pd.DataFrame(list(self.read(start)))
+
+    def export(self, path, fmt: str = "csv") -> None:
+        """Exporta todas las filas a un único archivo (CSV o JSON)."""
+        df = self.to_dataframe()
+        if fmt == "csv":
+            df.to_csv(path, index=False, encoding="utf-8")
+        else:
+            df.to_json(path, orient="records", force_ascii=False)
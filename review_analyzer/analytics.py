@@ -0,0 +1,526 @@
+"""
+Agregaciones de emociones por publicación, separadas de los gráficos.
+
+Cada función recibe un DataFrame o la ruta de un CSV/Parquet, lee solo las
+columnas que necesita y devuelve una tabla pequeña (pandas, formato largo)
+que consumen `plots.py`, el reporte JSON y la API:
+
+- `class_rates`: conteo, total y tasa de cada clase por grupo (un solo groupby).
+- `group_means`: medias (opcionalmente ponderadas) de columnas numéricas por grupo.
+- `emotion_rates_over_time`: tasa de cada emoción por periodo (día/semana/mes/año).
+- `weighted_emotion_shares`: participación de cada emoción ponderada por likes.
+- `term_frequencies`: términos más frecuentes por clase, sin unir el texto en un string.
+
+Las emociones se indican con `class_col` (una columna categórica, p. ej.
+bert_sentiment) o con `label_cols` (columnas 0/1 o probabilidades multi-etiqueta,
+p. ej. las de una corrida de `modeling.predict`).
+
+Motores:
+- "pandas": en memoria (por defecto).
+- "polars": LazyFrame con lectura perezosa del archivo (out-of-core).
+- "duckdb": SQL sobre el archivo, sin cargarlo completo en memoria.
+
+Uso:
+    python -m review_analyzer.analytics --data data/processed/final_clean_dataset.csv \\
+        --class-col bert_sentiment --time-col timestamp --freq M --engine duckdb
+"""
+import argparse
+import json
+import re
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from review_analyzer.config import ANALYTICS_DIR, FINAL_PROCESSED_DATA_PATH
+from review_analyzer.modeling.inference import LABEL_TRANSLATIONS
+
+ENGINES = ("pandas", "polars", "duckdb")
+
+# Periodo -> (pandas, polars, duckdb)
+FREQUENCIES = {
+    "D": ("D", "1d", "day"),
+    "W": ("W", "1w", "week"),
+    "M": ("M", "1mo", "month"),
+    "Y": ("Y", "1y", "year"),
+}
+
+# Palabras de letras Unicode (sin dígitos ni "_"); en polars/duckdb se usa \p{L}+
+TOKEN_RE = re.compile(r"[^\W\d_]+")
+
+SPANISH_STOPWORDS = frozenset("""
+a al algo algunos ante antes aqui aquí asi así aun aún como con contra cual cuando de del desde donde
+dos el él ella ellas ellos en entre era eres es esa esas ese eso esos esta está estaba estan están
+estas este esto estos estoy fue fueron ha han hasta hay la las le les lo los mas más me mi mis mucho
+muy nada ni no nos o os otra otro para pero poco por porque que qué quien se sea ser si sí sin sobre
+solo son su sus tambien también te tiene tienen todo todos tu tú tus un una uno unos usted va vez ya yo
+""".split())
+
+
+def _is_path(data):
+    return isinstance(data, (str, Path))
+
+
+def _needed(columns, extra):
+    """Columnas a leer de la fuente (las de `extra` se agregan por posición)."""
+    skip = set(extra.columns) if extra is not None else set()
+    return list(dict.fromkeys(c for c in columns if c and c not in skip))
+
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+class _PandasEngine:
+    name = "pandas"
+
+    def load(self, data, columns, time=None, extra=None):
+        if _is_path(data):
+            path = Path(data)
+            if path.suffix == ".parquet":
+                df = pd.read_parquet(path, columns=columns)
+            else:
+                df = pd.read_csv(path, usecols=columns)
+        else:
+            df = data[columns]
+        if extra is not None:
+            df = pd.concat([df.reset_index(drop=True), extra.reset_index(drop=True)], axis=1)
+        if time is not None:
+            time_col, freq = time
+            values = df[time_col]
+            if pd.api.types.is_numeric_dtype(values):
+                times = pd.to_datetime(values, unit="s", errors="coerce")
+            else:
+                times = pd.to_datetime(values, errors="coerce")
+            df = df.assign(period=times.dt.to_period(FREQUENCIES[freq][0]).dt.start_time)
+        return df
+
+    def _weights(self, df, weight):
+        if weight is None:
+            return pd.Series(1.0, index=df.index)
+        weight_col, offset = weight
+        return pd.to_numeric(df[weight_col], errors="coerce").fillna(0) + offset
+
+    def class_rates(self, df, by, class_col, weight=None):
+        keys = by + [class_col]
+        df = df.dropna(subset=keys)
+        if weight is None:
+            counts = df.groupby(keys, observed=True).size()
+        else:
+            counts = self._weights(df, weight).groupby([df[k] for k in keys], observed=True).sum()
+        out = counts.rename("count").reset_index()
+        out["total"] = out.groupby(by, observed=True)["count"].transform("sum") if by else out["count"].sum()
+        return out
+
+    def group_means(self, df, by, cols, weight=None):
+        df = df.dropna(subset=by)
+        w = self._weights(df, weight)
+        values = df[cols].astype(float)
+        # sum(w * x) / sum(w donde x no es nulo): con w = 1 es la media que ignora nulos
+        parts = pd.concat([values.mul(w, axis=0), values.notna().mul(w, axis=0).add_suffix("__w")], axis=1)
+        parts["n"] = 1
+        if by:
+            sums = parts.groupby([df[k] for k in by], observed=True).sum()
+        else:
+            sums = parts.sum().to_frame().T
+        out = sums[cols].div(sums[[f"{c}__w" for c in cols]].to_numpy())
+        out.insert(0, "n", sums["n"].astype("int64"))
+        return out.reset_index() if by else out.reset_index(drop=True)
+
+    def term_frequencies(self, df, text_col, class_col, top_n, min_length, stopwords):
+        df = df.dropna(subset=[text_col, class_col])
+        terms = df[text_col].astype(str).str.lower().str.findall(TOKEN_RE)
+        long = pd.DataFrame({class_col: df[class_col], "term": terms}).explode("term").dropna(subset=["term"])
+        long = long[(long["term"].str.len() >= min_length) & ~long["term"].isin(stopwords)]
+        out = long.groupby([class_col, "term"], observed=True).size().rename("count").reset_index()
+        out = out.sort_values([class_col, "count", "term"], ascending=[True, False, True])
+        return out.groupby(class_col, observed=True).head(top_n)
+
+
+class _PolarsEngine:
+    name = "polars"
+
+    def load(self, data, columns, time=None, extra=None):
+        import polars as pl
+
+        if _is_path(data):
+            path = Path(data)
+            if path.suffix == ".parquet":
+                lf = pl.scan_parquet(path)
+            else:
+                lf = pl.scan_csv(path, infer_schema_length=10_000)
+            lf = lf.select(columns)
+        else:
+            lf = pl.from_pandas(data[columns]).lazy()
+        if extra is not None:
+            lf = pl.concat([lf, pl.from_pandas(extra).lazy()], how="horizontal")
+        if time is not None:
+            time_col, freq = time
+            dtype = lf.collect_schema()[time_col]
+            if dtype.is_numeric():
+                times = pl.from_epoch(pl.col(time_col).cast(pl.Int64), time_unit="s")
+            elif dtype == pl.String:
+                times = pl.col(time_col).str.to_datetime(strict=False)
+            else:
+                times = pl.col(time_col)
+            lf = lf.with_columns(period=times.dt.truncate(FREQUENCIES[freq][1]))
+        return lf
+
+    def _weights(self, weight):
+        import polars as pl
+
+        if weight is None:
+            return pl.lit(1.0)
+        weight_col, offset = weight
+        return pl.col(weight_col).cast(pl.Float64, strict=False).fill_null(0) + offset
+
+    def class_rates(self, lf, by, class_col, weight=None):
+        import polars as pl
+
+        keys = by + [class_col]
+        count = pl.len() if weight is None else self._weights(weight).sum()
+        out = lf.drop_nulls(keys).group_by(keys).agg(count=count)
+        total = pl.col("count").sum().over(by) if by else pl.col("count").sum()
+        return out.with_columns(total=total).collect().to_pandas()
+
+    def group_means(self, lf, by, cols, weight=None):
+        import polars as pl
+
+        w = self._weights(weight)
+        aggs = [pl.len().alias("n")] + [
+            ((pl.col(c).cast(pl.Float64) * w).sum() / w.filter(pl.col(c).is_not_null()).sum()).alias(c)
+            for c in cols
+        ]
+        out = lf.drop_nulls(by).group_by(by).agg(aggs) if by else lf.select(aggs)
+        return out.collect().to_pandas()
+
+    def term_frequencies(self, lf, text_col, class_col, top_n, min_length, stopwords):
+        import polars as pl
+
+        terms = pl.col(text_col).cast(pl.String).str.to_lowercase().str.extract_all(r"\p{L}+")
+        return (
+            lf.drop_nulls([text_col, class_col])
+            .select(pl.col(class_col), terms.alias("term"))
+            .explode("term")
+            .filter(pl.col("term").str.len_chars() >= min_length, ~pl.col("term").is_in(list(stopwords)))
+            .group_by([class_col, "term"])
+            .agg(count=pl.len())
+            .sort([class_col, "count", "term"], descending=[False, True, False])
+            .group_by(class_col, maintain_order=True)
+            .head(top_n)
+            .collect()
+            .to_pandas()
+        )
+
+
+class _DuckDBEngine:
+    name = "duckdb"
+
+    def load(self, data, columns, time=None, extra=None):
+        import duckdb
+
+        con = duckdb.connect()
+        select = ", ".join(_quote(c) for c in columns)
+        if _is_path(data):
+            path = str(data).replace("'", "''")
+            reader = "read_parquet" if Path(data).suffix == ".parquet" else "read_csv_auto"
+            con.execute(f"CREATE VIEW base AS SELECT {select} FROM {reader}('{path}')")
+        else:
+            con.register("source_df", data[columns])
+            con.execute(f"CREATE VIEW base AS SELECT {select} FROM source_df")
+        if extra is not None:
+            con.register("extra_df", extra)
+            con.execute("CREATE VIEW joined AS SELECT * FROM base POSITIONAL JOIN extra_df")
+        else:
+            con.execute("CREATE VIEW joined AS SELECT * FROM base")
+
+        period = ""
+        if time is not None:
+            time_col, freq = time
+            column = _quote(time_col)
+            dtype = str(con.sql(f"SELECT {column} FROM joined LIMIT 0").types[0])
+            if dtype in ("TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT", "FLOAT", "DOUBLE") \
+                    or dtype.startswith("DECIMAL") or dtype.startswith("U"):
+                times = f"epoch_ms(CAST({column} * 1000 AS BIGINT))"
+            elif dtype == "VARCHAR":
+                times = f"TRY_CAST({column} AS TIMESTAMP)"
+            else:
+                times = f"CAST({column} AS TIMESTAMP)"
+            period = f", date_trunc('{FREQUENCIES[freq][2]}', {times}) AS period"
+        con.execute(f"CREATE VIEW src AS SELECT *{period} FROM joined")
+        return con
+
+    def _weights(self, weight):
+        if weight is None:
+            return "1.0"
+        weight_col, offset = weight
+        return f"(coalesce(TRY_CAST({_quote(weight_col)} AS DOUBLE), 0) + {float(offset)})"
+
+    def class_rates(self, con, by, class_col, weight=None):
+        keys = ", ".join(_quote(k) for k in by + [class_col])
+        not_null = " AND ".join(f"{_quote(k)} IS NOT NULL" for k in by + [class_col])
+        count = "count(*)" if weight is None else f"sum({self._weights(weight)})"
+        total_type = "BIGINT" if weight is None else "DOUBLE"
+        partition = f"PARTITION BY {', '.join(_quote(k) for k in by)}" if by else ""
+        return con.execute(f"""
+            WITH counts AS (
+                SELECT {keys}, {count} AS count FROM src WHERE {not_null} GROUP BY {keys}
+            )
+            SELECT *, CAST(sum(count) OVER ({partition}) AS {total_type}) AS total FROM counts
+        """).df()
+
+    def group_means(self, con, by, cols, weight=None):
+        w = self._weights(weight)
+        means = ", ".join(
+            f"sum({w} * CAST({_quote(c)} AS DOUBLE)) / sum(CASE WHEN {_quote(c)} IS NOT NULL THEN {w} END) "
+            f"AS {_quote(c)}"
+            for c in cols
+        )
+        if not by:
+            return con.execute(f"SELECT count(*) AS n, {means} FROM src").df()
+        keys = ", ".join(_quote(k) for k in by)
+        not_null = " AND ".join(f"{_quote(k)} IS NOT NULL" for k in by)
+        return con.execute(
+            f"SELECT {keys}, count(*) AS n, {means} FROM src WHERE {not_null} GROUP BY {keys}"
+        ).df()
+
+    def term_frequencies(self, con, text_col, class_col, top_n, min_length, stopwords):
+        text, cls = _quote(text_col), _quote(class_col)
+        return con.execute(f"""
+            WITH terms AS (
+                SELECT {cls}, unnest(regexp_extract_all(lower(CAST({text} AS VARCHAR)), '\\p{{L}}+')) AS term
+                FROM src WHERE {text} IS NOT NULL AND {cls} IS NOT NULL
+            )
+            SELECT {cls}, term, count(*) AS count FROM terms
+            WHERE length(term) >= ? AND NOT list_contains(?, term)
+            GROUP BY {cls}, term
+            QUALIFY row_number() OVER (PARTITION BY {cls} ORDER BY count DESC, term) <= ?
+        """, [min_length, sorted(stopwords), top_n]).df()
+
+
+_ENGINES = {"pandas": _PandasEngine, "polars": _PolarsEngine, "duckdb": _DuckDBEngine}
+
+
+def get_engine(name):
+    if name not in _ENGINES:
+        raise ValueError(f"Motor desconocido: {name!r}. Opciones: {', '.join(ENGINES)}")
+    return _ENGINES[name]()
+
+
+def _finish(df, sort_cols, int_cols=()):
+    """Orden estable y tipos homogéneos entre motores."""
+    df = df.sort_values(sort_cols, kind="stable").reset_index(drop=True)
+    for col in int_cols:
+        df[col] = df[col].astype("int64")
+    if "period" in df:
+        df["period"] = pd.to_datetime(df["period"]).astype("datetime64[ns]")
+    return df
+
+
+def _check_classes(class_col, label_cols):
+    if (class_col is None) == (not label_cols):
+        raise ValueError("Indica class_col (categórica) o label_cols (multi-etiqueta), no ambos.")
+
+
+def class_rates(data, by, class_col, weight_col=None, weight_offset=1.0, engine="pandas", extra=None,
+                time=None):
+    """
+    Conteo, total y tasa de cada clase dentro de cada grupo de `by`.
+
+    Parámetros:
+    - by: columna o lista de columnas de agrupación ([] = todo el dataset).
+    - weight_col: si se indica, `count` es la suma de (weight + weight_offset) en vez de filas.
+    - extra: DataFrame alineado por fila que se agrega a la fuente (p. ej. etiquetas predichas).
+    - time: (columna, frecuencia) para agregar la columna de agrupación "period".
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    eng = get_engine(engine)
+    weight = (weight_col, weight_offset) if weight_col else None
+    source_by = [b for b in by if b != "period"]
+    frame = eng.load(data, _needed(source_by + [class_col, weight_col, time and time[0]], extra), time, extra)
+    out = eng.class_rates(frame, by, class_col, weight)
+    out["rate"] = out["count"] / out["total"]
+    int_cols = ("count", "total") if weight is None else ()
+    return _finish(out[by + [class_col, "count", "total", "rate"]], by + [class_col], int_cols)
+
+
+def group_means(data, by, cols, weight_col=None, weight_offset=1.0, engine="pandas", extra=None, time=None):
+    """
+    Filas (`n`) y media de cada columna de `cols` por grupo de `by` (formato ancho).
+
+    Con `weight_col` la media se pondera por (weight + weight_offset).
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    eng = get_engine(engine)
+    weight = (weight_col, weight_offset) if weight_col else None
+    source_by = [b for b in by if b != "period"]
+    frame = eng.load(data, _needed(source_by + list(cols) + [weight_col, time and time[0]], extra), time, extra)
+    out = eng.group_means(frame, by, list(cols), weight)
+    return _finish(out[by + ["n"] + list(cols)], by or ["n"], ("n",))
+
+
+def _melt_labels(wide, by, label_cols, value_name):
+    long = wide.melt(id_vars=by + ["n"], value_vars=list(label_cols), var_name="label", value_name=value_name)
+    return long.sort_values(by + ["label"], kind="stable").reset_index(drop=True)
+
+
+def emotion_rates_over_time(data, time_col="timestamp", freq="M", class_col=None, label_cols=None,
+                            engine="pandas", extra=None):
+    """
+    Tasa de cada emoción por periodo.
+
+    - Con `class_col`: columnas period, <class_col>, count, total, rate.
+    - Con `label_cols`: columnas period, n, label, rate (media de la columna en el periodo,
+      es decir proporción de comentarios con la etiqueta o probabilidad media).
+
+    `time_col` puede ser epoch en segundos o una fecha en texto; `freq` es D, W, M o Y.
+    """
+    _check_classes(class_col, label_cols)
+    if freq not in FREQUENCIES:
+        raise ValueError(f"Frecuencia desconocida: {freq!r}. Opciones: {', '.join(FREQUENCIES)}")
+    if class_col is not None:
+        return class_rates(data, ["period"], class_col, engine=engine, extra=extra, time=(time_col, freq))
+    wide = group_means(data, ["period"], label_cols, engine=engine, extra=extra, time=(time_col, freq))
+    return _melt_labels(wide, ["period"], label_cols, "rate")
+
+
+def weighted_emotion_shares(data, weight_col="likes", class_col=None, label_cols=None, by=None,
+                            weight_offset=1.0, engine="pandas", extra=None):
+    """
+    Participación de cada emoción ponderada por `weight_col` (likes).
+
+    Cada comentario pesa likes + `weight_offset`, así los comentarios sin likes
+    siguen contando. Con `class_col` la participación (`rate`) suma 1 por grupo;
+    con `label_cols` es la proporción ponderada de comentarios con cada etiqueta.
+    """
+    _check_classes(class_col, label_cols)
+    by = [] if by is None else ([by] if isinstance(by, str) else list(by))
+    if class_col is not None:
+        return class_rates(data, by, class_col, weight_col, weight_offset, engine, extra)
+    wide = group_means(data, by, label_cols, weight_col, weight_offset, engine, extra)
+    return _melt_labels(wide, by, label_cols, "share")
+
+
+def term_frequencies(data, text_col, class_col, top_n=100, min_length=3, stopwords=SPANISH_STOPWORDS,
+                     engine="pandas", extra=None):
+    """
+    Términos más frecuentes por clase (columnas <class_col>, term, count).
+
+    Tokeniza en minúsculas por palabras de letras, descarta términos de menos de
+    `min_length` caracteres y `stopwords`, y deja los `top_n` más frecuentes por clase.
+    """
+    eng = get_engine(engine)
+    frame = eng.load(data, _needed([text_col, class_col], extra), extra=extra)
+    out = eng.term_frequencies(frame, text_col, class_col, top_n, min_length, frozenset(stopwords or ()))
+    out = out[[class_col, "term", "count"]]
+    out = out.assign(_neg=-out["count"])
+    return _finish(out, [class_col, "_neg", "term"], ("count",)).drop(columns="_neg")
+
+
+def bin_column(values, bins, labels, right=False):
+    """Discretiza una columna numérica en grupos (sin modificar el DataFrame de origen)."""
+    return pd.cut(values, bins=bins, labels=labels, right=right)
+
+
+def prediction_columns(output_dir, translate=False):
+    """
+    Etiquetas de una corrida de `modeling.predict` como columnas 0/1 alineadas
+    por fila con el archivo puntuado, más `top_label` (emoción más probable;
+    vacía para textos sin puntuar).
+    """
+    from review_analyzer.modeling.predict import PredictionRun
+
+    run = PredictionRun(output_dir)
+    labels = run.meta["labels"]
+    bitmask = np.load(run.labels_path, mmap_mode="r")
+    probs = np.load(run.probs_path, mmap_mode="r")
+    mask = ((bitmask[:, None] >> np.arange(len(labels), dtype=np.int64)) & 1).astype(np.uint8)
+
+    names = np.array(run.meta["translated_labels"] if translate else labels, dtype=object)
+    top = names[np.asarray(probs).argmax(axis=1)]
+    top[np.asarray(probs).max(axis=1) == 0] = None
+    df = pd.DataFrame(mask, columns=labels)
+    df["top_label"] = top
+    return df
+
+
+def _records(df):
+    df = df.copy()
+    if "period" in df:
+        df["period"] = df["period"].dt.strftime("%Y-%m-%d")
+    if "label" in df:
+        df.insert(df.columns.get_loc("label") + 1, "label_es", df["label"].map(lambda l: LABEL_TRANSLATIONS.get(l, l)))
+    return json.loads(df.to_json(orient="records", force_ascii=False, double_precision=6))
+
+
+def build_report(data, class_col=None, label_cols=None, time_col="timestamp", freq="M", weight_col=None,
+                 text_col="text", term_class_col=None, top_n=50, engine="pandas", extra=None):
+    """
+    Reporte JSON con las tablas de analítica de un dataset.
+
+    Con pandas la fuente se lee una sola vez (solo las columnas necesarias);
+    con polars/duckdb cada tabla es una consulta sobre el archivo.
+    """
+    _check_classes(class_col, label_cols)
+    term_class_col = term_class_col or class_col
+    source = str(data) if _is_path(data) else None
+    if engine == "pandas":
+        columns = _needed([class_col, time_col, weight_col, text_col, *(label_cols or [])], extra)
+        data = _PandasEngine().load(data, columns, extra=extra)
+        extra = None
+
+    report = {
+        "source": source,
+        "engine": engine,
+        "freq": freq,
+        "class_col": class_col,
+        "labels": list(label_cols) if label_cols else None,
+    }
+    if time_col:
+        report["rates_over_time"] = _records(emotion_rates_over_time(
+            data, time_col, freq, class_col, label_cols, engine, extra))
+    if weight_col:
+        report["weighted_shares"] = _records(weighted_emotion_shares(
+            data, weight_col, class_col, label_cols, engine=engine, extra=extra))
+    if text_col and term_class_col:
+        report["term_frequencies"] = _records(term_frequencies(
+            data, text_col, term_class_col, top_n, engine=engine, extra=extra))
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analítica de emociones por publicación")
+    parser.add_argument("--data", default=str(FINAL_PROCESSED_DATA_PATH))
+    parser.add_argument("--class-col", default=None, help="Columna categórica de emoción/sentimiento")
+    parser.add_argument("--predictions", default=None,
+                        help="Carpeta de una corrida de modeling.predict sobre --data (etiquetas multi-label)")
+    parser.add_argument("--time-col", default="timestamp")
+    parser.add_argument("--freq", default="M", choices=list(FREQUENCIES))
+    parser.add_argument("--weight-col", default=None, help="Columna de likes para las participaciones ponderadas")
+    parser.add_argument("--text-col", default="text")
+    parser.add_argument("--top-n", type=int, default=50)
+    parser.add_argument("--engine", default="pandas", choices=ENGINES)
+    parser.add_argument("--output", default=None, help=f"Por defecto {ANALYTICS_DIR}/<nombre del archivo>.json")
+    args = parser.parse_args(argv)
+
+    extra = label_cols = term_class_col = None
+    if args.predictions:
+        extra = prediction_columns(args.predictions)
+        label_cols = [c for c in extra.columns if c != "top_label"]
+        term_class_col = "top_label"
+    elif args.class_col is None:
+        parser.error("Indica --class-col o --predictions.")
+
+    report = build_report(args.data, args.class_col if not args.predictions else None, label_cols,
+                          args.time_col, args.freq, args.weight_col, args.text_col, term_class_col,
+                          args.top_n, args.engine, extra)
+    output = Path(args.output or ANALYTICS_DIR / f"{Path(args.data).stem}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"Reporte en {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
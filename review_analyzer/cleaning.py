@@ -0,0 +1,127 @@
+"""
+Limpieza de texto por columnas para corpus grandes de comentarios.
+
+Produce exactamente la misma salida que `clean_basic_text_preserve_emojis`
+(cuatro pasadas: URLs, menciones/hashtags, espacios antes de puntuación y
+compactado de espacios), pero:
+
+- Con patrones precompilados una sola vez por proceso.
+- Sobre columnas completas, con dos motores:
+  - "python": `re` precompilado en un bucle por bloque (referencia).
+  - "arrow": kernels vectorizados de pyarrow (RE2). Como `\\w`, `\\s` y `\\S` de
+    RE2 son solo ASCII, se traducen a clases Unicode equivalentes a las de `re`.
+- Con multiprocesamiento por bloques para corpus de millones de filas.
+
+Las pasadas de URLs y menciones no se pueden combinar en una sola regex sin
+cambiar el resultado: en "@http://x" la pasada de URLs deja "@", mientras que
+una alternancia única consumiría "@http" y dejaría "://x".
+
+Uso:
+    from review_analyzer.cleaning import clean_column
+    df["clean_text"] = clean_column(df["text"], engine="arrow", n_jobs=4)
+"""
+import functools
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+ENGINES = ("python", "arrow")
+
+URL_RE = re.compile(r"http\S+|www\S+")
+MENTION_RE = re.compile(r"@\w+|#\w+")
+SPACE_BEFORE_PUNCT_RE = re.compile(r"\s+(?=[?.!,])")
+SPACES_RE = re.compile(r"\s+")
+
+
+def clean_text(text):
+    """Limpieza de un texto con los patrones precompilados (misma salida que la versión original)."""
+    text = URL_RE.sub("", text)
+    text = MENTION_RE.sub("", text)
+    text = SPACE_BEFORE_PUNCT_RE.sub("", text)
+    return SPACES_RE.sub(" ", text).strip()
+
+
+def _clean_python(texts):
+    return [clean_text(text) if isinstance(text, str) else text for text in texts]
+
+
+def _char_class(predicate):
+    """Clase RE2 con todos los code points que cumplen `predicate` (rangos compactos)."""
+    ranges = []
+    start = prev = None
+    for cp in range(sys.maxunicode + 1):
+        if 0xD800 <= cp <= 0xDFFF or not predicate(chr(cp)):
+            continue
+        if prev is not None and cp == prev + 1:
+            prev = cp
+            continue
+        if start is not None:
+            ranges.append((start, prev))
+        start = prev = cp
+    if start is not None:
+        ranges.append((start, prev))
+    return "".join(f"\\x{{{a:x}}}" if a == b else f"\\x{{{a:x}}}-\\x{{{b:x}}}" for a, b in ranges)
+
+
+@functools.lru_cache(maxsize=1)
+def _arrow_patterns():
+    """Patrones RE2 equivalentes a los de `re` (clases \\w y \\s de Python en Unicode)."""
+    space = _char_class(str.isspace)
+    word = _char_class(lambda ch: ch.isalnum() or ch == "_")
+    return {
+        "url": f"http[^{space}]+|www[^{space}]+",
+        "mention": f"@[{word}]+|#[{word}]+",
+        "space_before_punct": f"[{space}]+([?.!,])",
+        "spaces": f"[{space}]+",
+    }
+
+
+def _clean_arrow(texts):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    patterns = _arrow_patterns()
+    array = pa.array(texts, type=pa.large_string(), from_pandas=True)
+    array = pc.replace_substring_regex(array, patterns["url"], "")
+    array = pc.replace_substring_regex(array, patterns["mention"], "")
+    array = pc.replace_substring_regex(array, patterns["space_before_punct"], "\\1")
+    array = pc.replace_substring_regex(array, patterns["spaces"], " ")
+    # Tras compactar, el único espacio posible en los extremos es " "
+    array = pc.utf8_trim(array, " ")
+    return array.to_pylist()
+
+
+_CLEANERS = {"python": _clean_python, "arrow": _clean_arrow}
+
+
+def clean_texts(texts, engine="python", n_jobs=1, chunk_size=100_000):
+    """
+    Limpia una secuencia de textos; los valores no string (NaN, None) se devuelven tal cual.
+
+    Parámetros:
+    - texts: lista, Series o cualquier iterable de textos.
+    - engine: "python" (re precompilado) o "arrow" (pyarrow.compute).
+    - n_jobs: procesos en paralelo (1 = en el proceso actual).
+    - chunk_size: filas por bloque enviado a cada proceso.
+
+    Retorna:
+    - Lista con los textos limpios, en el mismo orden.
+    """
+    if engine not in _CLEANERS:
+        raise ValueError(f"engine debe ser uno de {ENGINES}, no '{engine}'.")
+    texts = list(texts)
+    cleaner = _CLEANERS[engine]
+    if n_jobs == 1 or len(texts) <= chunk_size:
+        return cleaner(texts)
+
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        return [text for chunk in pool.map(cleaner, chunks) for text in chunk]
+
+
+def clean_column(series, engine="python", n_jobs=1, chunk_size=100_000):
+    """Versión por columna de `clean_texts`: devuelve una Series con el mismo índice."""
+    import pandas as pd
+
+    cleaned = clean_texts(series, engine, n_jobs, chunk_size)
+    return pd.Series(cleaned, index=series.index, name=series.name, dtype=series.dtype)
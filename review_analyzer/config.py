@@ -8,6 +8,7 @@ PROJ_ROOT = Path(__file__).resolve().parents[1]
 # Api
 API = PROJ_ROOT  / "api"
 API_MODEL = API  / "model"
+FEELTRACK_MODEL = "ZAMORAPJ/feeltrack-model"
 
 
 # Data
@@ -39,9 +40,26 @@ BERT_SENTIMENT_PATH = INTERIM / "comments_with_bert_sentiment.csv"
 
 # 5
 FINAL_PROCESSED_DATA_PATH = PROCESSED / "final_clean_dataset.csv"
+PREDICTIONS_DIR = PROCESSED / "predictions"
+SIMILARITY_INDEX_DIR = PROCESSED / "similarity_index"
+
+# Reports
+REPORTS_DIR = PROJ_ROOT / "reports"
+EVALUATION_REPORT_PATH = REPORTS_DIR / "evaluation.json"
+DISTILLATION_REPORT_PATH = REPORTS_DIR / "distillation.json"
+ANALYTICS_DIR = REPORTS_DIR / "analytics"
 
 # Models
 MODELS_DIR = PROJ_ROOT / "models"
 
 CHECKPOINTS_DIR = MODELS_DIR / "checkpoints"
+ONNX_MODEL_DIR = MODELS_DIR / "trained" / "feeltrack-onnx"
+FEELTRACK_TRAINED_DIR = MODELS_DIR / "trained" / "feeltrack-model"
+STUDENT_MODEL_DIR = MODELS_DIR / "trained" / "feeltrack-student"
+THRESHOLDS_PATH = MODELS_DIR / "trained" / "thresholds.json"
+GOLDEN_SET_LOGITS_PATH = INTERIM / "golden_set_logits.npz"
+LANGUAGE_CACHE_PATH = INTERIM / "language_cache.sqlite"
+TOKEN_CACHE_DIR = INTERIM / "token_cache"
+POSTS_DB_PATH = INTERIM / "posts.sqlite"
+TIKTOK_STORE_DIR = RAW / "tiktok"
 
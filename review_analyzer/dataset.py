@@ -1,54 +1,209 @@
 import emoji
-import re
+import functools
+import hashlib
+import os
+from pathlib import Path
 from langdetect import detect
 from tqdm import tqdm
 import torch
-from transformers import BertTokenizer, BertModel
+from transformers import AutoModel, AutoTokenizer
 import numpy as np
 
+from review_analyzer.cleaning import clean_text
+from review_analyzer.config import BERT_EMBEDDINGS
+from review_analyzer.metrics import REGISTRY
+from review_analyzer.modeling.inference import length_buckets, pad_batch
+
+EMBEDDING_BATCH_SECONDS = REGISTRY.histogram("embeddings_batch_seconds", "Tiempo de forward por sub-batch de embeddings")
+POOLING_MODES = ("cls", "mean")
+
 def clean_basic_text_preserve_emojis(text):
     """
     Limpieza básica de texto preservando mayúsculas, emojis y símbolos emocionales.
     
     - Elimina URLs, menciones y hashtags.
     - Compacta espacios.
+
+    Para columnas completas usar `review_analyzer.cleaning.clean_column`.
     """
-    text = re.sub(r"http\S+|www\S+", "", text)
-    text = re.sub(r"@\w+|#\w+", "", text)
-    text = re.sub(r'\s+([?.!,])', r'\1', text)
-    text = re.sub(r"\s+", " ", text).strip()
-    return text
+    return clean_text(text)
+
+def embedding_key(text, model_name, pooling, max_length):
+    """Clave de `EmbeddingEngine.text_key` sin cargar el modelo."""
+    payload = f"{model_name}\x00{pooling}\x00{max_length}\x00{text}"
+    return hashlib.sha1(payload.encode("utf-8")).digest()
+
+
+class EmbeddingEngine:
+    """
+    Motor de embeddings que mantiene el modelo cargado entre llamadas.
+
+    - Tokenizer rápido (Rust) y una sola tokenización por bloque de textos.
+    - Textos ordenados por longitud y agrupados bajo un presupuesto de tokens,
+      con padding solo hasta el texto más largo de cada sub-batch.
+    - `embed_to_file` escribe directo en un .npy memory-mapped, se reanuda donde
+      quedó y reutiliza embeddings ya calculados (clave = hash del contenido).
+
+    Parámetros:
+    - model_name: modelo de Hugging Face (por defecto BERT multilingüe cased).
+    - pooling: "cls" (token [CLS]) o "mean" (promedio de tokens sin padding).
+    - max_length: longitud máxima en tokens (BERT trunca a 512).
+    - max_batch_tokens: presupuesto de tokens (con padding) por sub-batch.
+    - max_batch_size: límite opcional de textos por sub-batch.
+    """
+
+    def __init__(self, model_name='bert-base-multilingual-cased', pooling="cls", max_length=512,
+                 max_batch_tokens=8192, max_batch_size=None, device=None):
+        if pooling not in POOLING_MODES:
+            raise ValueError(f"pooling debe ser uno de {POOLING_MODES}, no '{pooling}'.")
+        self.model_name = model_name
+        self.pooling = pooling
+        self.max_length = max_length
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.device = torch.device(device or ('cuda' if torch.cuda.is_available() else 'cpu'))
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+        self.model = AutoModel.from_pretrained(model_name)
+        self.model.to(self.device)
+        self.model.eval()
+        self.dim = self.model.config.hidden_size
+
+    def text_key(self, text):
+        """Hash del texto junto con la configuración que afecta al embedding."""
+        return embedding_key(text, self.model_name, self.pooling, self.max_length)
+
+    def _pool(self, hidden, attention_mask):
+        if self.pooling == "cls":
+            return hidden[:, 0, :]
+        mask = attention_mask.unsqueeze(-1).to(hidden.dtype)
+        return (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+
+    def _embed_into(self, texts, out, rows, max_batch_size=None):
+        """Calcula los embeddings de `texts` y los escribe en out[rows]."""
+        encoded = self.tokenizer(texts, truncation=True, max_length=self.max_length)
+        lengths = np.array([len(ids) for ids in encoded["input_ids"]], dtype=np.int64)
+        pad_token_id = self.tokenizer.pad_token_id or 0
+        max_batch_size = max_batch_size or self.max_batch_size
+
+        with torch.inference_mode():
+            for bucket in length_buckets(lengths, self.max_batch_tokens, max_batch_size):
+                with EMBEDDING_BATCH_SECONDS.time():
+                    batch = {k: torch.from_numpy(v).to(self.device)
+                             for k, v in pad_batch(encoded, bucket, pad_token_id).items()}
+                    hidden = self.model(**batch).last_hidden_state
+                    out[rows[bucket]] = self._pool(hidden, batch["attention_mask"]).float().cpu().numpy()
+
+    def embed(self, texts, max_batch_size=None):
+        """
+        Embeddings en memoria: array float32 (n_textos, dim) en el orden de `texts`.
+
+        `max_batch_size` limita los textos por sub-batch solo en esta llamada (el
+        motor es compartido, ver `get_embedding_engine`).
+        """
+        texts = list(texts)
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        if texts:
+            self._embed_into(texts, out, np.arange(len(texts)), max_batch_size)
+        return out
+
+    def embed_to_file(self, texts, path=BERT_EMBEDDINGS, chunk_size=4096, show_progress=True,
+                      max_batch_size=None):
+        """
+        Escribe los embeddings en un .npy memory-mapped (n_textos, dim).
+
+        Junto al archivo se guarda `<nombre>.keys.npy` con el hash de cada fila ya
+        calculada. Al volver a ejecutar:
+        - Con los mismos textos, solo se calculan las filas que faltan (reanudación).
+        - Con otra lista de textos, se copian las filas cuyo hash ya existía y solo
+          se calculan los textos nuevos.
+
+        Retorna el memmap de solo lectura con el resultado.
+        """
+        texts = list(texts)
+        path = Path(path)
+        keys_path = path.with_name(f"{path.stem}.keys.npy")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        keys = np.array([self.text_key(text) for text in texts], dtype="S20")
+        shape = (len(texts), self.dim)
+
+        out, done = self._open_cache(path, keys_path, keys, shape)
+        missing = np.flatnonzero(done != keys)
+        # Orden global por longitud en caracteres: cada bloque agrupa textos parecidos
+        missing = missing[np.argsort([len(texts[i]) for i in missing], kind="stable")]
+
+        for start in tqdm(range(0, len(missing), chunk_size), desc="Embeddings", disable=not show_progress):
+            rows = missing[start:start + chunk_size]
+            self._embed_into([texts[i] for i in rows], out, rows, max_batch_size)
+            out.flush()
+            # Las claves se marcan después de escribir las filas: una interrupción
+            # solo obliga a recalcular el bloque en curso.
+            done[rows] = keys[rows]
+            done.flush()
+
+        del out, done
+        return np.load(path, mmap_mode="r")
+
+    def _open_cache(self, path, keys_path, keys, shape):
+        """Abre (o crea) el memmap de salida y el de claves calculadas."""
+        if path.exists() and keys_path.exists():
+            old = np.load(path, mmap_mode="r")
+            old_keys = np.load(keys_path, mmap_mode="r")
+            if old.shape == shape and old_keys.shape == keys.shape:
+                return (np.lib.format.open_memmap(path, mode="r+"),
+                        np.lib.format.open_memmap(keys_path, mode="r+"))
+        else:
+            old = old_keys = None
+
+        tmp_path = path.with_name(f"{path.stem}.tmp.npy")
+        tmp_keys_path = keys_path.with_name(f"{keys_path.stem}.tmp.npy")
+        out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=shape)
+        done = np.lib.format.open_memmap(tmp_keys_path, mode="w+", dtype="S20", shape=keys.shape)
+
+        if old is not None and old.shape[1:] == shape[1:]:
+            previous = {key: row for row, key in enumerate(old_keys) if key}
+            hits = [(i, previous[key]) for i, key in enumerate(keys) if key in previous]
+            if hits:
+                new_rows, old_rows = map(np.array, zip(*hits))
+                out[new_rows] = old[old_rows]
+                done[new_rows] = keys[new_rows]
+        del old, old_keys
+
+        out.flush()
+        done.flush()
+        os.replace(tmp_path, path)
+        os.replace(tmp_keys_path, keys_path)
+        return out, done
+
+
+@functools.lru_cache(maxsize=4)
+def get_embedding_engine(model_name='bert-base-multilingual-cased', pooling="cls", max_length=512):
+    """Motor compartido por configuración, para no recargar el modelo en cada llamada."""
+    return EmbeddingEngine(model_name, pooling=pooling, max_length=max_length)
+
 
 def extract_bert_embeddings(text_list, 
                             model_name='bert-base-multilingual-cased', 
                             batch_size=16, 
-                            max_length=512):
+                            max_length=512,
+                            pooling="cls",
+                            output_path=None):
     """
-    Extrae embeddings BERT [CLS] para una lista de textos.
+    Extrae embeddings BERT ([CLS] o promedio) para una lista de textos.
     
     Parámetros:
     - text_list: lista de textos (ya preprocesados).
     - model_name: nombre del modelo BERT (por defecto multilingüe cased).
-    - batch_size: tamaño de batch para optimización.
+    - batch_size: máximo de textos por sub-batch (se agrupan por longitud).
     - max_length: longitud máxima de tokens (BERT trunca a 512).
+    - pooling: "cls" (token [CLS]) o "mean" (promedio de tokens).
+    - output_path: si se indica (p. ej. BERT_EMBEDDINGS), escribe en un .npy
+      memory-mapped reanudable en lugar de acumular en memoria.
     
     Retorna:
     - Array NumPy (n_samples, embedding_dim).
     """
-    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-    tokenizer = BertTokenizer.from_pretrained(model_name)
-    model = BertModel.from_pretrained(model_name)
-    model.to(device)
-    model.eval()
-    
-    all_embeddings = []
-    with torch.no_grad():
-        for i in range(0, len(text_list), batch_size):
-            batch = text_list[i:i + batch_size]
-            inputs = tokenizer(batch, return_tensors='pt', padding=True, truncation=True, max_length=max_length)
-            inputs = {k: v.to(device) for k, v in inputs.items()}
-            outputs = model(**inputs)
-            cls_embeddings = outputs.last_hidden_state[:, 0, :].cpu().numpy()
-            all_embeddings.append(cls_embeddings)
-    
-    return np.vstack(all_embeddings)
\ No newline at end of file
+    engine = get_embedding_engine(model_name, pooling, max_length)
+    if output_path is not None:
+        return engine.embed_to_file(text_list, output_path, max_batch_size=batch_size)
+    return engine.embed(text_list, max_batch_size=batch_size)
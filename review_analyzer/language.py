@@ -0,0 +1,185 @@
+"""
+Identificación de idioma por columnas, en paralelo y con caché por hash de texto.
+
+- Cada texto distinto se detecta una sola vez; los resultados se guardan en
+  SQLite (clave = sha1 del texto), así que volver a procesar el corpus o un
+  corpus ampliado solo detecta los textos nuevos. La caché guarda la salida de
+  langdetect sin el corte por longitud: `min_length` se aplica después, así que
+  cambiarlo no devuelve resultados calculados con otro corte.
+- La detección se reparte en bloques entre procesos; langdetect es determinista
+  porque cada proceso hereda `DetectorFactory.seed = 0`.
+- `filter_language` deja el corpus en un idioma (por defecto español) antes de
+  clasificarlo.
+
+Uso:
+    python -m review_analyzer.language --data data/processed/final_clean_dataset.csv \
+        --output data/interim/comentarios_es.csv --lang es
+"""
+import argparse
+import functools
+import hashlib
+import os
+import sqlite3
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import pycountry
+from langdetect import DetectorFactory, LangDetectException, detect
+
+from review_analyzer.config import FINAL_PROCESSED_DATA_PATH, LANGUAGE_CACHE_PATH
+
+DetectorFactory.seed = 0
+
+UNKNOWN = "unknown"
+
+
+def text_key(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _is_short(text, min_length=10):
+    return len(text.strip()) <= min_length
+
+
+def detect_language(text, min_length=10):
+    """Código ISO 639-1 del texto, o 'unknown' si es muy corto o no se puede detectar."""
+    if _is_short(text, min_length):
+        return UNKNOWN
+    try:
+        return detect(text)
+    except LangDetectException:
+        return UNKNOWN
+
+
+def _detect_chunk(texts):
+    # Sin corte por longitud: lo que se cachea no depende de min_length
+    return [detect_language(text, min_length=-1) for text in texts]
+
+
+@functools.lru_cache(maxsize=None)
+def language_name(code):
+    """
+    Traduce un código de idioma (ISO 639-1 o 639-3) a su nombre completo.
+    Si no se encuentra, devuelve el código original.
+    """
+    if code == UNKNOWN:
+        return 'Desconocido'
+    try:
+        lang = pycountry.languages.get(alpha_2=code)
+        if lang is None:
+            lang = pycountry.languages.get(alpha_3=code)
+        return lang.name if lang else code
+    except Exception:
+        return code
+
+
+class LanguageCache:
+    """Caché persistente (SQLite) de la salida de langdetect por hash de texto."""
+
+    def __init__(self, path=LANGUAGE_CACHE_PATH):
+        self.path = str(path)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        # La tabla anterior (languages) guardaba resultados con min_length=10 aplicado
+        self.conn.execute("CREATE TABLE IF NOT EXISTS detections (key TEXT PRIMARY KEY, lang TEXT NOT NULL)")
+        self.conn.commit()
+
+    def get_many(self, keys):
+        found = {}
+        keys = list(keys)
+        for start in range(0, len(keys), 900):
+            chunk = keys[start:start + 900]
+            placeholders = ",".join("?" * len(chunk))
+            found.update(self.conn.execute(
+                f"SELECT key, lang FROM detections WHERE key IN ({placeholders})", chunk
+            ).fetchall())
+        return found
+
+    def put_many(self, items):
+        self.conn.executemany("INSERT OR REPLACE INTO detections (key, lang) VALUES (?, ?)", items)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def detect_languages(texts, n_jobs=None, chunk_size=2000, min_length=10, cache_path=LANGUAGE_CACHE_PATH):
+    """
+    Detecta el idioma de cada texto de una columna.
+
+    Parámetros:
+    - texts: lista o Series de textos (los valores no string se tratan como vacíos).
+    - n_jobs: procesos en paralelo (None = todos los núcleos, 1 = sin procesos).
+    - chunk_size: textos por bloque enviado a cada proceso.
+    - min_length: textos con esta longitud o menos se marcan como 'unknown'.
+    - cache_path: base SQLite de la caché (None desactiva la persistencia).
+
+    Retorna:
+    - Lista de códigos de idioma en el orden de `texts`.
+    """
+    texts = [text if isinstance(text, str) else "" for text in texts]
+    # Los textos cortos no se detectan ni se cachean
+    keys = [None if _is_short(text, min_length) else text_key(text) for text in texts]
+    unique = {key: text for key, text in zip(keys, texts) if key is not None}
+
+    cache = LanguageCache(cache_path) if cache_path else None
+    found = cache.get_many(unique) if cache else {}
+    missing = [key for key in unique if key not in found]
+
+    if missing:
+        missing_texts = [unique[key] for key in missing]
+        n_jobs = n_jobs or os.cpu_count() or 1
+        if n_jobs == 1 or len(missing_texts) <= chunk_size:
+            detected = _detect_chunk(missing_texts)
+        else:
+            chunks = [missing_texts[i:i + chunk_size] for i in range(0, len(missing_texts), chunk_size)]
+            with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+                detected = [lang for chunk in pool.map(_detect_chunk, chunks) for lang in chunk]
+        new = dict(zip(missing, detected))
+        found.update(new)
+        if cache:
+            cache.put_many(new.items())
+
+    if cache:
+        cache.close()
+    return [UNKNOWN if key is None else found[key] for key in keys]
+
+
+def filter_language(df, text_col="text", lang="es", keep_unknown=False, lang_col=None, **kwargs):
+    """
+    Filtra un DataFrame a los comentarios en `lang`.
+
+    - keep_unknown: conservar también los textos sin idioma detectable (cortos, solo emojis).
+    - lang_col: si se indica, agrega al resultado una columna con el idioma detectado.
+    - kwargs: se pasan a `detect_languages` (n_jobs, cache_path, ...).
+    """
+    languages = detect_languages(df[text_col], **kwargs)
+    keep = [code == lang or (keep_unknown and code == UNKNOWN) for code in languages]
+    result = df.loc[keep].copy()
+    if lang_col:
+        result[lang_col] = [code for code, k in zip(languages, keep) if k]
+    return result
+
+
+def main(argv=None):
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="Filtra un corpus de comentarios por idioma")
+    parser.add_argument("--data", default=str(FINAL_PROCESSED_DATA_PATH))
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--text-col", default="text")
+    parser.add_argument("--lang", default="es")
+    parser.add_argument("--keep-unknown", action="store_true")
+    parser.add_argument("--jobs", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    df = pd.read_csv(args.data)
+    filtered = filter_language(df, args.text_col, args.lang, args.keep_unknown,
+                               lang_col="lang", n_jobs=args.jobs)
+    filtered.to_csv(args.output, index=False, encoding="utf-8")
+    print(f"{len(filtered):,} de {len(df):,} comentarios en '{args.lang}' guardados en {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+"""
+Métricas ligeras con formato de exposición Prometheus (sin dependencias externas).
+
+Pensadas para dejarse activas en producción: cada observación es una búsqueda
+binaria en los buckets y una suma bajo un lock.
+
+Ejemplo:
+    from review_analyzer.metrics import REGISTRY, timed
+
+    @timed("embeddings_batch_seconds")
+    def procesar(batch): ...
+
+    with timed("limpieza_seconds"):
+        ...
+
+    print(REGISTRY.render())
+
+Cada proceso tiene su propio registro. Con varios procesos detrás de un mismo
+puerto (`api/serve.py --workers N`), `set_labels(worker=...)` agrega una
+etiqueta fija a todas las series para que Prometheus no mezcle procesos
+distintos en una misma serie (y no lea el cambio de proceso como un reinicio).
+"""
+import functools
+import threading
+import time
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+RATIO_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in key) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text=""):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text="", buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def time(self):
+        return Timer(self)
+
+    def samples(self):
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            samples.append((f"{self.name}_bucket", (("le", f"{bound:g}"),), cumulative))
+        cumulative += counts[-1]
+        samples.append((f"{self.name}_bucket", (("le", "+Inf"),), cumulative))
+        samples.append((f"{self.name}_sum", (), total))
+        samples.append((f"{self.name}_count", (), cumulative))
+        return samples
+
+    def snapshot(self):
+        """Resumen (conteo, suma, media) para reportes en JSON."""
+        with self._lock:
+            count = sum(self._counts)
+            return {"count": count, "sum": round(self._sum, 6),
+                    "mean": round(self._sum / count, 6) if count else 0.0}
+
+
+class Timer:
+    """Mide la duración de un bloque (context manager) o de una función (decorador)."""
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self._start)
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with Timer(self.histogram):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+class Registry:
+    def __init__(self, prefix=""):
+        self.prefix = prefix
+        self.labels = ()
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def set_labels(self, **labels):
+        """Etiquetas fijas que se agregan a todas las series al exportar (p. ej. worker)."""
+        self.labels = _label_key({k: str(v) for k, v in labels.items()})
+
+    def _get(self, cls, name, help_text, **kwargs):
+        full_name = self.prefix + name
+        with self._lock:
+            metric = self._metrics.get(full_name)
+            if metric is None:
+                metric = cls(full_name, help_text, **kwargs)
+                self._metrics[full_name] = metric
+            return metric
+
+    def counter(self, name, help_text=""):
+        return self._get(Counter, name, help_text)
+
+    def gauge(self, name, help_text=""):
+        return self._get(Gauge, name, help_text)
+
+    def histogram(self, name, help_text="", buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help_text, buckets=buckets)
+
+    def render(self):
+        """Texto en formato de exposición Prometheus 0.0.4."""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            if metric.help:
+                lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, value in metric.samples():
+                lines.append(f"{name}{_format_labels(self.labels + key)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry(prefix="feeltrack_")
+
+
+def timed(name, help_text="", registry=REGISTRY, buckets=LATENCY_BUCKETS):
+    """
+    Histograma de duración por nombre, usable como decorador o context manager.
+    """
+    return registry.histogram(name, help_text, buckets).time()
@@ -0,0 +1,259 @@
+"""
+Backends de inferencia intercambiables para el modelo FeelTrack.
+
+- torch: PyTorch eager en fp32 (comportamiento original).
+- torch-int8: PyTorch con cuantización dinámica int8 de las capas lineales.
+- onnx: modelo exportado a ONNX y ejecutado con ONNX Runtime.
+
+Uso:
+    python -m review_analyzer.modeling.backends export [--model ...] [--output ...]
+    python -m review_analyzer.modeling.backends parity [--backends torch,torch-int8,onnx]
+"""
+import argparse
+import csv
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+from transformers import AutoConfig, AutoTokenizer, BertForSequenceClassification
+
+from review_analyzer.config import API_MODEL, FEELTRACK_MODEL, FINAL_PROCESSED_DATA_PATH, ONNX_MODEL_DIR
+from review_analyzer.modeling.inference import predict_probs
+
+BACKENDS = ("torch", "torch-int8", "onnx")
+
+
+class TorchBackend:
+    """PyTorch eager en fp32."""
+
+    name = "torch"
+
+    def __init__(self, model_path):
+        # low_cpu_mem_usage evita inicializar pesos aleatorios antes de cargar los reales
+        self.model = BertForSequenceClassification.from_pretrained(model_path, low_cpu_mem_usage=True)
+        self.model.eval()
+        self.config = self.model.config
+
+    def configure_threads(self, num_threads):
+        """Hilos intra-op por proceso (se llama en cada worker tras el fork)."""
+        torch.set_num_threads(num_threads)
+
+    def logits(self, batch):
+        inputs = {k: torch.from_numpy(v) for k, v in batch.items()}
+        with torch.no_grad():
+            return self.model(**inputs).logits.float().cpu().numpy()
+
+
+class QuantizedTorchBackend(TorchBackend):
+    """PyTorch con cuantización dinámica int8 de las capas nn.Linear."""
+
+    name = "torch-int8"
+
+    def __init__(self, model_path):
+        super().__init__(model_path)
+        self.model = torch.ao.quantization.quantize_dynamic(
+            self.model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+
+
+class OnnxBackend:
+    """Modelo exportado con `export_onnx`, ejecutado en ONNX Runtime (CPU)."""
+
+    name = "onnx"
+
+    def __init__(self, model_dir, num_threads=None):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("El backend 'onnx' requiere onnxruntime (pip install onnxruntime).") from e
+
+        model_file = Path(model_dir) / "model.onnx"
+        if not model_file.exists():
+            raise FileNotFoundError(
+                f"No existe {model_file}. Ejecuta primero: "
+                "python -m review_analyzer.modeling.backends export"
+            )
+
+        self._ort = ort
+        self.model_file = model_file
+        self.config = AutoConfig.from_pretrained(model_dir)
+        self.configure_threads(num_threads)
+
+    def configure_threads(self, num_threads):
+        """
+        Crea la sesión con `num_threads` hilos intra-op. El pool de hilos de ONNX
+        Runtime no sobrevive a un fork, así que cada worker recrea su sesión.
+        """
+        options = self._ort.SessionOptions()
+        options.graph_optimization_level = self._ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = self._ort.InferenceSession(
+            str(self.model_file), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {node.name for node in self.session.get_inputs()}
+
+    def logits(self, batch):
+        feeds = {k: v for k, v in batch.items() if k in self.input_names}
+        return self.session.run(["logits"], feeds)[0]
+
+
+def load_backend(name, model_path=FEELTRACK_MODEL, onnx_dir=None):
+    """
+    Instancia un backend por nombre.
+
+    Parámetros:
+    - name: 'torch', 'torch-int8' u 'onnx'.
+    - model_path: ruta local o id del Hub del modelo PyTorch, o (backend 'onnx')
+      una carpeta exportada con model.onnx.
+    - onnx_dir: carpeta con model.onnx, config y tokenizer (solo backend 'onnx').
+      Si `model_path` ya es una exportación se usa esa; sin ninguna de las dos,
+      solo el modelo por defecto cae en ONNX_MODEL_DIR.
+    """
+    if name == "torch":
+        return TorchBackend(model_path)
+    if name == "torch-int8":
+        return QuantizedTorchBackend(model_path)
+    if name == "onnx":
+        return OnnxBackend(resolve_onnx_dir(model_path, onnx_dir))
+    raise ValueError(f"Backend desconocido: {name!r}. Opciones: {', '.join(BACKENDS)}")
+
+
+def resolve_onnx_dir(model_path, onnx_dir=None):
+    """Carpeta ONNX a cargar para `model_path`; nunca sirve en silencio otra exportación."""
+    if (Path(model_path) / "model.onnx").is_file():
+        if onnx_dir is not None and Path(onnx_dir).resolve() != Path(model_path).resolve():
+            raise ValueError(f"model_path ({model_path}) y onnx_dir ({onnx_dir}) son exportaciones ONNX distintas.")
+        return model_path
+    if onnx_dir is not None:
+        return onnx_dir
+    if str(model_path) in (FEELTRACK_MODEL, str(API_MODEL)):
+        return ONNX_MODEL_DIR
+    raise ValueError(
+        f"{model_path} no contiene model.onnx: exportarlo con "
+        f"`python -m review_analyzer.modeling.backends export --model {model_path} --output ...` "
+        "y usar esa carpeta como modelo."
+    )
+
+
+def export_onnx(model_path=FEELTRACK_MODEL, output_dir=ONNX_MODEL_DIR, opset=17):
+    """
+    Exporta el modelo a ONNX con ejes dinámicos (batch y secuencia).
+
+    Guarda model.onnx junto con la configuración y el tokenizer para que el
+    backend 'onnx' no necesite el checkpoint original.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    model = BertForSequenceClassification.from_pretrained(model_path)
+    model.config.return_dict = False
+    model.eval()
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+
+    dummy = tokenizer(["me encanta este producto 😍"], return_tensors="pt")
+    input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["logits"] = {0: "batch"}
+
+    torch.onnx.export(
+        model,
+        tuple(dummy[name] for name in input_names),
+        str(output_dir / "model.onnx"),
+        input_names=input_names,
+        output_names=["logits"],
+        dynamic_axes=dynamic_axes,
+        opset_version=opset,
+    )
+
+    model.config.return_dict = True
+    model.config.save_pretrained(output_dir)
+    tokenizer.save_pretrained(output_dir)
+    return output_dir / "model.onnx"
+
+
+def load_sample_texts(path=FINAL_PROCESSED_DATA_PATH, n=256, text_col="text"):
+    """Lee los primeros `n` textos no vacíos de un CSV."""
+    texts = []
+    with open(path, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            text = (row.get(text_col) or "").strip()
+            if text:
+                texts.append(text)
+            if len(texts) >= n:
+                break
+    return texts
+
+
+def parity_check(texts, backends=BACKENDS, model_path=FEELTRACK_MODEL, onnx_dir=ONNX_MODEL_DIR,
+                 threshold=0.5, max_length=512):
+    """
+    Compara cada backend contra 'torch' sobre las mismas entradas.
+
+    Retorna un diccionario por backend con el acuerdo de etiquetas al umbral dado
+    (por celda y por texto completo), la diferencia máxima de probabilidad y el tiempo.
+    """
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    names = ["torch"] + [name for name in backends if name != "torch"]
+
+    outputs = {}
+    for name in names:
+        backend = load_backend(name, model_path, onnx_dir)
+        start = time.perf_counter()
+        outputs[name] = (predict_probs(backend, tokenizer, texts, max_length=max_length),
+                         time.perf_counter() - start)
+
+    reference = outputs["torch"][0] > threshold
+    report = {}
+    for name, (probs, seconds) in outputs.items():
+        labels = probs > threshold
+        report[name] = {
+            "label_agreement": float((labels == reference).mean()),
+            "exact_match": float((labels == reference).all(axis=1).mean()),
+            "max_abs_diff": float(np.abs(probs - outputs["torch"][0]).max()),
+            "seconds": round(seconds, 3),
+        }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backends de inferencia FeelTrack")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export", help="Exporta el modelo a ONNX")
+    export.add_argument("--model", default=FEELTRACK_MODEL)
+    export.add_argument("--output", default=str(ONNX_MODEL_DIR))
+    export.add_argument("--opset", type=int, default=17)
+
+    parity = sub.add_parser("parity", help="Compara etiquetas entre backends")
+    parity.add_argument("--model", default=FEELTRACK_MODEL)
+    parity.add_argument("--onnx-dir", default=str(ONNX_MODEL_DIR))
+    parity.add_argument("--backends", default=",".join(BACKENDS))
+    parity.add_argument("--data", default=str(FINAL_PROCESSED_DATA_PATH))
+    parity.add_argument("--n", type=int, default=256)
+    parity.add_argument("--threshold", type=float, default=0.5)
+    parity.add_argument("--min-agreement", type=float, default=0.99,
+                        help="Acuerdo mínimo de textos idénticos para aprobar")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        path = export_onnx(args.model, args.output, args.opset)
+        print(f"Modelo ONNX guardado: {path}")
+        return 0
+
+    texts = load_sample_texts(args.data, args.n)
+    report = parity_check(texts, args.backends.split(","), args.model, args.onnx_dir, args.threshold)
+    ok = True
+    for name, row in report.items():
+        passed = row["exact_match"] >= args.min_agreement
+        ok = ok and passed
+        print(f"{name:<11} etiquetas={row['label_agreement']:.4f} textos={row['exact_match']:.4f} "
+              f"max_diff={row['max_abs_diff']:.4f} tiempo={row['seconds']}s {'OK' if passed else 'FALLA'}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
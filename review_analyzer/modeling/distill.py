@@ -0,0 +1,294 @@
+"""
+Destilación del modelo FeelTrack en un estudiante liviano para servir con alto throughput.
+
+- El maestro (modelo actual) puntúa una sola vez los comentarios sin etiquetar
+  con el CLI de scoring offline; sus probabilidades sigmoid son los objetivos.
+- El estudiante es un BERT con menos capas (4-6) inicializado con capas del
+  maestro repartidas uniformemente (mismo vocabulario y tokenizer), entrenado
+  con BCE sobre los objetivos blandos usando el mismo bucle que `train.py`.
+- El artefacto es un `BertForSequenceClassification` normal: la API lo sirve
+  con SERVING_MODE=student o en cascada (SERVING_MODE=cascade), donde los textos
+  con alguna etiqueta cerca del umbral se reenvían al maestro.
+- `report` compara calidad y latencia de maestro, estudiante y cascada.
+
+Uso:
+    python -m review_analyzer.modeling.distill train [--data ...] [--layers 6]
+    python -m review_analyzer.modeling.distill report [--data ...] [--margin 0.15]
+"""
+import argparse
+import copy
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from review_analyzer.config import (
+    API_MODEL,
+    DISTILLATION_REPORT_PATH,
+    FEELTRACK_MODEL,
+    FINAL_PROCESSED_DATA_PATH,
+    GOLDEN_SET_LABELED_PATH,
+    PREDICTIONS_DIR,
+    STUDENT_MODEL_DIR,
+    THRESHOLDS_PATH,
+    TOKEN_CACHE_DIR,
+)
+from review_analyzer.modeling.inference import predict_probs, select_labels, uncertain_rows
+from review_analyzer.modeling.train import TokenCache, fit
+
+DEFAULT_TEACHER = str(API_MODEL) if (API_MODEL / "config.json").exists() else FEELTRACK_MODEL
+
+
+def make_student(teacher_path, num_layers=6):
+    """
+    BERT de `num_layers` capas inicializado desde el maestro: embeddings, pooler,
+    clasificador y capas del encoder repartidas uniformemente (incluye la primera y la última).
+    """
+    from transformers import BertForSequenceClassification
+
+    teacher = BertForSequenceClassification.from_pretrained(teacher_path)
+    teacher_layers = teacher.config.num_hidden_layers
+    if not 1 <= num_layers <= teacher_layers:
+        raise ValueError(f"El estudiante debe tener entre 1 y {teacher_layers} capas.")
+    keep = np.linspace(0, teacher_layers - 1, num_layers).round().astype(int).tolist()
+
+    config = copy.deepcopy(teacher.config)
+    config.num_hidden_layers = num_layers
+    config.distilled_from = str(teacher_path)
+    config.teacher_layers = keep
+    student = BertForSequenceClassification(config)
+
+    student.bert.embeddings.load_state_dict(teacher.bert.embeddings.state_dict())
+    for i, j in enumerate(keep):
+        student.bert.encoder.layer[i].load_state_dict(teacher.bert.encoder.layer[j].state_dict())
+    if teacher.bert.pooler is not None:
+        student.bert.pooler.load_state_dict(teacher.bert.pooler.state_dict())
+    student.classifier.load_state_dict(teacher.classifier.state_dict())
+    return student
+
+
+def read_texts(data_path, text_col="text"):
+    """Textos del archivo en orden de filas (mismo orden que el scoring offline)."""
+    from review_analyzer.modeling.predict import iter_text_chunks
+
+    return [text for chunk in iter_text_chunks(data_path, text_col) for text in chunk]
+
+
+def teacher_targets(data_path, teacher_path, backend_name="torch", text_col="text", max_length=128,
+                    workers=1):
+    """
+    Probabilidades del maestro para cada texto no vacío de `data_path`.
+
+    Reutiliza (o completa) la corrida de scoring offline en PREDICTIONS_DIR/<nombre>-teacher.
+
+    Retorna (textos, probabilidades float16, metadata de la corrida).
+    """
+    from review_analyzer.modeling.predict import run_prediction
+
+    data_path = Path(data_path)
+    run = run_prediction(data_path, PREDICTIONS_DIR / f"{data_path.stem}-teacher", text_col, backend_name,
+                         teacher_path, thresholds_path=None, max_length=max_length, workers=workers)
+    texts = read_texts(data_path, text_col)
+    valid = np.array([isinstance(t, str) and bool(t.strip()) for t in texts], dtype=bool)
+    probs = np.load(run.probs_path, mmap_mode="r")[valid]
+    return [t for t, ok in zip(texts, valid) if ok], np.asarray(probs, dtype=np.float16), run.meta
+
+
+def distill(data_path=FINAL_PROCESSED_DATA_PATH, teacher_path=DEFAULT_TEACHER, output_dir=STUDENT_MODEL_DIR,
+            num_layers=6, run_name="feeltrack-student", text_col="text", max_length=128,
+            backend_name="torch", workers=1, resume=False, **fit_kwargs):
+    """
+    Entrena el estudiante sobre las salidas sigmoid del maestro y lo guarda en `output_dir`.
+
+    `fit_kwargs` se pasan a `train.fit` (epochs, batch_size, learning_rate, ...).
+    """
+    from transformers import AutoTokenizer, BertForSequenceClassification
+
+    texts, targets, run_meta = teacher_targets(data_path, teacher_path, backend_name, text_col,
+                                               max_length, workers)
+    tokenizer = AutoTokenizer.from_pretrained(teacher_path)
+
+    key_payload = json.dumps([run_meta["source"], run_meta["source_size"], str(teacher_path), max_length])
+    key = hashlib.sha1(key_payload.encode("utf-8")).hexdigest()[:16]
+    cache_path = TOKEN_CACHE_DIR / f"{Path(data_path).stem}-distill-{key}"
+    if (cache_path / "meta.json").exists():
+        cache = TokenCache(cache_path)
+    else:
+        cache = TokenCache.write(cache_path, texts, targets, tokenizer, max_length, source=str(data_path),
+                                 teacher=str(teacher_path), labels=run_meta["labels"])
+    print(f"Objetivos del maestro: {len(cache):,} textos, {cache.meta['n_tokens']:,} tokens ({cache.path})")
+
+    def load_model(checkpoint):
+        if checkpoint:
+            return BertForSequenceClassification.from_pretrained(checkpoint)
+        return make_student(teacher_path, num_layers)
+
+    fit_kwargs.setdefault("learning_rate", 5e-5)
+    return fit(load_model, tokenizer, cache, output_dir, run_name, resume=resume,
+               state={"teacher": str(teacher_path), "num_layers": num_layers}, **fit_kwargs)
+
+
+def measure_latency(backend, tokenizer, texts, max_length=128, single=100):
+    """Throughput por lotes (textos/s) y latencia de un texto por petición (p50/p95 en ms)."""
+    start = time.perf_counter()
+    probs = predict_probs(backend, tokenizer, texts, max_length)
+    batch_seconds = time.perf_counter() - start
+
+    latencies = []
+    for text in texts[:single]:
+        start = time.perf_counter()
+        predict_probs(backend, tokenizer, [text], max_length)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return probs, {
+        "texts_per_second": round(len(texts) / batch_seconds, 1),
+        "single_p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "single_p95_ms": round(float(np.percentile(latencies, 95)), 2),
+    }
+
+
+def agreement(probs, reference_probs, thresholds):
+    """Acuerdo de etiquetas contra las del maestro (por celda, por texto y micro-F1)."""
+    pred = select_labels(probs, thresholds)
+    ref = select_labels(reference_probs, thresholds)
+    tp = (pred & ref).sum()
+    denom = pred.sum() + ref.sum()
+    return {
+        "label_agreement": round(float((pred == ref).mean()), 4),
+        "exact_match": round(float((pred == ref).all(axis=1).mean()), 4),
+        "micro_f1_vs_teacher": round(float(2 * tp / denom) if denom else 1.0, 4),
+        "mean_abs_prob_diff": round(float(np.abs(probs - reference_probs).mean()), 5),
+    }
+
+
+def compare(data_path=FINAL_PROCESSED_DATA_PATH, teacher_path=DEFAULT_TEACHER, student_path=STUDENT_MODEL_DIR,
+            backend_name="torch", text_col="text", n_texts=2000, margin=0.15, max_length=128,
+            thresholds_path=THRESHOLDS_PATH, labeled_path=GOLDEN_SET_LABELED_PATH, seed=0):
+    """
+    Reporte maestro vs estudiante vs cascada: acuerdo con el maestro sobre una
+    muestra de comentarios, métricas contra el set etiquetado (si existe),
+    fracción enrutada al maestro y latencia/throughput de cada modelo.
+    """
+    from transformers import AutoTokenizer
+
+    from review_analyzer.modeling.backends import load_backend
+    from review_analyzer.modeling.evaluate import evaluate
+    from review_analyzer.modeling.thresholds import label_matrix, load_thresholds
+
+    teacher = load_backend(backend_name, teacher_path)
+    student = load_backend(backend_name, student_path)
+    teacher_tok = AutoTokenizer.from_pretrained(teacher_path)
+    student_tok = AutoTokenizer.from_pretrained(student_path)
+    labels = [teacher.config.id2label[i] for i in range(teacher.config.num_labels)]
+    if [student.config.id2label[i] for i in range(student.config.num_labels)] != labels:
+        raise ValueError("El estudiante y el maestro no tienen las mismas etiquetas.")
+    if thresholds_path and os.path.exists(thresholds_path):
+        thresholds = load_thresholds(thresholds_path, labels)
+    else:
+        thresholds = np.full(len(labels), 0.5, dtype=np.float32)
+
+    texts = [t for t in read_texts(data_path, text_col) if isinstance(t, str) and t.strip()]
+    rng = np.random.default_rng(seed)
+    texts = [texts[i] for i in rng.choice(len(texts), min(n_texts, len(texts)), replace=False)]
+
+    teacher_probs, teacher_latency = measure_latency(teacher, teacher_tok, texts, max_length)
+    student_probs, student_latency = measure_latency(student, student_tok, texts, max_length)
+
+    # Cascada: el estudiante responde todo y el maestro solo los textos inciertos
+    routed = uncertain_rows(student_probs, thresholds, margin)
+    start = time.perf_counter()
+    cascade_probs = predict_probs(student, student_tok, texts, max_length)
+    if routed.any():
+        cascade_probs[routed] = predict_probs(teacher, teacher_tok, [t for t, r in zip(texts, routed) if r],
+                                              max_length)
+    cascade_seconds = time.perf_counter() - start
+
+    report = {
+        "teacher": str(teacher_path),
+        "student": str(student_path),
+        "student_layers": student.config.num_hidden_layers,
+        "teacher_layers": teacher.config.num_hidden_layers,
+        "n_texts": len(texts),
+        "margin": margin,
+        "latency": {
+            "teacher": teacher_latency,
+            "student": student_latency,
+            "cascade": {"texts_per_second": round(len(texts) / cascade_seconds, 1)},
+        },
+        "agreement_with_teacher": {
+            "student": agreement(student_probs, teacher_probs, thresholds),
+            "cascade": {**agreement(cascade_probs, teacher_probs, thresholds),
+                        "routed_fraction": round(float(routed.mean()), 4)},
+        },
+    }
+
+    if labeled_path and os.path.exists(labeled_path):
+        import pandas as pd
+
+        df = pd.read_csv(labeled_path)
+        df = df[df[text_col].notna()]
+        gold_texts = df[text_col].astype(str).tolist()
+        y_true = label_matrix(df, labels)
+        gold_teacher = predict_probs(teacher, teacher_tok, gold_texts, max_length)
+        gold_student = predict_probs(student, student_tok, gold_texts, max_length)
+        gold_routed = uncertain_rows(gold_student, thresholds, margin)
+        gold_cascade = gold_student.copy()
+        gold_cascade[gold_routed] = gold_teacher[gold_routed]
+        report["labeled"] = {"source": str(labeled_path), "n_samples": len(gold_texts)}
+        for name, probs in (("teacher", gold_teacher), ("student", gold_student), ("cascade", gold_cascade)):
+            result = evaluate(probs, y_true, labels, thresholds)
+            report["labeled"][name] = {"micro": result["micro"], "macro": result["macro"]}
+        report["labeled"]["cascade"]["routed_fraction"] = round(float(gold_routed.mean()), 4)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Destilación del modelo FeelTrack")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    train_cmd = sub.add_parser("train", help="Entrena el estudiante con las salidas del maestro")
+    train_cmd.add_argument("--data", default=str(FINAL_PROCESSED_DATA_PATH))
+    train_cmd.add_argument("--teacher", default=DEFAULT_TEACHER)
+    train_cmd.add_argument("--output-dir", default=str(STUDENT_MODEL_DIR))
+    train_cmd.add_argument("--layers", type=int, default=6)
+    train_cmd.add_argument("--run-name", default="feeltrack-student")
+    train_cmd.add_argument("--max-length", type=int, default=128)
+    train_cmd.add_argument("--epochs", type=int, default=3)
+    train_cmd.add_argument("--batch-size", type=int, default=32)
+    train_cmd.add_argument("--grad-accum-steps", type=int, default=2)
+    train_cmd.add_argument("--lr", type=float, default=5e-5)
+    train_cmd.add_argument("--workers", type=int, default=1, help="Procesos para puntuar con el maestro")
+    train_cmd.add_argument("--resume", action="store_true")
+
+    report_cmd = sub.add_parser("report", help="Compara calidad y latencia de maestro, estudiante y cascada")
+    report_cmd.add_argument("--data", default=str(FINAL_PROCESSED_DATA_PATH))
+    report_cmd.add_argument("--teacher", default=DEFAULT_TEACHER)
+    report_cmd.add_argument("--student", default=str(STUDENT_MODEL_DIR))
+    report_cmd.add_argument("--backend", default="torch")
+    report_cmd.add_argument("--n-texts", type=int, default=2000)
+    report_cmd.add_argument("--margin", type=float, default=0.15)
+    report_cmd.add_argument("--max-length", type=int, default=128)
+    report_cmd.add_argument("--output", default=str(DISTILLATION_REPORT_PATH))
+
+    args = parser.parse_args(argv)
+
+    if args.command == "train":
+        distill(args.data, args.teacher, args.output_dir, args.layers, args.run_name,
+                max_length=args.max_length, workers=args.workers, resume=args.resume, epochs=args.epochs,
+                batch_size=args.batch_size, grad_accum_steps=args.grad_accum_steps, learning_rate=args.lr)
+        return 0
+
+    report = compare(args.data, args.teacher, args.student, args.backend, n_texts=args.n_texts,
+                     margin=args.margin, max_length=args.max_length)
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
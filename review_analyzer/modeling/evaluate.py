@@ -0,0 +1,355 @@
+"""
+Evaluación vectorizada del modelo multi-etiqueta sobre logits cacheados.
+
+Trabaja sobre la caché de `thresholds.py logits` (logits + etiquetas reales), así
+que evaluar, barrer umbrales o calcular intervalos de confianza no vuelve a
+ejecutar el modelo.
+
+- Por etiqueta: soporte, TP/FP/FN/TN, precisión, recall, F1 y PR-AUC (average
+  precision, con empates agrupados como en scikit-learn).
+- Agregados micro y macro, exact match y hamming loss.
+- Intervalos bootstrap: las réplicas se expresan como pesos multinomiales por
+  fila, de modo que los conteos de un bloque de réplicas son un producto de
+  matrices; los bloques se reparten entre hilos.
+- Barrido de umbrales globales y umbrales óptimos por etiqueta (`fit_thresholds`).
+
+Uso:
+    python -m review_analyzer.modeling.evaluate [--logits ...] [--thresholds ...] [--bootstrap 1000]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from review_analyzer.config import EVALUATION_REPORT_PATH, GOLDEN_SET_LOGITS_PATH, THRESHOLDS_PATH
+from review_analyzer.modeling.inference import LABEL_TRANSLATIONS, select_labels, sigmoid
+from review_analyzer.modeling.thresholds import fit_thresholds, load_thresholds
+
+SWEEP_GRID = np.round(np.arange(0.05, 0.951, 0.05), 2)
+
+
+def _divide(num, den):
+    num = np.asarray(num, dtype=np.float64)
+    den = np.asarray(den, dtype=np.float64)
+    return np.divide(num, den, out=np.zeros(np.broadcast(num, den).shape), where=den > 0)
+
+
+def _round(value):
+    """Métrica redondeada para el JSON; None si no está definida (NaN)."""
+    value = float(value)
+    return round(value, 4) if np.isfinite(value) else None
+
+
+def _fmt(value):
+    return f"{value:>6.3f}" if value is not None else f"{'-':>6}"
+
+
+def confusion_counts(y_true, y_pred, weights=None):
+    """
+    TP, FP, FN y TN por etiqueta.
+
+    Con `weights` de forma (n,) o (réplicas, n) los conteos se ponderan por fila;
+    en el segundo caso se obtienen los conteos de todas las réplicas a la vez.
+    """
+    y_true = np.asarray(y_true, dtype=bool)
+    y_pred = np.asarray(y_pred, dtype=bool)
+    if weights is None:
+        tp = (y_true & y_pred).sum(axis=0)
+        fp = (~y_true & y_pred).sum(axis=0)
+        fn = (y_true & ~y_pred).sum(axis=0)
+        total = len(y_true)
+    else:
+        w = np.asarray(weights, dtype=np.float32)
+        tp = w @ (y_true & y_pred).astype(np.float32)
+        fp = w @ (~y_true & y_pred).astype(np.float32)
+        fn = w @ (y_true & ~y_pred).astype(np.float32)
+        total = w.sum(axis=-1, keepdims=w.ndim > 1)
+    return tp, fp, fn, total - tp - fp - fn
+
+
+def precision_recall_f1(tp, fp, fn):
+    """Precisión, recall y F1 (0 cuando el denominador es 0)."""
+    precision = _divide(tp, tp + fp)
+    recall = _divide(tp, tp + fn)
+    return precision, recall, _divide(2 * tp, 2 * tp + fp + fn)
+
+
+def _last_of_runs(keys):
+    """Para cada posición, índice del último elemento de su racha de valores iguales."""
+    n = len(keys)
+    is_last = np.ones(n, dtype=bool)
+    is_last[:-1] = keys[1:] != keys[:-1]
+    last = np.where(is_last, np.arange(n), n)
+    return np.minimum.accumulate(last[::-1])[::-1]
+
+
+def pr_auc_plan(probs, y_true):
+    """
+    Precalcula lo que no depende de los pesos de fila para `average_precision`:
+    orden por probabilidad de cada etiqueta, fin del grupo de empates de cada
+    positivo y su último compañero de grupo. Se reutiliza entre réplicas bootstrap.
+    """
+    probs_t = np.ascontiguousarray(np.asarray(probs, dtype=np.float32).T)
+    y_t = np.ascontiguousarray(np.asarray(y_true, dtype=bool).T)
+    num_labels, n = probs_t.shape
+
+    order = np.argsort(-probs_t, axis=1, kind="stable")
+    sorted_probs = np.take_along_axis(probs_t, order, axis=1)
+    hits = np.take_along_axis(y_t, order, axis=1)
+
+    # Fin del grupo de empates de cada posición (en el orden descendente)
+    is_end = np.ones((num_labels, n), dtype=bool)
+    is_end[:, :-1] = sorted_probs[:, 1:] != sorted_probs[:, :-1]
+    ends = np.where(is_end, np.arange(n), n)
+    ends = np.minimum.accumulate(ends[:, ::-1], axis=1)[:, ::-1]
+
+    cols, pos = np.nonzero(hits)
+    group_end = ends[cols, pos]
+    return {
+        "order": order,
+        "cols": cols,
+        "pos": pos,
+        "group_end": group_end,
+        "last_in_group": _last_of_runs(cols.astype(np.int64) * (n + 1) + group_end),
+        "first_in_col": np.searchsorted(cols, np.arange(num_labels)),
+        "num_labels": num_labels,
+    }
+
+
+def average_precision(probs, y_true, weights=None, plan=None):
+    """
+    PR-AUC (average precision) por columna, todas las etiquetas a la vez.
+
+    AP = Σ (R_k - R_{k-1}) · P_k evaluado solo en los cortes entre valores
+    distintos de probabilidad, así los empates no dependen del orden. Solo los
+    grupos con positivos aportan, de modo que, además de una suma acumulada de
+    pesos por etiqueta, el costo es proporcional al número de positivos.
+
+    Parámetros:
+    - probs, y_true: arrays (n, num_labels).
+    - weights: pesos opcionales por fila (réplicas bootstrap).
+    - plan: resultado de `pr_auc_plan` (se reutiliza entre réplicas).
+
+    Retorna:
+    - Array (num_labels,); NaN en etiquetas sin positivos.
+    """
+    if plan is None:
+        plan = pr_auc_plan(probs, y_true)
+    order, cols, pos = plan["order"], plan["cols"], plan["pos"]
+    num_labels = plan["num_labels"]
+
+    if weights is None:
+        predicted_at_end = plan["group_end"] + 1.0
+        w_pos = np.ones(len(cols))
+    else:
+        w_sorted = np.asarray(weights, dtype=np.float64)[order]
+        predicted_at_end = np.cumsum(w_sorted, axis=1)[cols, plan["group_end"]]
+        w_pos = w_sorted[cols, pos]
+
+    # TP acumulado hasta el final del grupo de cada positivo (suma por etiqueta)
+    tp_cum = np.cumsum(w_pos)
+    col_offset = np.zeros(num_labels)
+    has_pos = plan["first_in_col"] < len(cols)
+    first = plan["first_in_col"][has_pos]
+    col_offset[has_pos] = tp_cum[first] - w_pos[first]
+    tp_at_end = tp_cum[plan["last_in_group"]] - col_offset[cols]
+
+    terms = w_pos * _divide(tp_at_end, predicted_at_end)
+    area = np.bincount(cols, weights=terms, minlength=num_labels)
+    positives = np.bincount(cols, weights=w_pos, minlength=num_labels)
+    return np.where(positives > 0, _divide(area, positives), np.nan)
+
+
+def summarize(probs, y_true, y_pred, weights=None, pr_auc=True):
+    """Métricas micro/macro (y PR-AUC) para una evaluación o una réplica ponderada."""
+    tp, fp, fn, tn = confusion_counts(y_true, y_pred, weights)
+    precision, recall, f1 = precision_recall_f1(tp, fp, fn)
+    micro_p, micro_r, micro_f1 = precision_recall_f1(tp.sum(), fp.sum(), fn.sum())
+    support = tp + fn
+
+    summary = {
+        "micro": {"precision": float(micro_p), "recall": float(micro_r), "f1": float(micro_f1)},
+        "macro": {"precision": float(precision.mean()), "recall": float(recall.mean()), "f1": float(f1.mean())},
+        "per_label": {"tp": tp, "fp": fp, "fn": fn, "tn": tn, "support": support,
+                      "precision": precision, "recall": recall, "f1": f1},
+    }
+    if pr_auc:
+        ap = average_precision(probs, y_true, weights)
+        micro_weights = None if weights is None else np.repeat(np.asarray(weights), probs.shape[1])
+        micro_ap = average_precision(probs.reshape(-1, 1), y_true.reshape(-1, 1), micro_weights)
+        # PR-AUC no está definido en etiquetas sin positivos: quedan fuera del promedio macro
+        has_positives = np.isfinite(ap)
+        summary["per_label"]["pr_auc"] = ap
+        summary["micro"]["pr_auc"] = float(micro_ap[0])
+        summary["macro"]["pr_auc"] = float(ap[has_positives].mean()) if has_positives.any() else float("nan")
+    return summary
+
+
+def evaluate(probs, y_true, labels, thresholds=0.5, top_k=None):
+    """
+    Reporte completo de una evaluación.
+
+    Parámetros:
+    - probs: probabilidades (n, num_labels).
+    - y_true: matriz booleana de etiquetas reales.
+    - labels: nombres de las etiquetas (en el orden de las columnas).
+    - thresholds: umbral escalar o vector por etiqueta.
+    - top_k: evaluar seleccionando las k etiquetas más probables por texto.
+    """
+    probs = np.asarray(probs, dtype=np.float32)
+    y_true = np.asarray(y_true, dtype=bool)
+    y_pred = select_labels(probs, thresholds, top_k)
+    summary = summarize(probs, y_true, y_pred)
+    thresholds = np.broadcast_to(np.asarray(thresholds, dtype=np.float32), (len(labels),))
+
+    per_label = summary["per_label"]
+    rows = []
+    for j, label in enumerate(labels):
+        rows.append({
+            "label": label,
+            "label_es": LABEL_TRANSLATIONS.get(label, label),
+            "threshold": round(float(thresholds[j]), 4),
+            **{key: int(per_label[key][j]) for key in ("support", "tp", "fp", "fn", "tn")},
+            **{key: _round(per_label[key][j]) for key in ("precision", "recall", "f1", "pr_auc")},
+        })
+
+    return {
+        "n_samples": int(len(probs)),
+        "micro": {k: _round(v) for k, v in summary["micro"].items()},
+        "macro": {k: _round(v) for k, v in summary["macro"].items()},
+        "exact_match": round(float((y_pred == y_true).all(axis=1).mean()), 4),
+        "hamming_loss": round(float((y_pred != y_true).mean()), 4),
+        "per_label": rows,
+    }
+
+
+def bootstrap_ci(probs, y_true, thresholds=0.5, n_boot=1000, alpha=0.05, seed=0, n_jobs=None,
+                 pr_auc=True, max_block_cells=20_000_000):
+    """
+    Intervalos de confianza bootstrap (percentiles) de las métricas micro/macro y
+    del F1 por etiqueta.
+
+    Cada réplica es un vector de pesos multinomiales sobre las filas; un bloque de
+    réplicas se evalúa con un solo producto de matrices. Los bloques se reparten
+    entre `n_jobs` hilos (NumPy libera el GIL en estas operaciones).
+    """
+    probs = np.asarray(probs, dtype=np.float32)
+    y_true = np.asarray(y_true, dtype=bool)
+    y_pred = select_labels(probs, thresholds)
+    n = len(probs)
+    plan = pr_auc_plan(probs, y_true) if pr_auc else None
+
+    block = max(1, min(n_boot, max_block_cells // max(n, 1)))
+    sizes = [min(block, n_boot - start) for start in range(0, n_boot, block)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    def run_block(args):
+        size, block_seed = args
+        rng = np.random.default_rng(block_seed)
+        # Remuestreo con reemplazo expresado como conteos por fila
+        weights = np.stack([np.bincount(rng.integers(0, n, n), minlength=n) for _ in range(size)])
+        weights = weights.astype(np.float32)
+        tp, fp, fn, _ = confusion_counts(y_true, y_pred, weights)
+        precision, recall, f1 = precision_recall_f1(tp, fp, fn)
+        micro = precision_recall_f1(tp.sum(axis=1), fp.sum(axis=1), fn.sum(axis=1))
+        values = {
+            "micro_precision": micro[0], "micro_recall": micro[1], "micro_f1": micro[2],
+            "macro_precision": precision.mean(axis=1), "macro_recall": recall.mean(axis=1),
+            "macro_f1": f1.mean(axis=1), "per_label_f1": f1,
+        }
+        if pr_auc:
+            values["macro_pr_auc"] = np.array([np.nanmean(average_precision(probs, y_true, w, plan))
+                                               for w in weights])
+        return values
+
+    with ThreadPoolExecutor(max_workers=n_jobs or os.cpu_count() or 1) as pool:
+        blocks = list(pool.map(run_block, zip(sizes, seeds)))
+
+    lower, upper = 100 * alpha / 2, 100 * (1 - alpha / 2)
+    result = {"n_boot": n_boot, "alpha": alpha}
+    for key in blocks[0]:
+        values = np.concatenate([b[key] for b in blocks], axis=0)
+        low, high = np.nanpercentile(values, [lower, upper], axis=0)
+        if key == "per_label_f1":
+            result[key] = {"lower": np.round(low, 4).tolist(), "upper": np.round(high, 4).tolist()}
+        else:
+            result[key] = [round(float(low), 4), round(float(high), 4)]
+    return result
+
+
+def threshold_sweep(probs, y_true, grid=SWEEP_GRID):
+    """Métricas micro/macro con un mismo umbral global para cada valor de `grid`."""
+    probs = np.asarray(probs, dtype=np.float32)
+    y_true = np.asarray(y_true, dtype=bool)
+    rows = []
+    for threshold in grid:
+        summary = summarize(probs, y_true, probs > threshold, pr_auc=False)
+        rows.append({
+            "threshold": float(threshold),
+            **{f"micro_{k}": round(v, 4) for k, v in summary["micro"].items()},
+            **{f"macro_{k}": round(v, 4) for k, v in summary["macro"].items()},
+        })
+    return rows
+
+
+def load_cached_logits(path=GOLDEN_SET_LOGITS_PATH):
+    """Probabilidades, etiquetas reales y nombres de etiqueta de una caché de logits."""
+    cached = np.load(path)
+    return sigmoid(cached["logits"]), cached["y_true"].astype(bool), cached["labels"].tolist()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluación del modelo sobre logits cacheados")
+    parser.add_argument("--logits", default=str(GOLDEN_SET_LOGITS_PATH))
+    parser.add_argument("--thresholds", default=str(THRESHOLDS_PATH),
+                        help="JSON de umbrales por etiqueta (0.5 si no existe)")
+    parser.add_argument("--bootstrap", type=int, default=1000, help="Réplicas bootstrap (0 = sin intervalos)")
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--jobs", type=int, default=None)
+    parser.add_argument("--no-sweep", action="store_true")
+    parser.add_argument("--output", default=str(EVALUATION_REPORT_PATH))
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    probs, y_true, labels = load_cached_logits(args.logits)
+    if os.path.exists(args.thresholds):
+        thresholds = load_thresholds(args.thresholds, labels)
+    else:
+        thresholds = np.full(len(labels), 0.5, dtype=np.float32)
+
+    report = {"source": str(args.logits), **evaluate(probs, y_true, labels, thresholds)}
+    if args.bootstrap:
+        report["bootstrap"] = bootstrap_ci(probs, y_true, thresholds, args.bootstrap, args.alpha, n_jobs=args.jobs)
+    if not args.no_sweep:
+        report["threshold_sweep"] = threshold_sweep(probs, y_true)
+        fitted, _ = fit_thresholds(probs, y_true)
+        report["fitted_thresholds"] = {
+            "thresholds": {label: round(float(t), 4) for label, t in zip(labels, fitted)},
+            **{k: v for k, v in evaluate(probs, y_true, labels, fitted).items() if k in ("micro", "macro")},
+        }
+    report["seconds"] = round(time.perf_counter() - start, 3)
+
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    print(f"{'etiqueta':<16} {'soporte':>7} {'prec':>6} {'rec':>6} {'f1':>6} {'pr_auc':>6}")
+    for row in report["per_label"]:
+        print(f"{row['label']:<16} {row['support']:>7} {row['precision']:>6.3f} {row['recall']:>6.3f} "
+              f"{row['f1']:>6.3f} {_fmt(row['pr_auc'])}")
+    for avg in ("micro", "macro"):
+        m = report[avg]
+        ci = report.get("bootstrap", {}).get(f"{avg}_f1")
+        print(f"{avg:<16} {'':>7} {m['precision']:>6.3f} {m['recall']:>6.3f} {m['f1']:>6.3f} {_fmt(m['pr_auc'])}"
+              + (f"  IC F1 [{ci[0]:.3f}, {ci[1]:.3f}]" if ci else ""))
+    print(f"Reporte guardado en {output} ({report['seconds']}s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,279 @@
+import time
+
+import numpy as np
+
+from review_analyzer.metrics import RATIO_BUCKETS, REGISTRY, SIZE_BUCKETS
+
+TOKENIZE_SECONDS = REGISTRY.histogram("tokenize_seconds", "Tiempo de tokenización por llamada al motor")
+FORWARD_SECONDS = REGISTRY.histogram("forward_seconds", "Tiempo de forward por sub-batch")
+BATCH_SIZE = REGISTRY.histogram("forward_batch_size", "Textos por sub-batch", SIZE_BUCKETS)
+BATCH_TOKENS = REGISTRY.histogram("forward_batch_tokens", "Tokens (con padding) por sub-batch", SIZE_BUCKETS)
+PADDING_RATIO = REGISTRY.histogram("padding_ratio", "Fracción de tokens de padding por sub-batch", RATIO_BUCKETS)
+LONG_TEXTS = REGISTRY.counter("long_texts_total", "Textos divididos en más de una ventana (modo long_text)")
+TEXT_WINDOWS = REGISTRY.counter("text_windows_total", "Ventanas puntuadas en modo long_text")
+
+# Combinación de las probabilidades de las ventanas de un texto largo
+WINDOW_POOLING = ("max", "mean")
+
+# Nombres en español de las etiquetas GoEmotions (API, scoring offline y reportes)
+LABEL_TRANSLATIONS = {
+    "admiration": "admiración", "amusement": "diversión", "anger": "ira", "annoyance": "molestia",
+    "approval": "aprobación", "caring": "cuidado", "confusion": "confusión", "curiosity": "curiosidad",
+    "desire": "deseo", "disappointment": "decepción", "disapproval": "desaprobación", "disgust": "asco",
+    "embarrassment": "vergüenza", "excitement": "emoción", "fear": "miedo", "gratitude": "gratitud",
+    "grief": "duelo", "joy": "alegría", "love": "amor", "nervousness": "nerviosismo",
+    "neutral": "neutral", "optimism": "optimismo", "pride": "orgullo", "realization": "reconocimiento",
+    "relief": "alivio", "remorse": "arrepentimiento", "sadness": "tristeza", "surprise": "sorpresa"
+}
+
+
+def length_buckets(lengths, max_batch_tokens=8192, max_batch_size=None):
+    """
+    Agrupa índices ordenados por longitud en sub-batches bajo un presupuesto de tokens.
+
+    El costo de un sub-batch es (n_textos * longitud_máxima), es decir, los tokens
+    que realmente procesa el modelo incluyendo padding.
+
+    Parámetros:
+    - lengths: longitudes en tokens de cada texto.
+    - max_batch_tokens: presupuesto de tokens (con padding) por sub-batch.
+    - max_batch_size: límite opcional de textos por sub-batch.
+
+    Retorna:
+    - Lista de arrays de índices (en el orden original de `lengths`).
+    """
+    lengths = np.asarray(lengths)
+    order = np.argsort(lengths, kind="stable")
+
+    buckets = []
+    start = 0
+    for end in range(1, len(order) + 1):
+        if end == len(order):
+            buckets.append(order[start:end])
+            break
+        # Al estar ordenado, la longitud máxima del bucket es la del siguiente texto
+        next_size = end - start + 1
+        over_tokens = next_size * lengths[order[end]] > max_batch_tokens
+        over_size = max_batch_size is not None and next_size > max_batch_size
+        if over_tokens or over_size:
+            buckets.append(order[start:end])
+            start = end
+    return buckets
+
+
+def pad_batch(encoded, indices, pad_token_id=0):
+    """
+    Construye un batch con padding dinámico (hasta el texto más largo del bucket).
+
+    Retorna un diccionario de arrays NumPy int64 listo para el modelo.
+    """
+    seqs = [encoded["input_ids"][i] for i in indices]
+    width = max(len(seq) for seq in seqs)
+
+    input_ids = np.full((len(seqs), width), pad_token_id, dtype=np.int64)
+    attention_mask = np.zeros((len(seqs), width), dtype=np.int64)
+    for row, seq in enumerate(seqs):
+        input_ids[row, :len(seq)] = seq
+        attention_mask[row, :len(seq)] = 1
+
+    batch = {"input_ids": input_ids, "attention_mask": attention_mask}
+    if "token_type_ids" in encoded:
+        batch["token_type_ids"] = np.zeros_like(input_ids)
+    return batch
+
+
+def sigmoid(logits):
+    """Sigmoid numéricamente estable sobre un array de logits."""
+    return 0.5 * (1.0 + np.tanh(0.5 * np.asarray(logits, dtype=np.float32)))
+
+
+def predict_logits(backend, tokenizer, texts, max_length=512, max_batch_tokens=8192):
+    """
+    Calcula logits para una lista de textos con padding por buckets.
+
+    Los textos se tokenizan una sola vez, se ordenan por longitud y se procesan en
+    sub-batches bajo `max_batch_tokens`; el resultado vuelve en el orden original.
+
+    Parámetros:
+    - backend: backend de inferencia (ver review_analyzer.modeling.backends).
+    - tokenizer: tokenizer asociado al modelo.
+    - texts: lista de textos.
+    - max_length: longitud máxima en tokens (se trunca por encima).
+    - max_batch_tokens: presupuesto de tokens (con padding) por sub-batch.
+
+    Retorna:
+    - Array NumPy float32 (n_textos, num_labels).
+    """
+    texts = list(texts)
+    with TOKENIZE_SECONDS.time():
+        encoded = tokenizer(texts, truncation=True, max_length=max_length)
+    return forward_encoded(backend, encoded, tokenizer.pad_token_id or 0, max_batch_tokens)
+
+
+def forward_encoded(backend, encoded, pad_token_id=0, max_batch_tokens=8192):
+    """
+    Logits (n_secuencias, num_labels) de secuencias ya tokenizadas, agrupadas por
+    longitud en sub-batches bajo `max_batch_tokens`, en el orden de `encoded`.
+    """
+    lengths = np.array([len(ids) for ids in encoded["input_ids"]], dtype=np.int64)
+    logits = np.empty((len(lengths), backend.config.num_labels), dtype=np.float32)
+    for bucket in length_buckets(lengths, max_batch_tokens):
+        batch = pad_batch(encoded, bucket, pad_token_id)
+        padded = batch["input_ids"].size
+        BATCH_SIZE.observe(len(bucket))
+        BATCH_TOKENS.observe(padded)
+        PADDING_RATIO.observe(1 - lengths[bucket].sum() / padded)
+
+        start = time.perf_counter()
+        logits[bucket] = backend.logits(batch)
+        FORWARD_SECONDS.observe(time.perf_counter() - start)
+    return logits
+
+
+def predict_window_probs(backend, tokenizer, texts, max_length=512, max_batch_tokens=8192, pooling="max",
+                         stride=None, max_windows=None):
+    """
+    Probabilidades de textos largos sin truncarlos: cada texto se parte en ventanas
+    de `max_length` tokens que se solapan en `stride` tokens, las ventanas de todos
+    los textos se agrupan por longitud bajo el mismo presupuesto de tokens y sus
+    probabilidades se combinan por texto.
+
+    Un texto que cabe en `max_length` tiene una sola ventana y el mismo resultado
+    que `predict_probs`.
+
+    Parámetros:
+    - pooling: "max" (una emoción cuenta si aparece en alguna ventana) o "mean".
+    - stride: tokens de solapamiento entre ventanas consecutivas (por defecto max_length // 4).
+    - max_windows: límite opcional de ventanas por texto (se descartan las últimas).
+
+    Retorna:
+    - Array NumPy float32 (n_textos, num_labels).
+    """
+    if pooling not in WINDOW_POOLING:
+        raise ValueError(f"pooling debe ser uno de {WINDOW_POOLING}, no '{pooling}'.")
+    stride = max_length // 4 if stride is None else stride
+    if not 0 <= stride <= max_length // 2:
+        raise ValueError(f"stride debe estar entre 0 y max_length // 2 ({max_length // 2}), no {stride}.")
+
+    texts = list(texts)
+    with TOKENIZE_SECONDS.time():
+        encoded = tokenizer(texts, truncation=True, max_length=max_length, stride=stride,
+                            return_overflowing_tokens=True)
+    if "overflow_to_sample_mapping" not in encoded:
+        raise ValueError("El modo de ventanas requiere un tokenizer rápido (overflow_to_sample_mapping).")
+    owners = np.asarray(encoded["overflow_to_sample_mapping"], dtype=np.int64)
+
+    if max_windows is not None:
+        # Posición de cada ventana dentro de su texto (las ventanas vienen agrupadas por texto)
+        first = np.searchsorted(owners, owners)
+        keep = np.flatnonzero(np.arange(len(owners)) - first < max_windows)
+        if len(keep) < len(owners):
+            encoded = {key: [encoded[key][i] for i in keep] for key in ("input_ids", "token_type_ids")
+                       if key in encoded}
+            owners = owners[keep]
+
+    counts = np.bincount(owners, minlength=len(texts))
+    LONG_TEXTS.inc(int((counts > 1).sum()))
+    TEXT_WINDOWS.inc(len(owners))
+
+    window_probs = sigmoid(forward_encoded(backend, encoded, tokenizer.pad_token_id or 0, max_batch_tokens))
+    probs = np.zeros((len(texts), window_probs.shape[1]), dtype=np.float32)
+    if pooling == "max":
+        np.maximum.at(probs, owners, window_probs)
+    else:
+        np.add.at(probs, owners, window_probs)
+        probs /= np.maximum(counts, 1)[:, None]
+    return probs
+
+
+def predict_probs(backend, tokenizer, texts, max_length=512, max_batch_tokens=8192, long_text=None,
+                  stride=None, max_windows=None):
+    """
+    Probabilidades sigmoid (n_textos, num_labels); ver `predict_logits`.
+
+    Con `long_text` ("max" o "mean") los textos más largos que `max_length` no se
+    truncan sino que se puntúan por ventanas (ver `predict_window_probs`).
+    """
+    if long_text is not None:
+        return predict_window_probs(backend, tokenizer, texts, max_length, max_batch_tokens,
+                                    long_text, stride, max_windows)
+    return sigmoid(predict_logits(backend, tokenizer, texts, max_length, max_batch_tokens))
+
+
+def select_labels(probs, thresholds=0.5, top_k=None, min_probability=None):
+    """
+    Selección vectorizada de etiquetas sobre toda la matriz de probabilidades.
+
+    Parámetros:
+    - probs: array (n_textos, num_labels).
+    - thresholds: umbral escalar o vector (num_labels,) con un umbral por etiqueta.
+    - top_k: si se indica, selecciona las k etiquetas más probables de cada texto
+      en lugar de aplicar los umbrales.
+    - min_probability: probabilidad mínima adicional para cualquier etiqueta.
+
+    Retorna:
+    - Máscara booleana (n_textos, num_labels).
+    """
+    probs = np.asarray(probs)
+    if top_k is None:
+        mask = probs > np.asarray(thresholds, dtype=probs.dtype)
+    else:
+        if int(top_k) < 1:
+            raise ValueError(f"top_k debe ser al menos 1, no {top_k}.")
+        k = min(int(top_k), probs.shape[1])
+        top = np.argpartition(-probs, k - 1, axis=1)[:, :k]
+        mask = np.zeros(probs.shape, dtype=bool)
+        np.put_along_axis(mask, top, True, axis=1)
+
+    if min_probability is not None:
+        mask &= probs >= min_probability
+    return mask
+
+
+def uncertain_rows(probs, thresholds=0.5, margin=0.15):
+    """
+    Textos con alguna etiqueta cerca de su umbral (|p - umbral| < margin).
+
+    Es el criterio de enrutamiento del modo cascada: esos textos se reenvían al
+    modelo completo; el resto se responde con el modelo destilado.
+    """
+    probs = np.asarray(probs)
+    return (np.abs(probs - np.asarray(thresholds, dtype=probs.dtype)) < margin).any(axis=1)
+
+
+def format_results(texts, probs, mask, labels, translations=None):
+    """
+    Construye la respuesta por texto (etiquetas, traducciones y probabilidades
+    redondeadas) a partir de la máscara, sin recorrer etiqueta por etiqueta.
+    """
+    translations = translations or {}
+    rows, cols = np.nonzero(mask)
+    values = np.round(np.asarray(probs, dtype=np.float64)[rows, cols], 4).tolist()
+    names = np.asarray(labels, dtype=object)[cols].tolist()
+    translated_names = [translations.get(label, label) for label in labels]
+    translated = np.asarray(translated_names, dtype=object)[cols].tolist()
+    ends = np.cumsum(mask.sum(axis=1)).tolist()
+
+    results = []
+    start = 0
+    for text, end in zip(texts, ends):
+        results.append({
+            "input": text,
+            "predicted_labels": names[start:end],
+            "translated_labels": translated[start:end],
+            "probabilities": dict(zip(names[start:end], values[start:end])),
+        })
+        start = end
+    return results
+
+
+def compact_results(probs, mask):
+    """
+    Formato compacto: una máscara de bits por texto (bit j = etiqueta j) y un único
+    array plano con las probabilidades seleccionadas, en orden fila por fila.
+    """
+    weights = np.left_shift(np.int64(1), np.arange(mask.shape[1], dtype=np.int64))
+    return {
+        "bitmask": (mask.astype(np.int64) @ weights).tolist(),
+        "scores": np.round(np.asarray(probs, dtype=np.float64)[mask], 4).tolist(),
+    }
@@ -0,0 +1,355 @@
+"""
+Scoring offline por lotes del dataset procesado, sin pasar por la API HTTP.
+
+Usa el mismo modelo, backend, umbrales y traducción de etiquetas que `api/main.py`,
+pero en proceso y con bloques grandes ordenados por longitud. Por cada corrida se
+escribe en la carpeta de salida:
+
+- probs.npy: matriz float16 (n_filas, num_labels) memory-mapped.
+- labels.npy: máscara de bits int64 por fila (bit j = etiqueta j), igual que el
+  formato compacto de la API.
+- meta.json: etiquetas (inglés y español), umbrales, modelo y bloques terminados.
+
+Los bloques se confirman en meta.json después de escribirse, así que una corrida
+interrumpida se reanuda con el mismo comando. Con `--workers N` el modelo se carga
+una vez y se comparte entre N procesos (fork), repartiendo los núcleos entre ellos.
+
+Con `--reuse-index` y `--reuse-run`, los textos idénticos a uno ya puntuado en otra
+corrida (ver `review_analyzer.similarity`) copian su resultado en vez de pasar por
+el modelo; `--reuse-near` extiende la búsqueda a casi-duplicados por embeddings.
+
+Con `--long-text max|mean`, los comentarios más largos que `--max-length` no se
+truncan: se puntúan por ventanas solapadas (`--stride` tokens) que se agrupan con
+las del resto del bloque bajo el mismo presupuesto de tokens, y se combinan por texto.
+
+Uso:
+    python -m review_analyzer.modeling.predict [--data ...] [--output-dir ...] [--workers 4]
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from review_analyzer.config import (
+    API_MODEL,
+    FEELTRACK_MODEL,
+    FINAL_PROCESSED_DATA_PATH,
+    PREDICTIONS_DIR,
+    THRESHOLDS_PATH,
+)
+from review_analyzer.modeling.inference import (
+    LABEL_TRANSLATIONS,
+    WINDOW_POOLING,
+    predict_probs,
+    select_labels,
+)
+
+DEFAULT_MODEL = str(API_MODEL) if (API_MODEL / "config.json").exists() else FEELTRACK_MODEL
+
+# Estado del proceso: lo carga el padre antes del fork y lo heredan los workers
+_state = {}
+
+
+def count_rows(path, text_col="text"):
+    """Filas del archivo (metadata en Parquet; una pasada por la columna de texto en CSV)."""
+    path = Path(path)
+    if path.suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        return pq.ParquetFile(path).metadata.num_rows
+
+    import pandas as pd
+
+    return sum(len(chunk) for chunk in pd.read_csv(path, usecols=[text_col], chunksize=200_000))
+
+
+def iter_text_chunks(path, text_col="text", chunk_size=20_000):
+    """Itera la columna de texto en bloques de exactamente `chunk_size` filas (el último puede ser menor)."""
+    path = Path(path)
+    if path.suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        batches = (batch.column(0).to_pylist()
+                   for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=[text_col]))
+    else:
+        import pandas as pd
+
+        batches = (chunk[text_col].tolist()
+                   for chunk in pd.read_csv(path, usecols=[text_col], chunksize=chunk_size))
+
+    # Los row groups de Parquet pueden cortar los batches antes de chunk_size
+    buffer = []
+    for batch in batches:
+        buffer.extend(batch)
+        while len(buffer) >= chunk_size:
+            yield buffer[:chunk_size]
+            buffer = buffer[chunk_size:]
+    if buffer:
+        yield buffer
+
+
+class PredictionRun:
+    """Carpeta de salida de una corrida: memmaps de resultados y metadata reanudable."""
+
+    def __init__(self, output_dir):
+        self.dir = Path(output_dir)
+        self.meta_path = self.dir / "meta.json"
+        self.probs_path = self.dir / "probs.npy"
+        self.labels_path = self.dir / "labels.npy"
+        self.meta = json.loads(self.meta_path.read_text(encoding="utf-8")) if self.meta_path.exists() else None
+
+    def create(self, meta):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        shape = (meta["n_rows"], len(meta["labels"]))
+        np.lib.format.open_memmap(self.probs_path, mode="w+", dtype=np.float16, shape=shape).flush()
+        np.lib.format.open_memmap(self.labels_path, mode="w+", dtype=np.int64, shape=(shape[0],)).flush()
+        self.meta = {**meta, "done_chunks": []}
+        self.save_meta()
+
+    def save_meta(self):
+        tmp = self.meta_path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(self.meta, indent=2, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.meta_path)
+
+    def mark_done(self, chunk_id):
+        self.meta["done_chunks"] = sorted(set(self.meta["done_chunks"]) | {chunk_id})
+        self.save_meta()
+
+    def open_outputs(self):
+        return (np.lib.format.open_memmap(self.probs_path, mode="r+"),
+                np.lib.format.open_memmap(self.labels_path, mode="r+"))
+
+
+def load_predictions(output_dir, translate=True):
+    """
+    Lee una corrida terminada como DataFrame: probabilidades por etiqueta y
+    lista de etiquetas predichas (en español si `translate`).
+    """
+    import pandas as pd
+
+    run = PredictionRun(output_dir)
+    labels = run.meta["labels"]
+    names = np.array(run.meta["translated_labels"] if translate else labels, dtype=object)
+    probs = np.load(run.probs_path, mmap_mode="r")
+    bitmask = np.load(run.labels_path, mmap_mode="r")
+    mask = (bitmask[:, None] >> np.arange(len(labels), dtype=np.int64)) & 1 == 1
+
+    df = pd.DataFrame(np.asarray(probs, dtype=np.float32), columns=labels)
+    df["predicted_labels"] = [names[row].tolist() for row in mask]
+    return df
+
+
+def load_model_state(backend_name, model_path, thresholds_path, max_length, max_batch_tokens):
+    """Carga backend, tokenizer y umbrales (mismos defaults que la API)."""
+    from transformers import AutoTokenizer
+
+    from review_analyzer.modeling.backends import load_backend
+    from review_analyzer.modeling.thresholds import load_thresholds
+
+    backend = load_backend(backend_name, model_path)
+    labels = [backend.config.id2label[i] for i in range(backend.config.num_labels)]
+    if thresholds_path and os.path.exists(thresholds_path):
+        thresholds = load_thresholds(thresholds_path, labels)
+    else:
+        thresholds = np.full(len(labels), 0.5, dtype=np.float32)
+
+    _state.update(
+        backend=backend,
+        tokenizer=AutoTokenizer.from_pretrained(model_path),
+        labels=labels,
+        thresholds=thresholds,
+        max_length=max_length,
+        max_batch_tokens=max_batch_tokens,
+    )
+    return _state
+
+
+def score_texts(texts):
+    """Probabilidades float32 y máscara de bits para un bloque; textos vacíos quedan en cero."""
+    texts = [text if isinstance(text, str) else "" for text in texts]
+    valid = np.array([bool(text.strip()) for text in texts], dtype=bool)
+    probs = np.zeros((len(texts), len(_state["labels"])), dtype=np.float32)
+    pending = np.flatnonzero(valid)
+    reuse = _state.get("reuse")
+    if reuse is not None and len(pending):
+        found, reused = reuse([texts[i] for i in pending])
+        probs[pending[found]] = reused
+        pending = pending[~found]
+    if len(pending):
+        probs[pending] = predict_probs(
+            _state["backend"], _state["tokenizer"], [texts[i] for i in pending],
+            max_length=_state["max_length"], max_batch_tokens=_state["max_batch_tokens"],
+            long_text=_state.get("long_text"), stride=_state.get("stride"),
+            max_windows=_state.get("max_windows"),
+        )
+    mask = select_labels(probs, _state["thresholds"]) & valid[:, None]
+    weights = np.left_shift(np.int64(1), np.arange(mask.shape[1], dtype=np.int64))
+    return probs, mask.astype(np.int64) @ weights
+
+
+def _score_chunk(task):
+    """Puntúa un bloque y lo escribe en los memmaps de la corrida (en el proceso actual)."""
+    chunk_id, start, texts = task
+    if "outputs" not in _state:
+        _state["outputs"] = _state["run"].open_outputs()
+    out_probs, out_labels = _state["outputs"]
+
+    probs, bitmask = score_texts(texts)
+    out_probs[start:start + len(texts)] = probs.astype(np.float16)
+    out_labels[start:start + len(texts)] = bitmask
+    out_probs.flush()
+    out_labels.flush()
+    return chunk_id, len(texts)
+
+
+def _init_worker(threads):
+    _state.pop("outputs", None)
+    _state["backend"].configure_threads(threads)
+
+
+def run_prediction(data_path=FINAL_PROCESSED_DATA_PATH, output_dir=None, text_col="text",
+                   backend_name="torch", model_path=DEFAULT_MODEL, thresholds_path=str(THRESHOLDS_PATH),
+                   chunk_size=20_000, max_length=512, max_batch_tokens=16384, workers=1,
+                   threads=None, overwrite=False, reuse=None, long_text=None, stride=None,
+                   max_windows=None):
+    """
+    Puntúa `data_path` completo y escribe (o completa) la corrida en `output_dir`.
+
+    `reuse`: función textos -> (máscara, probabilidades) que resuelve textos sin
+    pasar por el modelo (p. ej. `similarity.NearDuplicateReuse`). Si tiene un
+    método `check`, se llama con la firma de esta corrida antes de empezar.
+
+    `long_text` ("max" o "mean"), `stride` y `max_windows`: modo por ventanas para
+    textos largos (ver `inference.predict_window_probs`); None trunca en `max_length`.
+
+    Retorna el PredictionRun terminado.
+    """
+    data_path = Path(data_path)
+    output_dir = Path(output_dir or PREDICTIONS_DIR / data_path.stem)
+    threads = threads or os.cpu_count() or 1
+    state = load_model_state(backend_name, model_path, thresholds_path, max_length, max_batch_tokens)
+
+    signature = {
+        "source": str(data_path),
+        "source_size": data_path.stat().st_size,
+        "text_col": text_col,
+        "model": model_path,
+        "backend": backend_name,
+        "chunk_size": chunk_size,
+        "max_length": max_length,
+        "labels": state["labels"],
+        # Las etiquetas guardadas dependen de los umbrales: otros umbrales no reanudan
+        "thresholds": [round(float(t), 4) for t in state["thresholds"]],
+        "long_text": long_text and {"pooling": long_text, "stride": stride, "max_windows": max_windows},
+    }
+    if reuse is not None and hasattr(reuse, "check"):
+        reuse.check(signature)
+    run = PredictionRun(output_dir)
+    if run.meta is not None and not overwrite:
+        changed = [key for key, value in signature.items() if run.meta.get(key) != value]
+        if changed:
+            raise ValueError(
+                f"{output_dir} tiene una corrida con otra configuración ({', '.join(changed)}). "
+                "Usa --overwrite o otra carpeta de salida."
+            )
+    else:
+        run.create({
+            **signature,
+            "n_rows": count_rows(data_path, text_col),
+            "translated_labels": [LABEL_TRANSLATIONS.get(label, label) for label in state["labels"]],
+            "dtype": "float16",
+        })
+    _state["run"] = run
+    _state["reuse"] = reuse
+    _state.update(long_text=long_text, stride=stride, max_windows=max_windows)
+    _state.pop("outputs", None)
+
+    done = set(run.meta["done_chunks"])
+    tasks = ((chunk_id, chunk_id * chunk_size, texts)
+             for chunk_id, texts in enumerate(iter_text_chunks(data_path, text_col, chunk_size))
+             if chunk_id not in done)
+
+    n_chunks = -(-run.meta["n_rows"] // chunk_size)
+    print(f"{run.meta['n_rows']:,} filas, {n_chunks} bloques ({len(done)} ya terminados)")
+    started = time.perf_counter()
+    scored = 0
+
+    def report(chunk_id, rows):
+        nonlocal scored
+        run.mark_done(chunk_id)
+        scored += rows
+        elapsed = time.perf_counter() - started
+        print(f"bloque {chunk_id + 1}/{n_chunks} | {scored / elapsed:,.0f} filas/s")
+
+    if workers <= 1:
+        state["backend"].configure_threads(threads)
+        for task in tasks:
+            report(*_score_chunk(task))
+    else:
+        # Fork tras cargar el modelo: los pesos se comparten copy-on-write
+        ctx = mp.get_context("fork")
+        with ctx.Pool(workers, initializer=_init_worker, initargs=(max(1, threads // workers),)) as pool:
+            pending = []
+            for task in tasks:
+                pending.append(pool.apply_async(_score_chunk, (task,)))
+                # Acota los bloques en vuelo para no cargar el archivo completo en memoria
+                while len(pending) >= 2 * workers:
+                    report(*pending.pop(0).get())
+            for result in pending:
+                report(*result.get())
+
+    return run
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scoring offline por lotes (CSV o Parquet)")
+    parser.add_argument("--data", default=str(FINAL_PROCESSED_DATA_PATH))
+    parser.add_argument("--output-dir", default=None, help=f"Por defecto {PREDICTIONS_DIR}/<nombre del archivo>")
+    parser.add_argument("--text-col", default="text")
+    parser.add_argument("--backend", default=os.getenv("INFERENCE_BACKEND", "torch"))
+    parser.add_argument("--model", default=os.getenv("MODEL_PATH", DEFAULT_MODEL))
+    parser.add_argument("--thresholds", default=os.getenv("THRESHOLDS_PATH", str(THRESHOLDS_PATH)))
+    parser.add_argument("--chunk-size", type=int, default=20_000)
+    parser.add_argument("--max-length", type=int, default=512)
+    parser.add_argument("--max-batch-tokens", type=int, default=16384)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=None, help="Hilos en total (por defecto todos los núcleos)")
+    parser.add_argument("--overwrite", action="store_true")
+    parser.add_argument("--reuse-index", default=None,
+                        help="Índice de review_analyzer.similarity; por defecto solo reutiliza duplicados "
+                             "exactos, sin costo de embeddings (punto de equilibrio de --reuse-near en su ayuda)")
+    parser.add_argument("--reuse-run", default=None, help="Corrida terminada sobre el archivo indexado")
+    parser.add_argument("--reuse-near", action="store_true",
+                        help="Busca también casi-duplicados: embebe cada texto sin duplicado exacto, así que "
+                             "solo compensa si la fracción resuelta supera costo(embedding)/costo(clasificación), "
+                             "cerca del 100%% con los modelos BERT-base por defecto")
+    parser.add_argument("--reuse-threshold", type=float, default=0.97)
+    parser.add_argument("--long-text", choices=WINDOW_POOLING, default=None,
+                        help="Puntúa los textos largos por ventanas en vez de truncarlos")
+    parser.add_argument("--stride", type=int, default=None, help="Tokens de solapamiento entre ventanas")
+    parser.add_argument("--max-windows", type=int, default=None, help="Ventanas máximas por texto")
+    args = parser.parse_args(argv)
+
+    reuse = None
+    if args.reuse_index or args.reuse_run:
+        if not (args.reuse_index and args.reuse_run):
+            parser.error("--reuse-index y --reuse-run van juntos.")
+        from review_analyzer.similarity import NearDuplicateReuse
+
+        reuse = NearDuplicateReuse(args.reuse_index, args.reuse_run, args.reuse_threshold, near=args.reuse_near)
+
+    run = run_prediction(args.data, args.output_dir, args.text_col, args.backend, args.model,
+                         args.thresholds, args.chunk_size, args.max_length, args.max_batch_tokens,
+                         args.workers, args.threads, args.overwrite, reuse,
+                         args.long_text, args.stride, args.max_windows)
+    print(f"Resultados en {run.dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""
+Umbrales calibrados por etiqueta para el modelo multi-etiqueta.
+
+Los logits de un set etiquetado se calculan una sola vez y se guardan en disco;
+el ajuste de umbrales trabaja sobre esa caché sin volver a ejecutar el modelo.
+
+Uso:
+    python -m review_analyzer.modeling.thresholds logits [--data ...] [--output ...]
+    python -m review_analyzer.modeling.thresholds fit [--logits ...] [--output ...]
+"""
+import argparse
+import json
+import re
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from review_analyzer.config import (
+    FEELTRACK_MODEL,
+    GOLDEN_SET_LABELED_PATH,
+    GOLDEN_SET_LOGITS_PATH,
+    THRESHOLDS_PATH,
+)
+from review_analyzer.modeling.inference import sigmoid
+
+
+def label_matrix(df, labels, labels_col="labels"):
+    """
+    Matriz booleana (n_textos, num_labels) con las etiquetas reales.
+
+    Acepta una columna 0/1 por etiqueta o una columna `labels_col` con nombres
+    (o índices) separados por coma, punto y coma o barra vertical.
+    """
+    if all(label in df.columns for label in labels):
+        return df[labels].fillna(0).astype(int).to_numpy() > 0
+
+    if labels_col not in df.columns:
+        raise ValueError(f"El dataset no tiene columnas por etiqueta ni una columna '{labels_col}'.")
+
+    index = {label: j for j, label in enumerate(labels)}
+    y_true = np.zeros((len(df), len(labels)), dtype=bool)
+    for i, value in enumerate(df[labels_col].fillna("").astype(str)):
+        for name in filter(None, (part.strip() for part in re.split(r"[,;|]", value))):
+            j = int(name) if name.isdigit() else index.get(name)
+            if j is None or not 0 <= j < len(labels):
+                raise ValueError(f"Etiqueta desconocida en la fila {i}: {name!r}.")
+            y_true[i, j] = True
+    return y_true
+
+
+def fit_thresholds(probs, y_true, beta=1.0, min_threshold=0.05, max_threshold=0.95, default=0.5):
+    """
+    Umbral por etiqueta que maximiza F-beta, evaluando todos los cortes posibles a la vez.
+
+    Para cada etiqueta se ordenan las probabilidades de mayor a menor; la suma
+    acumulada de positivos da los verdaderos positivos de cada corte, de modo que
+    el barrido completo cuesta un argsort por columna.
+
+    Retorna:
+    - thresholds: array (num_labels,); `default` en etiquetas sin positivos.
+    - scores: F-beta alcanzado con cada umbral.
+    """
+    probs = np.asarray(probs, dtype=np.float32)
+    y_true = np.asarray(y_true, dtype=bool)
+    n, num_labels = probs.shape
+    columns = np.arange(num_labels)
+
+    order = np.argsort(-probs, axis=0, kind="stable")
+    sorted_probs = np.take_along_axis(probs, order, axis=0)
+    tp = np.cumsum(np.take_along_axis(y_true, order, axis=0), axis=0, dtype=np.float32)
+    predicted = np.arange(1, n + 1, dtype=np.float32)[:, None]
+    positives = y_true.sum(axis=0)
+
+    b2 = beta ** 2
+    fbeta = (1 + b2) * tp / (predicted + b2 * positives)
+
+    # El umbral de cada corte es el punto medio con la siguiente probabilidad
+    next_probs = np.vstack([sorted_probs[1:], np.zeros((1, num_labels), dtype=np.float32)])
+    cuts = (sorted_probs + next_probs) / 2
+    valid = sorted_probs > next_probs
+    valid &= (cuts >= min_threshold) & (cuts <= max_threshold)
+    fbeta = np.where(valid, fbeta, -1.0)
+
+    best = fbeta.argmax(axis=0)
+    scores = fbeta[best, columns]
+    fitted = (positives > 0) & (scores >= 0)
+    thresholds = np.where(fitted, cuts[best, columns], default)
+    return thresholds.astype(np.float32), np.where(fitted, scores, 0.0)
+
+
+def save_thresholds(path, labels, thresholds, **metadata):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    payload = {
+        "thresholds": {label: round(float(t), 4) for label, t in zip(labels, thresholds)},
+        **metadata,
+    }
+    path.write_text(json.dumps(payload, indent=2, ensure_ascii=False), encoding="utf-8")
+
+
+def load_thresholds(path, labels, default=0.5):
+    """Vector float32 de umbrales en el orden de `labels` (faltantes = `default`)."""
+    data = json.loads(Path(path).read_text(encoding="utf-8"))
+    values = data.get("thresholds", data)
+    return np.array([values.get(label, default) for label in labels], dtype=np.float32)
+
+
+def cache_logits(data_path, output_path, backend_name="torch", model_path=FEELTRACK_MODEL,
+                 text_col="text", max_length=512):
+    """Ejecuta el modelo una vez sobre un set etiquetado y guarda logits + etiquetas reales."""
+    import pandas as pd
+    from transformers import AutoTokenizer
+
+    from review_analyzer.modeling.backends import load_backend
+    from review_analyzer.modeling.inference import predict_logits
+
+    backend = load_backend(backend_name, model_path)
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    labels = [backend.config.id2label[i] for i in range(backend.config.num_labels)]
+
+    df = pd.read_csv(data_path)
+    df = df[df[text_col].notna()]
+    y_true = label_matrix(df, labels)
+    logits = predict_logits(backend, tokenizer, df[text_col].astype(str).tolist(), max_length)
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(output_path, logits=logits, y_true=y_true, labels=np.array(labels))
+    return output_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Umbrales calibrados por etiqueta")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    logits = sub.add_parser("logits", help="Calcula y guarda los logits de un set etiquetado")
+    logits.add_argument("--data", default=str(GOLDEN_SET_LABELED_PATH))
+    logits.add_argument("--output", default=str(GOLDEN_SET_LOGITS_PATH))
+    logits.add_argument("--backend", default="torch")
+    logits.add_argument("--model", default=FEELTRACK_MODEL)
+    logits.add_argument("--text-col", default="text")
+
+    fit = sub.add_parser("fit", help="Ajusta umbrales sobre logits cacheados")
+    fit.add_argument("--logits", default=str(GOLDEN_SET_LOGITS_PATH))
+    fit.add_argument("--output", default=str(THRESHOLDS_PATH))
+    fit.add_argument("--beta", type=float, default=1.0)
+    fit.add_argument("--min-threshold", type=float, default=0.05)
+    fit.add_argument("--max-threshold", type=float, default=0.95)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "logits":
+        path = cache_logits(args.data, args.output, args.backend, args.model, args.text_col)
+        print(f"Logits guardados: {path}")
+        return 0
+
+    cached = np.load(args.logits)
+    labels = cached["labels"].tolist()
+    probs = sigmoid(cached["logits"])
+    thresholds, scores = fit_thresholds(probs, cached["y_true"], args.beta,
+                                        args.min_threshold, args.max_threshold)
+    save_thresholds(args.output, labels, thresholds, metric=f"f{args.beta:g}",
+                    n_samples=int(len(probs)), source=str(args.logits))
+
+    for label, t, score in zip(labels, thresholds, scores):
+        print(f"{label:<16} umbral={t:.3f} f{args.beta:g}={score:.3f}")
+    print(f"Umbrales guardados: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
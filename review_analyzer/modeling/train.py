@@ -0,0 +1,377 @@
+"""
+Fine-tuning multi-etiqueta del modelo FeelTrack en CPU.
+
+- El corpus se tokeniza una sola vez en una caché memory-mapped (ids int32
+  concatenados + offsets) que se reutiliza entre corridas y épocas.
+- Muestreo agrupado por longitud con padding dinámico: cada batch solo se
+  rellena hasta su texto más largo.
+- Acumulación de gradientes para batches efectivos grandes en CPU.
+- Checkpoints reanudables en CHECKPOINTS_DIR/<run> (modelo, optimizador,
+  scheduler y posición exacta en la época).
+- Artefacto final con `save_pretrained` (safetensors + tokenizer), cargable por
+  la API con MODEL_PATH=<output-dir>.
+- Tiempo por época y tokens/segundo en consola y en train_log.jsonl.
+
+Uso:
+    python -m review_analyzer.modeling.train [--data ...] [--run-name ...] [--resume]
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from review_analyzer.config import (
+    CHECKPOINTS_DIR,
+    FEELTRACK_MODEL,
+    FEELTRACK_TRAINED_DIR,
+    GOLDEN_SET_LABELED_PATH,
+    TOKEN_CACHE_DIR,
+)
+from review_analyzer.modeling.inference import pad_batch, select_labels, sigmoid
+from review_analyzer.modeling.thresholds import label_matrix
+
+
+class TokenCache:
+    """
+    Corpus tokenizado en disco: tokens.bin (int32 concatenados), offsets.npy,
+    labels.npy (uint8, n_textos x num_labels) y meta.json.
+
+    `cache[i]` devuelve los ids del texto i como vista del memmap (sin copias).
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.meta = json.loads((self.path / "meta.json").read_text(encoding="utf-8"))
+        self.offsets = np.load(self.path / "offsets.npy")
+        self.labels = np.load(self.path / "labels.npy", mmap_mode="r")
+        self.tokens = np.memmap(self.path / "tokens.bin", dtype=np.int32, mode="r")
+        self.lengths = np.diff(self.offsets)
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def __getitem__(self, i):
+        return self.tokens[self.offsets[i]:self.offsets[i + 1]]
+
+    @classmethod
+    def build(cls, data_path, tokenizer, labels, root=TOKEN_CACHE_DIR, text_col="text",
+              max_length=512, chunk_size=10_000):
+        """
+        Tokeniza `data_path` una vez; si ya existe una caché para el mismo archivo,
+        tokenizer, etiquetas y max_length, la reutiliza.
+        """
+        import pandas as pd
+
+        data_path = Path(data_path)
+        stat = data_path.stat()
+        key_payload = json.dumps([str(data_path.resolve()), stat.st_size, stat.st_mtime_ns, text_col,
+                                  tokenizer.name_or_path, len(tokenizer), max_length, labels])
+        key = hashlib.sha1(key_payload.encode("utf-8")).hexdigest()[:16]
+        path = Path(root) / f"{data_path.stem}-{key}"
+        if (path / "meta.json").exists():
+            return cls(path)
+
+        df = pd.read_csv(data_path)
+        df = df[df[text_col].notna()].reset_index(drop=True)
+        return cls.write(path, df[text_col].astype(str).tolist(), label_matrix(df, labels).astype(np.uint8),
+                         tokenizer, max_length, chunk_size, source=str(data_path), text_col=text_col,
+                         labels=labels)
+
+    @classmethod
+    def write(cls, path, texts, targets, tokenizer, max_length=512, chunk_size=10_000, **meta):
+        """
+        Tokeniza `texts` y guarda la caché en `path` junto con `targets`
+        (etiquetas 0/1 o probabilidades de un modelo maestro).
+        """
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        np.save(tmp / "labels.npy", np.asarray(targets))
+
+        offsets = [0]
+        with open(tmp / "tokens.bin", "wb") as f:
+            for start in range(0, len(texts), chunk_size):
+                encoded = tokenizer(texts[start:start + chunk_size], truncation=True, max_length=max_length)
+                for ids in encoded["input_ids"]:
+                    f.write(np.asarray(ids, dtype=np.int32).tobytes())
+                    offsets.append(offsets[-1] + len(ids))
+        np.save(tmp / "offsets.npy", np.asarray(offsets, dtype=np.int64))
+
+        meta = {**meta, "tokenizer": tokenizer.name_or_path, "max_length": max_length,
+                "n_texts": len(texts), "n_tokens": offsets[-1], "pad_token_id": tokenizer.pad_token_id or 0,
+                "token_type_ids": "token_type_ids" in tokenizer.model_input_names}
+        (tmp / "meta.json").write_text(json.dumps(meta, indent=2, ensure_ascii=False), encoding="utf-8")
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+        return cls(path)
+
+
+def length_grouped_batches(lengths, indices, batch_size, seed, mega_batch_mult=50):
+    """
+    Batches con textos de longitud parecida, en orden aleatorio reproducible.
+
+    Se barajan los índices, se cortan en mega-batches de `batch_size * mega_batch_mult`,
+    cada mega-batch se ordena por longitud y se parte en batches; por último se
+    baraja el orden de los batches. Misma semilla, mismos batches (para reanudar).
+    """
+    rng = np.random.default_rng(seed)
+    indices = rng.permutation(indices)
+    mega = batch_size * mega_batch_mult
+    batches = []
+    for start in range(0, len(indices), mega):
+        group = indices[start:start + mega]
+        group = group[np.argsort(-lengths[group], kind="stable")]
+        batches.extend(group[i:i + batch_size] for i in range(0, len(group), batch_size))
+    order = rng.permutation(len(batches))
+    return [batches[i] for i in order]
+
+
+def collate(cache, indices):
+    """Batch con padding dinámico (tensores torch) y etiquetas float para BCE."""
+    import torch
+
+    encoded = {"input_ids": cache}
+    if cache.meta["token_type_ids"]:
+        encoded["token_type_ids"] = None
+    batch = {k: torch.from_numpy(v) for k, v in pad_batch(encoded, indices, cache.meta["pad_token_id"]).items()}
+    batch["labels"] = torch.from_numpy(np.asarray(cache.labels[indices], dtype=np.float32))
+    return batch
+
+
+def split_indices(n, val_fraction, seed):
+    order = np.random.default_rng(seed).permutation(n)
+    n_val = int(round(n * val_fraction))
+    return np.sort(order[n_val:]), np.sort(order[:n_val])
+
+
+def evaluate(model, cache, indices, batch_size):
+    """Pérdida BCE media y micro-F1 (umbral 0.5) sobre `indices`."""
+    import torch
+
+    model.eval()
+    losses, probs = [], []
+    order = indices[np.argsort(cache.lengths[indices], kind="stable")]
+    with torch.inference_mode():
+        for start in range(0, len(order), batch_size):
+            batch = collate(cache, order[start:start + batch_size])
+            outputs = model(**batch)
+            losses.append(outputs.loss.item() * len(batch["labels"]))
+            probs.append(sigmoid(outputs.logits.float().numpy()))
+    model.train()
+
+    # Con objetivos blandos (destilación) se compara contra las etiquetas del maestro
+    y_true = np.asarray(cache.labels[order], dtype=np.float32) >= 0.5
+    y_pred = select_labels(np.vstack(probs), 0.5)
+    tp = (y_pred & y_true).sum()
+    denom = y_pred.sum() + y_true.sum()
+    return {"val_loss": round(sum(losses) / len(order), 5),
+            "val_micro_f1": round(float(2 * tp / denom) if denom else 0.0, 4)}
+
+
+def latest_checkpoint(run_dir):
+    checkpoints = sorted(Path(run_dir).glob("checkpoint-*"), key=lambda p: int(p.name.split("-")[1]))
+    return checkpoints[-1] if checkpoints else None
+
+
+def save_checkpoint(run_dir, model, optimizer, scheduler, state, keep=2):
+    import torch
+
+    path = Path(run_dir) / f"checkpoint-{state['global_step']}"
+    tmp = path.with_name(path.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    model.save_pretrained(tmp)
+    torch.save({"optimizer": optimizer.state_dict(), "scheduler": scheduler.state_dict(),
+                "torch_rng": torch.get_rng_state()}, tmp / "training_state.pt")
+    (tmp / "trainer_state.json").write_text(json.dumps(state, indent=2), encoding="utf-8")
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+
+    checkpoints = sorted(Path(run_dir).glob("checkpoint-*"), key=lambda p: int(p.name.split("-")[1]))
+    for old in checkpoints[:-keep]:
+        shutil.rmtree(old, ignore_errors=True)
+    return path
+
+
+def resolve_labels(config, labels=None):
+    """Etiquetas del entrenamiento: las indicadas o las del config del modelo base."""
+    if labels:
+        return list(labels)
+    names = [config.id2label[i] for i in range(config.num_labels)] if config.id2label else []
+    if not names or all(name == f"LABEL_{i}" for i, name in enumerate(names)):
+        raise ValueError("El modelo base no tiene nombres de etiqueta; indica --labels.")
+    return names
+
+
+def train(data_path=GOLDEN_SET_LABELED_PATH, base_model=FEELTRACK_MODEL, output_dir=FEELTRACK_TRAINED_DIR,
+          run_name="feeltrack", labels=None, text_col="text", max_length=512, resume=False, **fit_kwargs):
+    """
+    Entrena y guarda el artefacto final en `output_dir`. Retorna la ruta del artefacto.
+
+    Con `resume=True` continúa desde el último checkpoint de CHECKPOINTS_DIR/<run_name>,
+    en la misma época y batch donde se detuvo. `fit_kwargs` se pasan a `fit`.
+    """
+    from transformers import AutoConfig, AutoModelForSequenceClassification, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(base_model)
+    labels = resolve_labels(AutoConfig.from_pretrained(base_model), labels)
+    start = time.perf_counter()
+    cache = TokenCache.build(data_path, tokenizer, labels, text_col=text_col, max_length=max_length)
+    print(f"Caché de tokens: {cache.path} ({len(cache):,} textos, "
+          f"{cache.meta['n_tokens']:,} tokens, {time.perf_counter() - start:.1f}s)")
+
+    def load_model(checkpoint):
+        return AutoModelForSequenceClassification.from_pretrained(
+            checkpoint or base_model,
+            num_labels=len(labels),
+            id2label=dict(enumerate(labels)),
+            label2id={label: i for i, label in enumerate(labels)},
+            problem_type="multi_label_classification",
+            ignore_mismatched_sizes=True,
+        )
+
+    return fit(load_model, tokenizer, cache, output_dir, run_name, resume=resume,
+               state={"base_model": base_model, "labels": labels}, **fit_kwargs)
+
+
+def fit(load_model, tokenizer, cache, output_dir, run_name, batch_size=16, grad_accum_steps=4, epochs=3,
+        learning_rate=2e-5, weight_decay=0.01, warmup_ratio=0.06, val_fraction=0.1, seed=42, threads=None,
+        checkpoint_steps=200, log_steps=20, resume=False, state=None):
+    """
+    Bucle de entrenamiento sobre una TokenCache (etiquetas 0/1 u objetivos blandos).
+
+    - load_model: función (ruta_checkpoint o None) -> modelo; None = pesos iniciales.
+    - state: metadata adicional que se guarda en cada checkpoint.
+    """
+    import torch
+    from transformers import get_linear_schedule_with_warmup
+
+    torch.manual_seed(seed)
+    torch.set_num_threads(threads or os.cpu_count() or 1)
+    run_dir = Path(CHECKPOINTS_DIR) / run_name
+    run_dir.mkdir(parents=True, exist_ok=True)
+    checkpoint = latest_checkpoint(run_dir) if resume else None
+
+    model = load_model(checkpoint)
+    model.train()
+
+    train_idx, val_idx = split_indices(len(cache), val_fraction, seed)
+    batches_per_epoch = -(-len(train_idx) // batch_size)
+    total_steps = -(-batches_per_epoch // grad_accum_steps) * epochs
+
+    no_decay = ("bias", "LayerNorm.weight")
+    params = [
+        {"params": [p for n, p in model.named_parameters() if not n.endswith(no_decay)], "weight_decay": weight_decay},
+        {"params": [p for n, p in model.named_parameters() if n.endswith(no_decay)], "weight_decay": 0.0},
+    ]
+    optimizer = torch.optim.AdamW(params, lr=learning_rate)
+    scheduler = get_linear_schedule_with_warmup(optimizer, int(total_steps * warmup_ratio), total_steps)
+
+    state = {"epoch": 0, "batch_in_epoch": 0, "global_step": 0, **(state or {})}
+    if checkpoint:
+        saved = torch.load(checkpoint / "training_state.pt", weights_only=False)
+        optimizer.load_state_dict(saved["optimizer"])
+        scheduler.load_state_dict(saved["scheduler"])
+        torch.set_rng_state(saved["torch_rng"])
+        state.update(json.loads((checkpoint / "trainer_state.json").read_text(encoding="utf-8")))
+        print(f"Reanudando desde {checkpoint} (época {state['epoch'] + 1}, batch {state['batch_in_epoch']})")
+
+    log_path = run_dir / "train_log.jsonl"
+
+    def log(record):
+        with open(log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+    for epoch in range(state["epoch"], epochs):
+        batches = length_grouped_batches(cache.lengths, train_idx, batch_size, seed + epoch)
+        skip = state["batch_in_epoch"] if epoch == state["epoch"] else 0
+        epoch_start = time.perf_counter()
+        real_tokens = padded_tokens = 0
+        running_loss, running_batches = 0.0, 0
+
+        for b, indices in enumerate(batches[skip:], start=skip):
+            batch = collate(cache, indices)
+            loss = model(**batch).loss / grad_accum_steps
+            loss.backward()
+            real_tokens += int(cache.lengths[indices].sum())
+            padded_tokens += batch["input_ids"].numel()
+            running_loss += loss.item() * grad_accum_steps
+            running_batches += 1
+
+            last_batch = b + 1 == len(batches)
+            if (b + 1) % grad_accum_steps and not last_batch:
+                continue
+
+            torch.nn.utils.clip_grad_norm_(model.parameters(), 1.0)
+            optimizer.step()
+            scheduler.step()
+            optimizer.zero_grad(set_to_none=True)
+            state.update(epoch=epoch, batch_in_epoch=b + 1, global_step=state["global_step"] + 1)
+
+            if state["global_step"] % log_steps == 0:
+                elapsed = time.perf_counter() - epoch_start
+                print(f"época {epoch + 1} | paso {state['global_step']}/{total_steps} | "
+                      f"loss {running_loss / running_batches:.4f} | {real_tokens / elapsed:,.0f} tokens/s")
+            if checkpoint_steps and state["global_step"] % checkpoint_steps == 0 and not last_batch:
+                save_checkpoint(run_dir, model, optimizer, scheduler, state)
+
+        epoch_seconds = time.perf_counter() - epoch_start
+        record = {
+            "run": run_name, "epoch": epoch + 1, "global_step": state["global_step"],
+            "train_loss": round(running_loss / max(running_batches, 1), 5),
+            "epoch_seconds": round(epoch_seconds, 2),
+            "tokens_per_second": round(real_tokens / epoch_seconds, 1) if epoch_seconds else 0.0,
+            "padding_ratio": round(1 - real_tokens / padded_tokens, 4) if padded_tokens else 0.0,
+            "batch_size": batch_size, "grad_accum_steps": grad_accum_steps, "threads": torch.get_num_threads(),
+        }
+        if len(val_idx):
+            record.update(evaluate(model, cache, val_idx, batch_size * 2))
+        print(json.dumps(record))
+        log(record)
+
+        state.update(epoch=epoch + 1, batch_in_epoch=0)
+        save_checkpoint(run_dir, model, optimizer, scheduler, state)
+
+    output_dir = Path(output_dir)
+    model.save_pretrained(output_dir)
+    tokenizer.save_pretrained(output_dir)
+    print(f"Modelo guardado en {output_dir} (usar con MODEL_PATH={output_dir})")
+    return output_dir
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fine-tuning multi-etiqueta del modelo FeelTrack")
+    parser.add_argument("--data", default=str(GOLDEN_SET_LABELED_PATH))
+    parser.add_argument("--base-model", default=FEELTRACK_MODEL)
+    parser.add_argument("--output-dir", default=str(FEELTRACK_TRAINED_DIR))
+    parser.add_argument("--run-name", default="feeltrack")
+    parser.add_argument("--labels", default=None, help="Etiquetas separadas por coma (por defecto las del modelo base)")
+    parser.add_argument("--text-col", default="text")
+    parser.add_argument("--max-length", type=int, default=512)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--grad-accum-steps", type=int, default=4)
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--lr", type=float, default=2e-5)
+    parser.add_argument("--val-fraction", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--checkpoint-steps", type=int, default=200)
+    parser.add_argument("--resume", action="store_true")
+    args = parser.parse_args(argv)
+
+    train(args.data, args.base_model, args.output_dir, args.run_name,
+          args.labels.split(",") if args.labels else None, args.text_col, args.max_length, args.resume,
+          batch_size=args.batch_size, grad_accum_steps=args.grad_accum_steps, epochs=args.epochs,
+          learning_rate=args.lr, val_fraction=args.val_fraction, seed=args.seed, threads=args.threads,
+          checkpoint_steps=args.checkpoint_steps)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
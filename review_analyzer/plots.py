@@ -1,17 +1,17 @@
 from IPython.display import display, HTML
 import matplotlib.pyplot as plt
 import seaborn as sns
-from langdetect import detect, LangDetectException, DetectorFactory
 import pandas as pd
 from wordcloud import WordCloud
-import pycountry
+
+from review_analyzer.analytics import bin_column, class_rates, group_means, term_frequencies
+from review_analyzer.language import detect_languages, language_name
+from review_analyzer.modeling.inference import LABEL_TRANSLATIONS
 
 
 plt.rcParams['axes.unicode_minus'] = False
 plt.rcParams['font.family'] = 'DejaVu Sans'
 
-DetectorFactory.seed = 0
-
 def show_full_dataset(df):
     with pd.option_context('display.max_columns', None,
                        'display.max_colwidth', None,
@@ -90,42 +90,31 @@ def get_language_name(code):
     Traduce un código de idioma (ISO 639-1 o 639-3) a su nombre completo.
     Si no se encuentra, devuelve el código original.
     """
-    if code == 'unknown':
-        return 'Desconocido'
-    try:
-        lang = pycountry.languages.get(alpha_2=code)
-        if lang is None:
-            lang = pycountry.languages.get(alpha_3=code)
-        return lang.name if lang else code
-    except:
-        return code
+    return language_name(code)
 
 @apply_plot_config
-def plot_language_distribution(comment_series, sample_size=500, color='mediumseagreen'):
+def plot_language_distribution(comment_series, sample_size=None, color='mediumseagreen', n_jobs=None):
     """
-    Detecta y grafica la distribución de idiomas en una muestra de comentarios.
+    Detecta y grafica la distribución de idiomas de los comentarios.
     
     Parámetros:
     - comment_series: Serie de texto (columna de comentarios).
-    - sample_size: número de muestras aleatorias a analizar.
+    - sample_size: número de muestras aleatorias a analizar (None = todos).
+    - n_jobs: procesos para la detección (None = todos los núcleos).
     """
-    def safe_detect(text):
-        try:
-            return detect(text)
-        except LangDetectException:
-            return 'unknown'
-    
     sample = comment_series.dropna().astype(str)
-    sample = sample[sample.apply(lambda x: len(x.strip()) > 10)]
-    sample = sample.sample(n=min(sample_size, len(sample)), random_state=42)
+    sample = sample[sample.str.strip().str.len() > 10]
+    if sample_size is not None:
+        sample = sample.sample(n=min(sample_size, len(sample)), random_state=42)
     
-    languages = sample.apply(safe_detect)
+    languages = pd.Series(detect_languages(sample, n_jobs=n_jobs), index=sample.index)
     lang_counts = languages.value_counts()
     lang_counts.index = lang_counts.index.map(get_language_name)
     
     plt.figure(figsize=(12, 6))
     lang_counts.plot(kind='bar', color=color)
-    plt.title('Distribución de idiomas en muestra de comentarios', fontsize=14, fontname='DejaVu Sans')
+    scope = 'muestra de comentarios' if sample_size is not None else 'comentarios'
+    plt.title(f'Distribución de idiomas en {scope} (n={len(sample):,})', fontsize=14, fontname='DejaVu Sans')
     plt.xlabel('Idioma detectado', fontsize=12)
     plt.ylabel('Cantidad', fontsize=12)
     plt.xticks(rotation=45, ha='right')
@@ -163,17 +152,21 @@ def plot_class_distribution(df, class_col):
     plt.show()   
 
 def generar_grupos(df, variable, bins, labels, nueva_columna=None):
+    """Retorna una copia de `df` con la columna de grupos (no modifica el original)."""
     if nueva_columna is None:
         nueva_columna = variable + '_group'
-    df[nueva_columna] = pd.cut(df[variable], bins=bins, labels=labels, right=False)
-    return df
+    return df.assign(**{nueva_columna: bin_column(df[variable], bins, labels)})
+
+def plot_grouped_scatter_likes_reply(df, sentiment_col='bert_sentiment', likes_col='likes', reply_col='reply_count',
+                                     grouped=None):
+    """
+    Promedio de likes vs. respuestas por clase.
 
-def plot_grouped_scatter_likes_reply(df, sentiment_col='bert_sentiment', likes_col='likes', reply_col='reply_count'):
-    # Agrupar por clase
-    grouped = df.groupby(sentiment_col).agg({
-        likes_col: 'mean',
-        reply_col: 'mean'
-    }).reset_index()
+    Parámetros:
+    - grouped: salida precalculada de `analytics.group_means` (si es None se calcula desde `df`).
+    """
+    if grouped is None:
+        grouped = group_means(df, sentiment_col, [likes_col, reply_col])
     
     plt.figure(figsize=(8, 6))
     sns.scatterplot(data=grouped, x=likes_col, y=reply_col, hue=sentiment_col, s=200)
@@ -183,11 +176,14 @@ def plot_grouped_scatter_likes_reply(df, sentiment_col='bert_sentiment', likes_c
     plt.legend(title='Sentimiento')
     plt.show()
 
-def plot_bivariate_rate(df, col_x, target='bert_sentiment', group_col=None, order=None):
-    count_df = df.groupby([col_x, target], observed=True).size().reset_index(name='count')
-    total_df = df.groupby(col_x, observed=True).size().reset_index(name='total')
-    merged = count_df.merge(total_df, on=col_x)
-    merged['rate'] = merged['count'] / merged['total']
+def plot_bivariate_rate(df, col_x, target='bert_sentiment', group_col=None, order=None, rates=None):
+    """
+    Tasa de cada clase de `target` dentro de cada valor de `col_x`.
+
+    Parámetros:
+    - rates: salida precalculada de `analytics.class_rates` (si es None se calcula desde `df`).
+    """
+    merged = rates if rates is not None else class_rates(df, col_x, target)
     
     plt.figure(figsize=(13, 7))
     ax = sns.pointplot(x=col_x, y='rate', hue=target, data=merged, dodge=True, markers='o', linestyles='-')
@@ -201,7 +197,7 @@ def plot_bivariate_rate(df, col_x, target='bert_sentiment', group_col=None, orde
     plt.tight_layout()
     plt.show()
 
-def plot_wordcloud_for_class(df, text_col, class_col, class_value, max_words=100):
+def plot_wordcloud_for_class(df, text_col, class_col, class_value, max_words=100, frequencies=None):
     """
     Genera un WordCloud para una clase específica.
     
@@ -210,12 +206,15 @@ def plot_wordcloud_for_class(df, text_col, class_col, class_value, max_words=100
     - class_col: columna de clase (categoría).
     - class_value: valor de la clase a filtrar.
     - max_words: máximo de palabras a mostrar.
+    - frequencies: salida precalculada de `analytics.term_frequencies` (todas las clases).
     """
-    text_data = df[df[class_col] == class_value][text_col].dropna().astype(str)
-    full_text = ' '.join(text_data)
+    if frequencies is None:
+        frequencies = term_frequencies(df[df[class_col] == class_value], text_col, class_col, top_n=max_words)
+    terms = frequencies[frequencies[class_col] == class_value]
     
     wordcloud = WordCloud(width=800, height=400, background_color='white',
-                          max_words=max_words, collocations=False).generate(full_text)
+                          max_words=max_words, collocations=False).generate_from_frequencies(
+        dict(zip(terms['term'], terms['count'])))
     
     plt.figure(figsize=(10, 5))
     plt.imshow(wordcloud, interpolation='bilinear')
@@ -223,3 +222,52 @@ def plot_wordcloud_for_class(df, text_col, class_col, class_value, max_words=100
     plt.title(f'WordCloud para clase: {class_value}')
     plt.show()
 
+@apply_plot_config
+def plot_emotion_rates_over_time(rates, class_col=None, top=8):
+    """
+    Tasa de cada emoción por periodo.
+
+    Parámetros:
+    - rates: salida de `analytics.emotion_rates_over_time` (con class_col o label_cols).
+    - class_col: columna de clase si se usó class_col; si es None se grafica la columna 'label'.
+    - top: máximo de emociones (las de mayor tasa media).
+    """
+    hue = class_col or 'label'
+    keep = rates.groupby(hue)['rate'].mean().nlargest(top).index
+    data = rates[rates[hue].isin(keep)]
+    if hue == 'label':
+        data = data.assign(label=data['label'].map(lambda l: LABEL_TRANSLATIONS.get(l, l)))
+
+    plt.figure(figsize=(13, 6))
+    sns.lineplot(data=data, x='period', y='rate', hue=hue, marker='o')
+    plt.title('Tasa de emociones por periodo')
+    plt.xlabel('Periodo')
+    plt.ylabel('Tasa')
+    plt.grid(True)
+    plt.tight_layout()
+    plt.show()
+
+@apply_plot_config
+def plot_weighted_shares(shares, class_col=None):
+    """
+    Participación de cada emoción ponderada por likes.
+
+    Parámetros:
+    - shares: salida de `analytics.weighted_emotion_shares` sin agrupación.
+    - class_col: columna de clase si se usó class_col; si es None se usan las etiquetas.
+    """
+    if class_col is not None:
+        data = shares.set_index(class_col)['rate']
+    else:
+        data = shares.set_index('label')['share']
+        data.index = data.index.map(lambda l: LABEL_TRANSLATIONS.get(l, l))
+
+    plt.figure(figsize=(12, 6))
+    data.sort_values(ascending=False).plot(kind='bar', color='steelblue')
+    plt.title('Participación de emociones ponderada por likes')
+    plt.xlabel('Emoción')
+    plt.ylabel('Participación')
+    plt.xticks(rotation=45, ha='right')
+    plt.grid(axis='y')
+    plt.tight_layout()
+    plt.show()
@@ -0,0 +1,500 @@
+"""
+Índice de vecinos aproximados sobre embeddings de comentarios para detectar
+casi-duplicados (spam parafraseado, copias con variaciones).
+
+Estructura (IVF + cuantización int8, solo NumPy):
+- Los vectores se normalizan (similitud coseno = producto punto).
+- Un k-means esférico entrena `n_lists` centroides; cada vector va a la lista
+  de su centroide más cercano.
+- Cada vector se guarda en int8 con una escala propia (4x menos que float32).
+- Una búsqueda compara la consulta con los centroides y solo recorre las
+  `nprobe` listas más cercanas: costo ~ n * nprobe / n_lists en vez de n.
+
+En disco es append-only (codes.bin, scales.bin, lists.bin, ids.bin, keys.bin y
+meta.json): `add` solo escribe los vectores nuevos y `meta.json` se confirma al
+final, así que una escritura interrumpida no deja el índice inconsistente.
+
+Con el índice se puede:
+- `search`: "comentarios similares" (top-k por similitud).
+- `cluster`: grupos de casi-duplicados (componentes conexas con similitud >= umbral).
+- `NearDuplicateReuse`: reutilizar la clasificación ya calculada de un casi-duplicado
+  en el scoring offline (`modeling.predict --reuse-index`).
+
+Uso:
+    python -m review_analyzer.similarity build [--data ...] [--embeddings ...]
+    python -m review_analyzer.similarity similar "texto de consulta" [--k 10]
+    python -m review_analyzer.similarity cluster [--threshold 0.95]
+"""
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from review_analyzer.config import BERT_EMBEDDINGS, FINAL_PROCESSED_DATA_PATH, SIMILARITY_INDEX_DIR
+
+# Archivos append-only: nombre -> (dtype, columnas por fila; None = dim)
+_COLUMNS = {
+    "codes": (np.int8, None),
+    "scales": (np.float32, 1),
+    "lists": (np.int32, 1),
+    "ids": (np.int64, 1),
+    "keys": ("S20", 1),
+}
+
+
+def normalize(vectors):
+    """Vectores float32 con norma 1 (los vectores nulos quedan en cero)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def quantize(vectors):
+    """Cuantización int8 simétrica por vector: x ~ codes * scale."""
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales = np.maximum(scales, 1e-12).astype(np.float32)
+    codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales
+
+
+def train_centroids(vectors, n_lists, iters=10, seed=0, samples_per_list=32):
+    """k-means esférico (centroides normalizados) sobre una muestra de ~32 vectores por lista."""
+    rng = np.random.default_rng(seed)
+    max_samples = n_lists * samples_per_list
+    if len(vectors) > max_samples:
+        vectors = vectors[np.sort(rng.choice(len(vectors), max_samples, replace=False))]
+    vectors = normalize(vectors)
+    n_lists = max(1, min(n_lists, len(vectors)))
+    centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)].copy()
+
+    for _ in range(iters):
+        assign = (vectors @ centroids.T).argmax(axis=1)
+        # Suma por lista con los vectores ordenados por asignación (más rápido que np.add.at)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=n_lists)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        sums = np.zeros_like(centroids)
+        filled = counts > 0
+        sums[filled] = np.add.reduceat(vectors[order], starts[filled], axis=0)
+        # Listas vacías: se reinician en puntos al azar
+        empty = np.flatnonzero(counts == 0)
+        sums[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+        centroids = normalize(sums)
+    return centroids
+
+
+def exact_search(vectors, queries, k=10, chunk_size=1024):
+    """Búsqueda exacta por fuerza bruta (referencia para medir recall)."""
+    vectors = normalize(vectors)
+    queries = normalize(queries)
+    k = min(k, len(vectors))
+    sims = np.empty((len(queries), k), dtype=np.float32)
+    rows = np.empty((len(queries), k), dtype=np.int64)
+    for start in range(0, len(queries), chunk_size):
+        block = queries[start:start + chunk_size] @ vectors.T
+        top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        top_sims = np.take_along_axis(block, top, axis=1)
+        order = np.argsort(-top_sims, axis=1, kind="stable")
+        sims[start:start + len(block)] = np.take_along_axis(top_sims, order, axis=1)
+        rows[start:start + len(block)] = np.take_along_axis(top, order, axis=1)
+    return sims, rows
+
+
+def recall_at_k(approx_rows, exact_rows):
+    """Fracción de los k vecinos exactos que aparecen en el resultado aproximado."""
+    k = exact_rows.shape[1]
+    hits = sum(len(np.intersect1d(a[a >= 0], e)) for a, e in zip(approx_rows, exact_rows))
+    return hits / (len(exact_rows) * k)
+
+
+def connected_components(n, left, right):
+    """Etiqueta de componente (mínimo índice del grupo) para un grafo dado por aristas."""
+    labels = np.arange(n, dtype=np.int64)
+    if len(left) == 0:
+        return labels
+    while True:
+        edge_min = np.minimum(labels[left], labels[right])
+        updated = labels.copy()
+        np.minimum.at(updated, left, edge_min)
+        np.minimum.at(updated, right, edge_min)
+        # Salto de punteros hasta la raíz actual
+        while True:
+            jumped = updated[updated]
+            if np.array_equal(jumped, updated):
+                break
+            updated = jumped
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+
+class NeighborIndex:
+    """
+    Índice IVF con vectores int8 persistido en `path`.
+
+    Los `ids` son enteros del llamador (p. ej. fila del dataset) y las `keys`
+    el hash del texto (`EmbeddingEngine.text_key`): `add` omite las keys que
+    ya están indexadas, así que reconstruir sobre un dataset que creció solo
+    agrega los comentarios nuevos.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.meta = json.loads((self.path / "meta.json").read_text(encoding="utf-8"))
+        self.dim = self.meta["dim"]
+        self.centroids = np.load(self.path / "centroids.npy")
+        self._load()
+
+    @classmethod
+    def create(cls, path, training_vectors, n_lists=None, iters=10, seed=0, **meta):
+        """
+        Entrena los centroides con `training_vectors` y crea un índice vacío.
+
+        `n_lists` por defecto es ~4 * sqrt(n) (ni muy pocas listas ni listas casi vacías).
+        """
+        path = Path(path)
+        n_lists = n_lists or max(1, int(4 * np.sqrt(len(training_vectors))))
+        centroids = train_centroids(training_vectors, n_lists, iters, seed)
+        path.mkdir(parents=True, exist_ok=True)
+        for name in _COLUMNS:
+            (path / f"{name}.bin").write_bytes(b"")
+        np.save(path / "centroids.npy", centroids)
+        meta = {**meta, "dim": int(centroids.shape[1]), "n_lists": int(len(centroids)), "n": 0}
+        _write_json(path / "meta.json", meta)
+        return cls(path)
+
+    def _load(self):
+        n = self.meta["n"]
+        arrays = {}
+        for name, (dtype, width) in _COLUMNS.items():
+            width = self.dim if width is None else width
+            arrays[name] = np.fromfile(self.path / f"{name}.bin", dtype=dtype, count=n * width)
+        self.codes = arrays["codes"].reshape(n, self.dim)
+        self.scales = arrays["scales"]
+        self.lists = arrays["lists"]
+        self.ids = arrays["ids"]
+        self.keys = arrays["keys"]
+        self._key_rows = None
+        self._build_lists()
+
+    def _build_lists(self):
+        self._order = np.argsort(self.lists, kind="stable")
+        self._offsets = np.concatenate([[0], np.cumsum(np.bincount(self.lists, minlength=len(self.centroids)))])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def key_rows(self):
+        """Diccionario key -> posición en el índice (se arma una vez)."""
+        if self._key_rows is None:
+            self._key_rows = {key: row for row, key in enumerate(self.keys.tolist())}
+        return self._key_rows
+
+    def add(self, vectors, ids, keys=None):
+        """
+        Agrega vectores (se omiten keys ya indexadas o repetidas en el lote).
+
+        Retorna la cantidad de vectores agregados.
+        """
+        vectors = normalize(vectors)
+        ids = np.asarray(ids, dtype=np.int64)
+        keys = np.asarray(keys if keys is not None else [b""] * len(ids), dtype="S20")
+        if keys.any():
+            known = self.key_rows()
+            seen = set()
+            fresh = []
+            for i, key in enumerate(keys.tolist()):
+                if key not in known and key not in seen:
+                    seen.add(key)
+                    fresh.append(i)
+            fresh = np.asarray(fresh, dtype=np.int64)
+            vectors, ids, keys = vectors[fresh], ids[fresh], keys[fresh]
+        if len(ids) == 0:
+            return 0
+
+        codes, scales = quantize(vectors)
+        lists = (vectors @ self.centroids.T).argmax(axis=1).astype(np.int32)
+        n = self.meta["n"]
+        new = {"codes": codes, "scales": scales, "lists": lists, "ids": ids, "keys": keys}
+        for name, values in new.items():
+            dtype, width = _COLUMNS[name]
+            with open(self.path / f"{name}.bin", "r+b") as f:
+                # Descarta bytes de una escritura anterior no confirmada en meta.json
+                f.truncate(n * np.dtype(dtype).itemsize * (self.dim if width is None else width))
+                f.seek(0, os.SEEK_END)
+                f.write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+        self.meta["n"] = n + len(ids)
+        _write_json(self.path / "meta.json", self.meta)
+
+        self.codes = np.concatenate([self.codes, codes])
+        self.scales = np.concatenate([self.scales, scales])
+        self.lists = np.concatenate([self.lists, lists])
+        self.ids = np.concatenate([self.ids, ids])
+        self.keys = np.concatenate([self.keys, keys])
+        if self._key_rows is not None:
+            self._key_rows.update((key, n + i) for i, key in enumerate(keys.tolist()) if key)
+        self._build_lists()
+        return len(ids)
+
+    def _probe(self, queries, nprobe):
+        nprobe = min(nprobe, len(self.centroids))
+        scores = queries @ self.centroids.T
+        return np.argpartition(-scores, nprobe - 1, axis=1)[:, :nprobe]
+
+    def search(self, queries, k=10, nprobe=8):
+        """
+        Top-k por similitud coseno aproximada.
+
+        Retorna (similitudes (m, k), posiciones en el índice (m, k)); -1 si hay
+        menos de k candidatos en las listas recorridas. `self.ids[pos]` da los ids.
+        """
+        queries = normalize(np.atleast_2d(queries))
+        m = len(queries)
+        best_sims = np.full((m, k), -np.inf, dtype=np.float32)
+        best_rows = np.full((m, k), -1, dtype=np.int64)
+        if len(self) == 0 or m == 0:
+            return best_sims, best_rows
+
+        probes = self._probe(queries, nprobe)
+        # Bloques por lista: cada lista se descuantiza una vez y se compara con
+        # todas las consultas que la recorren
+        probe_queries = np.repeat(np.arange(m), probes.shape[1])
+        probe_lists = probes.ravel()
+        by_list = np.argsort(probe_lists, kind="stable")
+        probe_queries, probe_lists = probe_queries[by_list], probe_lists[by_list]
+        bounds = np.flatnonzero(np.diff(probe_lists)) + 1
+        for group in np.split(np.arange(len(probe_lists)), bounds):
+            lst = probe_lists[group[0]]
+            rows = self._order[self._offsets[lst]:self._offsets[lst + 1]]
+            if len(rows) == 0:
+                continue
+            q = probe_queries[group]
+            block = (queries[q] @ self.codes[rows].T.astype(np.float32)) * self.scales[rows]
+            take = min(k, len(rows))
+            top = np.argpartition(-block, take - 1, axis=1)[:, :take]
+            sims = np.concatenate([best_sims[q], np.take_along_axis(block, top, axis=1)], axis=1)
+            cand = np.concatenate([best_rows[q], rows[top]], axis=1)
+            keep = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+            best_sims[q] = np.take_along_axis(sims, keep, axis=1)
+            best_rows[q] = np.take_along_axis(cand, keep, axis=1)
+
+        order = np.argsort(-best_sims, axis=1, kind="stable")
+        return np.take_along_axis(best_sims, order, axis=1), np.take_along_axis(best_rows, order, axis=1)
+
+    def vectors(self, rows=None):
+        """Vectores descuantizados (float32) de las posiciones `rows` (todas por defecto)."""
+        rows = np.arange(len(self)) if rows is None else np.asarray(rows)
+        return self.codes[rows].astype(np.float32) * self.scales[rows, None]
+
+    def cluster(self, threshold=0.95, k=20, nprobe=4, batch_size=4096):
+        """
+        Grupos de casi-duplicados: componentes conexas del grafo de vecinos
+        (entre los k más cercanos) con similitud >= `threshold`.
+
+        Retorna un array (n,) con la posición del representante de cada vector
+        (el de menor posición del grupo; un vector sin duplicados es su propio representante).
+        """
+        left, right = [], []
+        for start in range(0, len(self), batch_size):
+            rows = np.arange(start, min(start + batch_size, len(self)))
+            sims, neighbors = self.search(self.vectors(rows), k, nprobe)
+            hit = (sims >= threshold) & (neighbors >= 0) & (neighbors != rows[:, None])
+            left.append(np.repeat(rows, hit.sum(axis=1)))
+            right.append(neighbors[hit])
+        left = np.concatenate(left) if left else np.empty(0, dtype=np.int64)
+        right = np.concatenate(right) if right else np.empty(0, dtype=np.int64)
+        return connected_components(len(self), left, right)
+
+
+def _write_json(path, data):
+    tmp = path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _embedding_engine(meta):
+    from review_analyzer.dataset import get_embedding_engine
+
+    return get_embedding_engine(meta["model_name"], meta["pooling"], meta["max_length"])
+
+
+def build_index(data_path=FINAL_PROCESSED_DATA_PATH, index_dir=SIMILARITY_INDEX_DIR, text_col="text",
+                embeddings_path=BERT_EMBEDDINGS, model_name="bert-base-multilingual-cased", pooling="cls",
+                max_length=512, n_lists=None):
+    """
+    Crea o actualiza el índice con los textos de `data_path` (id = fila del archivo).
+
+    Los embeddings salen de `EmbeddingEngine.embed_to_file`, que reutiliza los ya
+    calculados en `embeddings_path`; solo se indexan los textos que no estaban.
+    """
+    import pandas as pd
+
+    texts = pd.read_csv(data_path, usecols=[text_col])[text_col].fillna("").astype(str)
+    valid = np.flatnonzero((texts.str.strip() != "").to_numpy())
+    texts = texts.tolist()
+
+    meta = {"model_name": model_name, "pooling": pooling, "max_length": max_length,
+            "source": str(data_path), "text_col": text_col}
+    engine = _embedding_engine(meta)
+    embeddings = engine.embed_to_file(texts, embeddings_path)
+    keys = np.array([engine.text_key(texts[i]) for i in valid], dtype="S20")
+
+    index_dir = Path(index_dir)
+    if (index_dir / "meta.json").exists():
+        index = NeighborIndex(index_dir)
+        changed = [k for k in ("model_name", "pooling", "max_length") if index.meta[k] != meta[k]]
+        if changed:
+            raise ValueError(f"{index_dir} usa otra configuración de embeddings ({', '.join(changed)}).")
+    else:
+        index = NeighborIndex.create(index_dir, embeddings[valid], n_lists, **meta)
+
+    added = 0
+    for start in range(0, len(valid), 50_000):
+        rows = valid[start:start + 50_000]
+        added += index.add(embeddings[rows], rows, keys[start:start + len(rows)])
+    print(f"Índice: {len(index):,} vectores ({added:,} nuevos), {index.meta['n_lists']} listas")
+    return index
+
+
+class NearDuplicateReuse:
+    """
+    Reutiliza clasificaciones ya calculadas para textos nuevos casi idénticos a
+    uno indexado.
+
+    - Duplicados exactos (misma key) se resuelven sin calcular embeddings.
+    - Con `near=True`, el resto se embebe y se busca su vecino más cercano; si
+      la similitud es >= `threshold`, se copian las probabilidades de ese vecino.
+
+    La búsqueda de casi-duplicados es opcional porque cuesta una pasada del
+    modelo de embeddings por cada texto sin duplicado exacto, encuentre vecino o
+    no. Solo compensa si la fracción de esos textos que se resuelve supera
+    costo(embedding) / costo(clasificación): con bert-base-multilingual y un
+    clasificador BERT-base a la misma longitud ambos costos son parecidos, así que
+    el punto de equilibrio está cerca del 100%. Conviene con un embedder mucho
+    más barato que el clasificador (p. ej. menor max_length, o `--long-text` en
+    el clasificador) y una tasa de casi-duplicados medida sobre una muestra.
+
+    `run_dir` es la corrida de `modeling.predict` sobre el mismo archivo que se
+    indexó (los ids del índice son filas de esa corrida). Antes de puntuar,
+    `check` rechaza la reutilización si esa corrida usó otro modelo, otras
+    etiquetas u otra configuración de puntuación.
+    """
+
+    # Claves de meta.json que determinan las probabilidades guardadas
+    SCORING_KEYS = ("model", "labels", "max_length", "long_text")
+
+    def __init__(self, index_dir, run_dir, threshold=0.97, nprobe=8, near=False):
+        from review_analyzer.modeling.predict import PredictionRun
+
+        self.index = NeighborIndex(index_dir)
+        run = PredictionRun(run_dir)
+        if run.meta is None or run.meta["source"] != self.index.meta["source"]:
+            raise ValueError(f"{run_dir} no es una corrida sobre {self.index.meta['source']}.")
+        if len(run.meta["done_chunks"]) < -(-run.meta["n_rows"] // run.meta["chunk_size"]):
+            raise ValueError(f"La corrida {run_dir} no está terminada.")
+        if len(self.index.ids) and int(self.index.ids.max()) >= run.meta["n_rows"]:
+            raise ValueError(f"El índice tiene filas que no existen en la corrida {run_dir} "
+                             f"({int(self.index.ids.max()) + 1} > {run.meta['n_rows']}).")
+        self.run_dir = run_dir
+        self.scoring = {key: run.meta.get(key) for key in self.SCORING_KEYS}
+        self.probs = np.load(run.probs_path, mmap_mode="r")
+        self.threshold = threshold
+        self.nprobe = nprobe
+        meta = self.index.meta
+        self.key_config = (meta["model_name"], meta["pooling"], meta["max_length"])
+        # El modelo de embeddings solo se carga si se buscan casi-duplicados
+        self.engine = _embedding_engine(meta) if near else None
+
+    def check(self, signature):
+        """ValueError si la corrida indexada no se puntuó como `signature` (firma de `modeling.predict`)."""
+        changed = [key for key in self.SCORING_KEYS if self.scoring[key] != signature.get(key)]
+        if changed:
+            raise ValueError(f"No se pueden reutilizar resultados de {self.run_dir}: "
+                             f"otra configuración ({', '.join(changed)}).")
+
+    def __call__(self, texts):
+        """Retorna (máscara de textos resueltos, probabilidades float32 de esos textos)."""
+        from review_analyzer.dataset import embedding_key
+
+        texts = list(texts)
+        rows = np.full(len(texts), -1, dtype=np.int64)
+        known = self.index.key_rows()
+        for i, text in enumerate(texts):
+            rows[i] = known.get(embedding_key(text, *self.key_config), -1)
+
+        pending = np.flatnonzero(rows < 0)
+        if self.engine is not None and len(pending):
+            sims, neighbors = self.index.search(self.engine.embed([texts[i] for i in pending]), 1, self.nprobe)
+            close = sims[:, 0] >= self.threshold
+            rows[pending[close]] = neighbors[close, 0]
+
+        found = rows >= 0
+        return found, np.asarray(self.probs[self.index.ids[rows[found]]], dtype=np.float32)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Índice de casi-duplicados sobre embeddings de comentarios")
+    parser.add_argument("--index-dir", default=str(SIMILARITY_INDEX_DIR))
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build_cmd = sub.add_parser("build", help="Crea o actualiza el índice con los textos de un archivo")
+    build_cmd.add_argument("--data", default=str(FINAL_PROCESSED_DATA_PATH))
+    build_cmd.add_argument("--text-col", default="text")
+    build_cmd.add_argument("--embeddings", default=str(BERT_EMBEDDINGS))
+    build_cmd.add_argument("--model", default="bert-base-multilingual-cased")
+    build_cmd.add_argument("--pooling", default="cls", choices=("cls", "mean"))
+    build_cmd.add_argument("--max-length", type=int, default=512)
+    build_cmd.add_argument("--n-lists", type=int, default=None)
+
+    similar_cmd = sub.add_parser("similar", help="Comentarios más parecidos a un texto")
+    similar_cmd.add_argument("text")
+    similar_cmd.add_argument("--k", type=int, default=10)
+    similar_cmd.add_argument("--nprobe", type=int, default=8)
+
+    cluster_cmd = sub.add_parser("cluster", help="Agrupa casi-duplicados y guarda clusters.npy en el índice")
+    cluster_cmd.add_argument("--threshold", type=float, default=0.95)
+    cluster_cmd.add_argument("--k", type=int, default=20)
+    cluster_cmd.add_argument("--nprobe", type=int, default=4)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        build_index(args.data, args.index_dir, args.text_col, args.embeddings, args.model, args.pooling,
+                    args.max_length, args.n_lists)
+        return 0
+
+    import pandas as pd
+
+    index = NeighborIndex(args.index_dir)
+    texts = pd.read_csv(index.meta["source"], usecols=[index.meta["text_col"]])[index.meta["text_col"]]
+
+    if args.command == "similar":
+        query = _embedding_engine(index.meta).embed([args.text])
+        sims, rows = index.search(query, args.k, args.nprobe)
+        for sim, row in zip(sims[0], rows[0]):
+            if row >= 0:
+                print(f"{sim:.3f}  [{index.ids[row]}] {texts.iloc[index.ids[row]]}")
+        return 0
+
+    representatives = index.cluster(args.threshold, args.k, args.nprobe)
+    # Representante expresado como fila del dataset; -1 para filas no indexadas
+    clusters = np.full(len(texts), -1, dtype=np.int64)
+    clusters[index.ids] = index.ids[representatives]
+    np.save(index.path / "clusters.npy", clusters)
+
+    sizes = np.bincount(representatives, minlength=len(index))
+    sizes = sizes[sizes > 0]
+    print(f"{len(index):,} comentarios en {len(sizes):,} grupos; "
+          f"{int((sizes > 1).sum()):,} grupos con duplicados ({int(sizes[sizes > 1].sum()):,} comentarios)")
+    for rep in np.argsort(-np.bincount(representatives))[:5]:
+        count = int((representatives == rep).sum())
+        if count > 1:
+            print(f"  x{count}: {texts.iloc[index.ids[rep]][:100]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
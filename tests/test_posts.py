@@ -0,0 +1,39 @@
+import asyncio
+
+import numpy as np
+
+from api.posts import PostStore, Rescorer
+
+
+def test_rescorer_keeps_running_after_a_failed_batch(tmp_path):
+    store = PostStore(str(tmp_path / "posts.sqlite"), "rev-1", ["joy", "anger"], ["alegría", "enojo"])
+    store.add_comments("post-1", [("c1", "me encanta"), ("c2", "qué rabia")])
+    calls = []
+
+    async def classify(texts):
+        calls.append(list(texts))
+        if len(calls) == 1:
+            raise RuntimeError("modelo no disponible")
+        probs = np.full((len(texts), 2), 0.9, dtype=np.float32)
+        return probs, probs > 0.5
+
+    async def scenario():
+        rescorer = Rescorer(store, classify, texts_per_second=1000, idle_seconds=0.01, retry_seconds=0.01)
+        task = asyncio.create_task(rescorer.run())
+        try:
+            for _ in range(500):
+                if rescorer.rescored:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        return rescorer
+
+    rescorer = asyncio.run(scenario())
+
+    assert len(calls) >= 2
+    assert rescorer.errors == 1
+    assert rescorer.rescored == 2
+    assert store.pending() == []
+    assert not rescorer.running